@@ -0,0 +1,143 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+import psutil
+import torch
+from loguru import logger
+
+from config import ADMISSION_TTS_BASE_MB, ADMISSION_TTS_MB_PER_CHAR, ADMISSION_STT_BASE_MB, ADMISSION_STT_MB_PER_SEC
+from config import ADMISSION_WAIT_SEC, ADMISSION_PRESSURE_FRACTION, ADMISSION_CPU_BUDGET_MB, CUDA_MEMORY_FRACTION
+from metrics import ADMISSION_DECISIONS
+
+MB = 1024 * 1024
+_POLL_SEC = 0.1
+
+
+class AdmissionRejected(RuntimeError):
+    """A job could not get the memory it needs within the admission wait."""
+
+
+def is_out_of_memory(error: BaseException) -> bool:
+    if isinstance(error, (torch.cuda.OutOfMemoryError, MemoryError)):
+        return True
+    # CTranslate2 reports allocator failures as a plain RuntimeError.
+    return isinstance(error, RuntimeError) and "out of memory" in str(error).lower()
+
+
+class AdmissionController:
+    """
+    Memory admission for model jobs.
+
+    Each job reserves an estimate of its footprint (from text length or audio
+    duration) before it runs. A job is admitted when the larger of measured
+    usage (CUDA allocated bytes, or process RSS on CPU) and idle baseline plus
+    outstanding reservations leaves room for its estimate; otherwise it waits
+    up to ``wait_sec`` for running jobs to finish and is then rejected. The
+    CUDA cache is only emptied when reserved memory crosses the pressure
+    threshold, not after every job.
+    """
+
+    def __init__(self, device: str, wait_sec: float = ADMISSION_WAIT_SEC, pressure_fraction: float = ADMISSION_PRESSURE_FRACTION):
+        self.device = device
+        self.wait_sec = wait_sec
+        self.pressure_fraction = pressure_fraction
+        self._cond = threading.Condition()
+        self._reserved = 0
+        self._baseline = 0
+        self._process = psutil.Process()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.cache_flushes = 0
+        if device == "cuda":
+            self._cuda_budget = int(torch.cuda.get_device_properties(0).total_memory * CUDA_MEMORY_FRACTION)
+        self.calibrate()
+
+    def usage(self) -> int:
+        if self.device == "cuda":
+            return torch.cuda.memory_allocated()
+        return self._process.memory_info().rss
+
+    def budget(self) -> int:
+        if self.device == "cuda":
+            return self._cuda_budget
+        if ADMISSION_CPU_BUDGET_MB:
+            return int(ADMISSION_CPU_BUDGET_MB * MB)
+        # Whatever the process holds now plus what the host can still give it.
+        return self._process.memory_info().rss + psutil.virtual_memory().available
+
+    def calibrate(self):
+        """Record the idle footprint (model weights); call after an engine loads."""
+        with self._cond:
+            self._baseline = max(0, self.usage() - self._reserved)
+
+    @staticmethod
+    def estimate(op: str, amount: float) -> int:
+        """Bytes a job is expected to need: ``amount`` is characters for tts, audio seconds for stt."""
+        if op == "tts":
+            return int((ADMISSION_TTS_BASE_MB + ADMISSION_TTS_MB_PER_CHAR * amount) * MB)
+        return int((ADMISSION_STT_BASE_MB + ADMISSION_STT_MB_PER_SEC * amount) * MB)
+
+    def fits_at_all(self, estimate: int) -> bool:
+        return self._baseline + estimate <= self.budget()
+
+    def _fits(self, estimate: int) -> bool:
+        committed = max(self.usage(), self._baseline + self._reserved)
+        return committed + estimate <= self.budget()
+
+    @contextmanager
+    def admit(self, op: str, estimate: int):
+        deadline = time.time() + self.wait_sec
+        with self._cond:
+            if not self.fits_at_all(estimate):
+                self.rejected += 1
+                ADMISSION_DECISIONS.labels(op, "rejected").inc()
+                raise AdmissionRejected(f"{op} job needs ~{estimate // MB} MB, more than the {self.budget() // MB} MB budget")
+            if not self._fits(estimate):
+                self.queued += 1
+                ADMISSION_DECISIONS.labels(op, "queued").inc()
+                self.relieve_pressure()
+                # Usage also drops without a release (other lanes, allocator), so poll.
+                while not self._fits(estimate):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.rejected += 1
+                        ADMISSION_DECISIONS.labels(op, "rejected").inc()
+                        raise AdmissionRejected(f"No memory headroom for {op} job after {self.wait_sec:.0f}s")
+                    self._cond.wait(min(remaining, _POLL_SEC))
+            self._reserved += estimate
+            self.admitted += 1
+            ADMISSION_DECISIONS.labels(op, "admitted").inc()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._reserved -= estimate
+                self._cond.notify_all()
+            self.relieve_pressure()
+
+    def relieve_pressure(self, force: bool = False) -> bool:
+        """Return cached CUDA blocks to the driver when reserved memory is near the budget."""
+        if self.device != "cuda":
+            return False
+        if not force and torch.cuda.memory_reserved() < self.pressure_fraction * self._cuda_budget:
+            return False
+        torch.cuda.empty_cache()
+        self.cache_flushes += 1
+        logger.debug(f"Emptied CUDA cache under memory pressure ({torch.cuda.memory_reserved() // MB} MB reserved)")
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "budget_mb": self.budget() // MB,
+                "usage_mb": self.usage() // MB,
+                "baseline_mb": self._baseline // MB,
+                "reserved_mb": self._reserved // MB,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected": self.rejected,
+                "cache_flushes": self.cache_flushes,
+            }
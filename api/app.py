@@ -1,31 +1,33 @@
-from flask import Flask, request, jsonify, Response, g
+from flask import Flask, request, jsonify, Response, g, stream_with_context
 from flask_cors import CORS
 from loguru import logger
 from gunicorn.app.base import BaseApplication
 from utility import validate_and_decode_base64_audio, cleanup_temp_file
 from requestID import reqID
 from voiceMap import VOICE_BASE64_MAP
-from server import run_audio_pipeline
+from server import run_audio_pipeline, prepare_audio_stream, store_stream_cache
 import multiprocessing as mp
-from multiprocessing.managers import BaseManager
+from model_client import service
+from metrics import HTTP_LATENCY, render as render_metrics, child_exit
+from rpc import RemoteError
+from deadlines import current_deadline, DeadlineExceeded
+from audio_cache import read_cached
+from prewarm import cache_key, record_request
 import traceback
 from wittyMessages import get_validation_error, get_witty_error
 import time
 import asyncio
 import os
 import traceback
-from config import WORKERS, THREADS
+from config import WORKERS, THREADS, STT_STREAM_READ_BYTES, HEALTH_CHECK_TIMEOUT_SEC, REQUEST_DEADLINE_SEC, COALESCE_ENABLED
+import json
 import wave
 import io
 import base64
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 app = Flask(__name__)
 CORS(app)
-class ModelManager(BaseManager): pass
-ModelManager.register("Service")
-manager = ModelManager(address=("localhost", 6000), authkey=b"secret")
-manager.connect()
-service = manager.Service()
 
 class GunicornApp(BaseApplication):
         def __init__(self, app, options=None):
@@ -46,11 +48,21 @@ class GunicornApp(BaseApplication):
 def before_request():
     g.request_id = reqID()
     g.start_time = time.time()
+    # Every model-server call made for this request carries the deadline;
+    # asyncio.run copies it into the pipeline coroutines.
+    current_deadline.set(g.start_time + REQUEST_DEADLINE_SEC)
+
+@app.teardown_request
+def teardown_request(exc):
+    # gthread workers reuse their threads, so the deadline must not outlive the request.
+    current_deadline.set(None)
 
 @app.after_request
 def after_request(response):
     process_time = time.time() - g.get('start_time', time.time())
     response.headers["X-Process-Time"] = str(process_time)
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    HTTP_LATENCY.labels(endpoint, request.method, str(response.status_code)).observe(process_time)
     return response
 
 @app.route("/", methods=["GET"])
@@ -71,6 +83,8 @@ def audio_endpoint():
             body = request.get_json(force=True)
             messages = body.get("messages", [])
             seed = body.get("seed", 42)
+            stream = bool(body.get("stream", False))
+            response_format = body.get("response_format", "wav")
             
             if not messages or not isinstance(messages, list):
                 return jsonify({"error": {"message": "Missing or invalid 'messages' in payload.", "code": 400}}), 400
@@ -101,7 +115,12 @@ def audio_endpoint():
             if not text or not isinstance(text, str) or not text.strip():
                 return jsonify({"error": {"message": "Missing required 'text' in user content.", "code": 400}}), 400
 
-            request_id = service.cacheName(f"{text}{system_instruction if system_instruction else ''}{system_voice}{str(seed) if seed else 42}")
+            if stream and response_format not in ("wav", "pcm"):
+                return jsonify({"error": {"message": "Invalid 'response_format' for streaming, expected 'wav' or 'pcm'.", "code": 400}}), 400
+
+            request_id = cache_key(text, system_instruction, system_voice, seed)
+            if not speech_audio_b64:
+                record_request(request_id, text, system_voice, system_instruction, seed)
             
             voice_path = None
             
@@ -149,31 +168,23 @@ def audio_endpoint():
                 except Exception as e:
                     return jsonify({"error": {"message": f"Invalid voice: {str(e)}", "code": 400}}), 400
             
-            # Generate cache key
-            generateHashValue = request_id
-            
             # Check cache
-            gen_audio_folder = os.path.join(os.path.dirname(__file__), "..", "genAudio")
-            cached_audio_path = os.path.join(gen_audio_folder, f"{generateHashValue}.wav")
-            cached_text_path = os.path.join(gen_audio_folder, f"{generateHashValue}.txt")
-            
-            if os.path.isfile(cached_audio_path) or os.path.isfile(cached_text_path):
-                if os.path.isfile(cached_text_path):
-                    with open(cached_text_path, "r") as f:
-                        cached_text = f.read()
-                    return jsonify({"text": cached_text, "request_id": request_id})
-                else:
-                    with open(cached_audio_path, "rb") as f:
-                        audio_data = f.read()
-                    return Response(
-                        audio_data,
-                        mimetype="audio/wav",
-                        headers={
-                            "Content-Disposition": f"inline; filename={request_id}.wav",
-                            "Content-Length": str(len(audio_data))
-                        }
-                    )
-            
+            cached = service.cache_lookup(request_id)
+            body = read_cached(cached) if cached is not None else None
+            if body is not None and cached["kind"] == "txt":
+                return jsonify({"text": body, "request_id": request_id})
+            elif body is not None:
+                return Response(
+                    body,
+                    mimetype="audio/wav",
+                    headers={
+                        "Content-Disposition": f"inline; filename={request_id}.wav",
+                        "Content-Length": str(len(body))
+                    }
+                )
+            elif cached is not None:
+                logger.info(f"[{request_id}] Cached response was evicted before it could be read")
+
             speech_audio_path = None
             if speech_audio_b64:
                 try:
@@ -194,13 +205,20 @@ def audio_endpoint():
                 except Exception as e:
                     return jsonify({"error": {"message": f"Invalid speech_audio: {e}", "code": 400}}), 400
             
-            result = asyncio.run(run_audio_pipeline(
+            if stream:
+                return stream_audio_response(request_id, text, voice_path, speech_audio_path, system_instruction, response_format)
+
+            # request_id does not cover the speech input, so it is hashed in.
+            coalesce_key = service.cacheName(f"{request_id}{speech_audio_b64}") if speech_audio_b64 else request_id
+            result = run_coalesced(coalesce_key, lambda: asyncio.run(run_audio_pipeline(
                 reqID=request_id,
                 text=text,
                 voice=voice_path,
                 synthesis_audio_path=speech_audio_path,
                 system_instruction=system_instruction,
-            ))
+            )))
+            if result is None:
+                return jsonify({"error": {"message": "No pipeline was executed for this request.", "code": 500}}), 500
             
             if result["type"] == "audio":
                 return Response(
@@ -243,13 +261,170 @@ def audio_endpoint():
                     ]
                 }), 500
 
+        except DeadlineExceeded as e:
+            logger.info(f"[{request_id}] {e}")
+            return jsonify({"error": {"message": "The request took too long and was dropped.", "code": 504}}), 504
         except Exception as e:
             logger.error(f"POST error: {traceback.format_exc()}")
             return jsonify({"error": {"message": str(e), "code": 500}}), 500
             
+def run_coalesced(key, run):
+    """
+    Run the pipeline once for every identical request in flight, across all
+    workers: the first caller runs it, duplicates wait for its result. A
+    duplicate whose leader failed runs the pipeline itself; one whose
+    deadline passes while waiting raises ``DeadlineExceeded``.
+    """
+    if not COALESCE_ENABLED:
+        return run()
+    deadline = current_deadline.get()
+    try:
+        joined = service.call_async("coalesce_join", key).result(timeout=None if deadline is None else max(0.0, deadline - time.time()))
+    except FutureTimeoutError:
+        logger.warning(f"[{key}] Deadline passed while waiting on an identical request")
+        raise DeadlineExceeded("Deadline passed while waiting on an identical request")
+    if joined["role"] == "follower":
+        if joined["result"] is not None:
+            logger.info(f"[{key}] Served from an identical in-flight request")
+            return joined["result"]
+        logger.info(f"[{key}] Identical in-flight request failed, running the pipeline")
+        return run()
+    shared = None
+    try:
+        result = run()
+        # Errors are not shared: the duplicates get a chance of their own.
+        if result is not None and result.get("type") in ("audio", "text"):
+            shared = {"type": result["type"], "data": result["data"]}
+        return result
+    finally:
+        service.call_async("coalesce_complete", key, shared)
+
+def stream_audio_response(request_id, text, voice_path, speech_audio_path, system_instruction, response_format):
+    from tts import stream_tts
+    content, clone_path = asyncio.run(prepare_audio_stream(
+        reqID=request_id,
+        text=text,
+        voice=voice_path,
+        synthesis_audio_path=speech_audio_path,
+        system_instruction=system_instruction,
+    ))
+
+    # request_id is a hash of the request body, so identical streams share
+    # it; cancellation needs an id of this one.
+    stream_request_id = f"{request_id}-{g.request_id}"
+
+    def generate():
+        # A stream may outlast the request deadline; a disconnect cancels it instead.
+        current_deadline.set(None)
+        try:
+            yield from stream_tts(
+                content,
+                clone_path,
+                stream_request_id,
+                response_format=response_format,
+                on_complete=store_stream_cache(request_id),
+            )
+        except GeneratorExit:
+            logger.info(f"[{request_id}] Client disconnected from audio stream")
+            service.call_async("cancel_request", stream_request_id)
+            raise
+        except Exception as e:
+            logger.error(f"[{request_id}] Audio stream failed: {e}")
+        finally:
+            cleanup_temp_file(f"/tmp/higgs/{request_id}")
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="audio/wav" if response_format == "wav" else "audio/pcm",
+        headers={
+            "Content-Disposition": f"inline; filename={request_id}.{response_format}",
+            "X-Sample-Rate": str(service.get_sample_rate()),
+        }
+    )
+
+@app.route("/stt/stream", methods=["POST"])
+def stt_stream_endpoint():
+    """
+    Live transcription: the body is raw 16-bit little-endian mono PCM sent
+    with chunked transfer encoding; the response is newline-delimited JSON
+    with partial and final events while the upload is still in progress.
+    """
+    try:
+        sample_rate = int(request.args.get("sample_rate", 16000))
+    except ValueError:
+        return jsonify({"error": {"message": "'sample_rate' must be an integer.", "code": 400}}), 400
+    if not 8000 <= sample_rate <= 48000:
+        return jsonify({"error": {"message": "'sample_rate' must be between 8000 and 48000.", "code": 400}}), 400
+
+    request_id = g.request_id
+    # Live sessions run as long as the upload does; a disconnect cancels them.
+    current_deadline.set(None)
+    session_id = service.stt_session_open(sample_rate=sample_rate, reqID=request_id)
+    upload = request.stream
+
+    def generate():
+        closed = False
+        try:
+            while True:
+                chunk = upload.read(STT_STREAM_READ_BYTES)
+                if not chunk:
+                    break
+                for event in service.stt_session_feed(session_id, chunk):
+                    yield json.dumps(event) + "\n"
+            result = service.stt_session_close(session_id)
+            closed = True
+            for event in result["events"]:
+                yield json.dumps(event) + "\n"
+            yield json.dumps({"type": "done", "text": result["text"]}) + "\n"
+        except GeneratorExit:
+            logger.info(f"[{request_id}] Client disconnected from transcription stream")
+            service.call_async("cancel_request", request_id)
+            raise
+        except Exception as e:
+            logger.error(f"[{request_id}] Transcription stream failed: {e}")
+            yield json.dumps({"type": "error", "message": str(e)}) + "\n"
+        finally:
+            if not closed:
+                try:
+                    service.stt_session_close(session_id)
+                except Exception:
+                    pass
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
 @app.route("/health", methods=["GET"])
 def health():
-    return jsonify({"status": "alive", "message": "Still breathing! 💨"}), 200
+    try:
+        readiness = service.call_async("get_readiness").result(timeout=HEALTH_CHECK_TIMEOUT_SEC)
+    except Exception as e:
+        logger.warning(f"Health check could not reach the model server: {e}")
+        return jsonify({"status": "unavailable", "ready": False, "message": "Model server unreachable"}), 503
+    if not readiness.get("ready"):
+        return jsonify({"status": "warming_up", "ready": False, "engines": readiness.get("engines"), "message": "Models are warming up"}), 503
+    return jsonify({
+        "status": "alive",
+        "ready": True,
+        "engines": readiness.get("engines"),
+        "startup": readiness.get("startup"),
+        "warmup": readiness.get("warmup"),
+        "message": "Still breathing! 💨",
+    }), 200
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    data, content_type = render_metrics()
+    return Response(data, mimetype=content_type)
+
+@app.errorhandler(RemoteError)
+def remote_error(e):
+    if e.type_name == "EngineLoadingError":
+        logger.info(f"Model engine still loading: {e.remote_message}")
+        return jsonify({"error": {"message": e.remote_message, "code": 503}}), 503, {"Retry-After": "5"}
+    if e.type_name == "DeadlineExceeded":
+        logger.info(f"Request ran out of time on the model server: {e.remote_message}")
+        return jsonify({"error": {"message": "The request took too long and was dropped.", "code": 504}}), 504
+    logger.error(f"Unhandled model server error: {e}")
+    return jsonify({"error": {"message": get_witty_error(), "code": 500}}), 500
 
 @app.errorhandler(400)
 def bad_request(e):
@@ -288,6 +463,7 @@ if __name__ == "__main__":
         "access_log_format": '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" %(D)s',
         "max_requests": 1000,
         "max_requests_jitter": 50,
+        "child_exit": child_exit,
     }
     try:
         gunicorn_app = GunicornApp(app, options)
@@ -0,0 +1,489 @@
+import hashlib
+import heapq
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from itertools import count
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, NamedTuple, Optional, Union
+
+import numpy as np
+import soundfile as sf
+from loguru import logger
+
+from config import AUDIO_CACHE_DIR, AUDIO_CACHE_INDEX_SAVE_EVERY, MAX_CACHE_SIZE_MB, MAX_CACHE_FILES
+from config import AUDIO_CACHE_HOT_MB, AUDIO_CACHE_DISK_FORMAT, AUDIO_CACHE_DEFAULT_COST_SEC
+from metrics import CACHE_ENTRIES, CACHE_HITS, CACHE_MISSES
+from shm_transport import open_shared_bytes
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+_INDEX_FILE = "index.json"
+_INDEX_VERSION = 2
+KINDS = ("wav", "txt")
+# File formats on disk: 16-bit FLAC or 16-bit WAV for audio, plain text.
+FORMATS = ("flac", "wav", "txt")
+
+
+class CacheEntry(NamedTuple):
+    kind: str
+    format: str
+    size: int
+    cost: float
+    priority: float
+
+
+def write_atomic(path: str, data: bytes):
+    """Write ``data`` to a temp file next to ``path`` and rename it into place."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def append_jsonl(path: str, record: dict, max_mb: float):
+    """
+    Append ``record`` as one line to a JSONL log (relative paths are under the
+    repo root), first rotating it to ``<path>.1`` once it exceeds ``max_mb``.
+    """
+    path = path if os.path.isabs(path) else os.path.join(ROOT, path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path) and os.path.getsize(path) > max_mb * 1024 * 1024:
+        os.replace(path, f"{path}.1")
+    # One O_APPEND write per line, so lines from several workers do not interleave.
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (json.dumps(record) + "\n").encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+def to_pcm16(data: Union[bytes, str]):
+    """Decode any WAV/FLAC input (bytes or path) to int16 samples and the sample rate."""
+    source = io.BytesIO(data) if isinstance(data, (bytes, bytearray, memoryview)) else data
+    samples, sample_rate = sf.read(source, dtype="float32", always_2d=False)
+    return (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2"), sample_rate
+
+
+def encode_pcm16(samples: np.ndarray, sample_rate: int, fmt: str) -> bytes:
+    buf = io.BytesIO()
+    sf.write(buf, samples, sample_rate, format=fmt.upper(), subtype="PCM_16")
+    return buf.getvalue()
+
+
+class HotTier:
+    """
+    Bounded LRU of response bytes in shared memory, one segment per entry.
+
+    API workers attach a segment by name and copy the response out, so a hot
+    hit costs no disk I/O and no RPC payload. Evicted segments are unlinked
+    at once; a worker that already attached keeps a valid mapping.
+    """
+
+    def __init__(self, max_bytes: int, name: str = "generated_audio_hot", prefix: str = "lixaudio_hot"):
+        self.max_bytes = max_bytes
+        self.name = name
+        self._prefix = f"{prefix}_{os.getpid()}_"
+        self._counter = count()
+        self._segments: "OrderedDict[str, SharedMemory]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._meta: Dict[str, dict] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            shm = self._segments.get(key)
+            if shm is None:
+                return None
+            self._segments.move_to_end(key)
+            return {"name": shm.name, "nbytes": self._sizes[key], **self._meta[key]}
+
+    def put(self, key: str, data: bytes, **meta) -> Optional[dict]:
+        """Copy ``data`` in; ``meta`` is returned with every handle to it."""
+        if len(data) > self.max_bytes:
+            return None
+        shm = SharedMemory(name=f"{self._prefix}{next(self._counter)}", create=True, size=max(1, len(data)))
+        shm.buf[:len(data)] = data
+        with self._lock:
+            self._discard(key)
+            while self._segments and self._bytes + len(data) > self.max_bytes:
+                self._discard(next(iter(self._segments)))
+            self._segments[key] = shm
+            self._sizes[key] = len(data)
+            self._meta[key] = meta
+            self._bytes += len(data)
+            CACHE_ENTRIES.labels(self.name).set(len(self._segments))
+        return {"name": shm.name, "nbytes": len(data), **meta}
+
+    def discard(self, key: str):
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key: str):
+        shm = self._segments.pop(key, None)
+        if shm is None:
+            return
+        self._bytes -= self._sizes.pop(key)
+        del self._meta[key]
+        shm.close()
+        shm.unlink()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {"entries": len(self._segments), "size_mb": round(self._bytes / 1024 / 1024, 2)}
+
+    def close(self):
+        with self._lock:
+            for key in list(self._segments):
+                self._discard(key)
+
+
+class AudioCache:
+    """
+    Generated responses (audio, or text for text-only replies) keyed by the
+    request cache name, in two tiers.
+
+    The hot tier keeps the ready-to-send 16-bit WAV of recently used entries
+    in shared memory. The disk tier keeps every entry under
+    ``root/<aa>/<bb>/<key>.<format>``, the shards taken from the SHA-1 of
+    the key; audio is stored as 16-bit FLAC (or WAV), written through a temp
+    file and a rename. A disk hit is decoded once and promoted to the hot
+    tier.
+
+    The disk tier is bounded by ``max_bytes`` and ``max_files`` and evicts by
+    GreedyDual-Size: an entry's priority is the clock plus its regeneration
+    cost (seconds the pipeline took) per byte, refreshed on every hit, and the
+    clock advances to the priority of each evicted entry. Cheap, large and
+    long-unused entries go first. The index is saved every ``save_every``
+    changes and on close, and startup only walks the directory tree when the
+    last shutdown was not clean.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        max_bytes: int,
+        max_files: int,
+        hot_bytes: int = AUDIO_CACHE_HOT_MB * 1024 * 1024,
+        disk_format: str = AUDIO_CACHE_DISK_FORMAT,
+        save_every: int = AUDIO_CACHE_INDEX_SAVE_EVERY,
+    ):
+        if disk_format not in ("flac", "wav"):
+            raise ValueError(f"Unknown cache disk format '{disk_format}'")
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.disk_format = disk_format
+        self.hot = HotTier(hot_bytes)
+        self._save_every = max(1, save_every)
+        self._entries: Dict[str, CacheEntry] = {}
+        self._heap: List[tuple] = []
+        self._sequence = count()
+        self._clock = 0.0
+        self._bytes = 0
+        self._changes = 0
+        self._lock = threading.RLock()
+        self.hot_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.inserts = 0
+        self.evictions = 0
+        self.input_bytes = 0
+        self.stored_bytes = 0
+        os.makedirs(root, exist_ok=True)
+        self._index_path = os.path.join(root, _INDEX_FILE)
+        if not self._load_index():
+            threading.Thread(target=self._reconcile, name="AudioCacheScan", daemon=True).start()
+
+    def path(self, key: str, fmt: str = "flac") -> str:
+        shard = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, shard[:2], shard[2:4], f"{key}.{fmt}")
+
+    def lookup(self, key: str) -> Optional[Dict[str, object]]:
+        """
+        ``{"kind", "shm"}`` for a hot hit, ``{"kind", "path"}`` for text,
+        ``{"kind", "data"}`` for audio too large for the hot tier, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._touch(key, entry)
+        if entry is None:
+            return self._miss()
+        if entry.kind == "txt":
+            path = self.path(key, entry.format)
+            if not os.path.exists(path):
+                return self._forget_missing(key)
+            self._hit("disk")
+            return {"kind": "txt", "path": path}
+        handle = self.hot.get(key)
+        if handle is not None:
+            self._hit("hot")
+            return {"kind": "wav", "shm": handle}
+        try:
+            wav = self._read_wav(key, entry)
+        except (FileNotFoundError, sf.LibsndfileError):
+            return self._forget_missing(key)
+        self._hit("disk")
+        handle = self.hot.put(key, wav)
+        return {"kind": "wav", "shm": handle} if handle is not None else {"kind": "wav", "data": wav}
+
+    def contains(self, key: str) -> bool:
+        """Whether ``key`` is cached, without counting a lookup or refreshing it."""
+        with self._lock:
+            return key in self._entries
+
+    def store(self, key: str, data: Union[bytes, str], kind: str = "wav", cost: Optional[float] = None) -> str:
+        """Cache ``data`` (WAV bytes, or text); ``cost`` is what producing it took, in seconds."""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown cache entry kind '{kind}'")
+        if kind == "txt":
+            fmt, wav = "txt", None
+            stored = data.encode("utf-8") if isinstance(data, str) else data
+        else:
+            samples, sample_rate = to_pcm16(data)
+            fmt = self.disk_format
+            wav = encode_pcm16(samples, sample_rate, "wav")
+            stored = wav if fmt == "wav" else encode_pcm16(samples, sample_rate, fmt)
+        path = self.path(key, fmt)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_atomic(path, stored)
+        cost = AUDIO_CACHE_DEFAULT_COST_SEC if cost is None else max(0.0, float(cost))
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous is not None and previous.format != fmt:
+                self._remove_file(key, previous.format)
+            self._account(key, kind, fmt, len(stored), cost)
+            self.inserts += 1
+            self.input_bytes += len(data)
+            self.stored_bytes += len(stored)
+            self._evict()
+            self._changed()
+        if wav is not None and key in self._entries:
+            self.hot.put(key, wav)
+        return path
+
+    def _read_wav(self, key: str, entry: CacheEntry) -> bytes:
+        path = self.path(key, entry.format)
+        if entry.format == "wav":
+            with open(path, "rb") as f:
+                return f.read()
+        samples, sample_rate = to_pcm16(path)
+        return encode_pcm16(samples, sample_rate, "wav")
+
+    def _hit(self, tier: str):
+        with self._lock:
+            if tier == "hot":
+                self.hot_hits += 1
+            else:
+                self.disk_hits += 1
+        CACHE_HITS.labels("generated_audio").inc()
+
+    def _miss(self):
+        with self._lock:
+            self.misses += 1
+        CACHE_MISSES.labels("generated_audio").inc()
+        return None
+
+    def _forget_missing(self, key: str):
+        # Removed behind our back.
+        with self._lock:
+            self._forget(key)
+        return self._miss()
+
+    def _priority(self, size: int, cost: float) -> float:
+        return self._clock + cost / max(1, size)
+
+    def _push(self, key: str, entry: CacheEntry):
+        heapq.heappush(self._heap, (entry.priority, next(self._sequence), key))
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            # Drop the superseded priorities left behind by hits.
+            self._heap = [(e.priority, next(self._sequence), k) for k, e in self._entries.items()]
+            heapq.heapify(self._heap)
+
+    def _touch(self, key: str, entry: CacheEntry):
+        entry = entry._replace(priority=self._priority(entry.size, entry.cost))
+        self._entries[key] = entry
+        self._push(key, entry)
+
+    def _account(self, key: str, kind: str, fmt: str, size: int, cost: float, priority: Optional[float] = None):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.size
+        entry = CacheEntry(kind, fmt, size, cost, self._priority(size, cost) if priority is None else priority)
+        self._entries[key] = entry
+        self._bytes += size
+        self._push(key, entry)
+
+    def _forget(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+            self.hot.discard(key)
+            self._changed()
+        return entry
+
+    def _evict(self):
+        while self._heap and (self._bytes > self.max_bytes or len(self._entries) > self.max_files):
+            priority, _, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is None or entry.priority != priority:
+                continue
+            self._clock = priority
+            del self._entries[key]
+            self._bytes -= entry.size
+            self.hot.discard(key)
+            self._remove_file(key, entry.format)
+            self.evictions += 1
+            logger.debug(f"Evicted cached response {key} ({entry.size / 1024:.0f} KB, cost {entry.cost:.1f}s)")
+
+    def _remove_file(self, key: str, fmt: str):
+        try:
+            os.remove(self.path(key, fmt))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove cached response {key}: {e}")
+
+    def _changed(self):
+        CACHE_ENTRIES.labels("generated_audio").set(len(self._entries))
+        self._changes += 1
+        if self._changes >= self._save_every:
+            self._save_index(clean=False)
+
+    def _save_index(self, clean: bool):
+        with self._lock:
+            entries: List[list] = [[key, *entry] for key, entry in self._entries.items()]
+            clock = self._clock
+            self._changes = 0
+        index = {"version": _INDEX_VERSION, "clean": clean, "saved_at": time.time(), "clock": clock, "entries": entries}
+        try:
+            write_atomic(self._index_path, json.dumps(index, separators=(",", ":")).encode("utf-8"))
+        except OSError as e:
+            logger.warning(f"Failed to save the audio cache index: {e}")
+
+    def _load_index(self) -> bool:
+        """Load the saved index; False when the tree has to be scanned to be trusted."""
+        try:
+            with open(self._index_path, "rb") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable audio cache index: {e}")
+            return False
+        if index.get("version") != _INDEX_VERSION:
+            return False
+        with self._lock:
+            self._clock = index.get("clock", 0.0)
+            for key, kind, fmt, size, cost, priority in index.get("entries", []):
+                self._account(key, kind, fmt, size, cost, priority)
+            self._evict()
+        logger.info(f"Loaded audio cache index: {len(self._entries)} entries, {self._bytes / 1024 / 1024:.1f} MB")
+        # Mark it dirty until the next clean close.
+        self._save_index(clean=False)
+        return bool(index.get("clean"))
+
+    def _reconcile(self):
+        """Bring the index in line with the files on disk after a crash or on first start."""
+        start_time = time.time()
+        found: Dict[str, tuple] = {}
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                key, _, fmt = filename.rpartition(".")
+                if fmt not in FORMATS or not key:
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    size = os.stat(path).st_size
+                except OSError:
+                    continue
+                if path != self.path(key, fmt):
+                    # A flat genAudio/<key>.wav from before the sharded layout.
+                    os.makedirs(os.path.dirname(self.path(key, fmt)), exist_ok=True)
+                    os.replace(path, self.path(key, fmt))
+                found[key] = ("txt" if fmt == "txt" else "wav", fmt, size)
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if key not in found and not os.path.exists(self.path(key, entry.format)):
+                    self._forget(key)
+            for key, (kind, fmt, size) in found.items():
+                if key not in self._entries:
+                    self._account(key, kind, fmt, size, AUDIO_CACHE_DEFAULT_COST_SEC)
+            self._evict()
+        self._save_index(clean=False)
+        logger.info(f"Scanned audio cache in {time.time() - start_time:.2f}s: {len(found)} file(s)")
+
+    def close(self):
+        self._save_index(clean=True)
+        self.hot.close()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            hits = self.hot_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_mb": round(self._bytes / 1024 / 1024, 2),
+                "max_size_mb": round(self.max_bytes / 1024 / 1024, 2),
+                "max_files": self.max_files,
+                "disk_format": self.disk_format,
+                "hot": self.hot.stats(),
+                "hot_hits": self.hot_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "hot_hit_rate": round(self.hot_hits / lookups, 4) if lookups else 0.0,
+                "inserts": self.inserts,
+                "evictions": self.evictions,
+                "compression_ratio": round(self.input_bytes / self.stored_bytes, 2) if self.stored_bytes else None,
+            }
+
+
+def read_cached(result: Dict[str, object]) -> Optional[Union[bytes, str]]:
+    """
+    Response body for a ``lookup`` result, on the API side: text for text
+    entries, WAV bytes for audio. None if the entry was evicted in between.
+    """
+    try:
+        if "shm" in result:
+            shm, view = open_shared_bytes(result["shm"])
+            try:
+                return bytes(view)
+            finally:
+                view.release()
+                shm.close()
+        if "data" in result:
+            return result["data"]
+        with open(result["path"], "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+_cache: Optional[AudioCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_audio_cache() -> AudioCache:
+    """The process-wide cache, created on first use by the process that serves it."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            root = AUDIO_CACHE_DIR if os.path.isabs(AUDIO_CACHE_DIR) else os.path.join(ROOT, AUDIO_CACHE_DIR)
+            _cache = AudioCache(root, int(MAX_CACHE_SIZE_MB * 1024 * 1024), MAX_CACHE_FILES)
+        return _cache
+
+
+def close_audio_cache():
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
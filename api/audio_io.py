@@ -0,0 +1,130 @@
+import io
+import os
+import struct
+from typing import BinaryIO, Tuple, Union
+
+import numpy as np
+from pydub import AudioSegment
+import soxr
+
+TARGET_SAMPLE_RATE = 16000
+
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+_CHUNK = struct.Struct("<4sI")
+
+# Integer PCM is scaled the way pydub did it (divide by the array type's
+# max; 24-bit samples are widened to 32-bit first), so transcripts do not
+# shift with the decoder.
+_PCM_SCALES = {
+    8: 1.0 / 127,
+    16: 1.0 / 32767,
+    24: 256.0 / 2147483647,
+    32: 1.0 / 2147483647,
+}
+
+AudioSource = Union[str, os.PathLike, BinaryIO]
+
+
+class WavFormatError(ValueError):
+    """The input is not a RIFF/WAVE file this module can decode in-process."""
+
+
+def _read_source(source: AudioSource):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read()
+    if isinstance(source, io.BytesIO):
+        return source.getbuffer()
+    position = source.tell()
+    data = source.read()
+    source.seek(position)
+    return data
+
+
+def parse_wav(data) -> Tuple[np.ndarray, int]:
+    """
+    Decode a WAV buffer to float32 samples of shape (frames, channels) and
+    the sample rate. 16/32-bit PCM and float data are viewed in place and
+    converted in one vectorized pass; 8- and 24-bit PCM are widened first.
+    """
+    view = memoryview(data)
+    if len(view) < 12 or view[0:4] != b"RIFF" or view[8:12] != b"WAVE":
+        raise WavFormatError("Not a RIFF/WAVE file")
+
+    fmt = None
+    position = 12
+    while position + _CHUNK.size <= len(view):
+        chunk_id, size = _CHUNK.unpack_from(view, position)
+        body = position + _CHUNK.size
+        if chunk_id == b"fmt ":
+            audio_format, channels, sample_rate, _, block_align, bits = struct.unpack_from("<HHIIHH", view, body)
+            if audio_format == _WAVE_FORMAT_EXTENSIBLE and size >= 40:
+                (audio_format,) = struct.unpack_from("<H", view, body + 24)
+            fmt = (audio_format, channels, sample_rate, block_align, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise WavFormatError("data chunk before fmt chunk")
+            # Streamed WAVs carry 0xFFFFFFFF (or 0) as the data size.
+            end = len(view) if size in (0, 0xFFFFFFFF) else min(len(view), body + size)
+            return _decode_pcm(view[body:end], *fmt)
+        position = body + size + (size & 1)
+    raise WavFormatError("No data chunk")
+
+
+def _decode_pcm(payload: memoryview, audio_format: int, channels: int, sample_rate: int, block_align: int, bits: int) -> Tuple[np.ndarray, int]:
+    if channels < 1 or block_align != channels * bits // 8:
+        raise WavFormatError(f"Unsupported WAV layout ({channels} channels, {bits} bits)")
+    frames = len(payload) // block_align
+    payload = payload[:frames * block_align]
+
+    if audio_format == _WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+        samples = np.frombuffer(payload, dtype=f"<f{bits // 8}").astype(np.float32, copy=False)
+    elif audio_format == _WAVE_FORMAT_PCM and bits in (16, 32):
+        raw = np.frombuffer(payload, dtype=f"<i{bits // 8}")
+        samples = raw * np.float32(_PCM_SCALES[bits])
+    elif audio_format == _WAVE_FORMAT_PCM and bits == 8:
+        raw = np.frombuffer(payload, dtype=np.uint8)
+        samples = (raw.astype(np.float32) - 128.0) * np.float32(_PCM_SCALES[8])
+    elif audio_format == _WAVE_FORMAT_PCM and bits == 24:
+        raw = np.frombuffer(payload, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        widened = (raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)) << 8 >> 8
+        samples = widened * np.float32(_PCM_SCALES[24])
+    else:
+        raise WavFormatError(f"Unsupported WAV encoding (format {audio_format:#06x}, {bits} bits)")
+    return samples.reshape(frames, channels), sample_rate
+
+
+def to_mono_16k(samples: np.ndarray, sample_rate: int, target_rate: int = TARGET_SAMPLE_RATE) -> np.ndarray:
+    channels = samples.shape[1]
+    if channels == 1:
+        mono = samples[:, 0]
+    else:
+        # A matrix-vector product is much faster than mean(axis=1) on interleaved frames.
+        mono = samples @ np.full(channels, 1.0 / channels, dtype=np.float32)
+    if sample_rate != target_rate:
+        mono = soxr.resample(mono, sample_rate, target_rate)
+    return np.ascontiguousarray(mono, dtype=np.float32)
+
+
+def load_audio_ffmpeg(source: AudioSource) -> np.ndarray:
+    """Decode anything ffmpeg understands to 16 kHz mono float32 (the original pydub path)."""
+    audio = AudioSegment.from_file(source).set_channels(1).set_frame_rate(TARGET_SAMPLE_RATE)
+    samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+    samples /= np.iinfo(audio.array_type).max
+    return samples
+
+
+def load_audio(source: AudioSource) -> np.ndarray:
+    """Load audio (path or file object) as 16 kHz mono float32; WAV is decoded in-process."""
+    try:
+        samples, sample_rate = parse_wav(_read_source(source))
+    except WavFormatError:
+        if not isinstance(source, (str, os.PathLike)):
+            source.seek(0)
+        return load_audio_ffmpeg(source)
+    mono = to_mono_16k(samples, sample_rate)
+    # Float WAVs at 16 kHz come back as a view on the input; detach it so the
+    # caller's buffer can be closed.
+    return mono if mono.flags.owndata else mono.copy()
@@ -0,0 +1,173 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import partial
+from typing import Any, Callable, Hashable, List, Optional
+
+from loguru import logger
+
+from deadlines import current_deadline
+from metrics import ABANDONED_WORK
+
+
+class BatchItem:
+    __slots__ = ("payload", "key", "future", "enqueued_at", "deadline", "request_id")
+
+    def __init__(self, payload: Any, key: Hashable, request_id: Optional[str] = None):
+        self.payload = payload
+        self.key = key
+        self.future: Future = Future()
+        self.enqueued_at = time.time()
+        self.deadline = current_deadline.get()
+        self.request_id = request_id
+
+
+class MicroBatcher:
+    """
+    Collects submissions for a short window and hands them to ``run_batch``
+    grouped by bucket key.
+
+    A bucket is flushed when the window opened by its oldest item expires or
+    as soon as it reaches ``max_batch_size``. ``run_batch`` receives the list
+    of items of one bucket and must return one result per item, in order; a
+    returned ``Exception`` instance fails only that item's future.
+
+    Items carry the submitter's deadline; ``check_abandoned(deadline,
+    request_id)`` is consulted right before a batch runs and items nobody
+    waits for any more are failed instead of being passed on.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        run_batch: Callable[[List[BatchItem]], List[Any]],
+        bucket_key: Callable[[Any], Hashable],
+        window_ms: float,
+        max_batch_size: int,
+        dispatch: Optional[Callable[..., Any]] = None,
+        request_id: Optional[Callable[[Any], Optional[str]]] = None,
+        check_abandoned: Optional[Callable[[Optional[float], Optional[str]], Optional[BaseException]]] = None,
+    ):
+        self.name = name
+        self._request_id = request_id or (lambda payload: None)
+        self._check_abandoned = check_abandoned
+        self._run_batch = run_batch
+        self._bucket_key = bucket_key
+        self._window = window_ms / 1000.0
+        self._max_batch_size = max(1, int(max_batch_size))
+        self._dispatch = dispatch or (lambda fn, items: fn(items))
+        self._buckets: "OrderedDict[Hashable, List[BatchItem]]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.batches_run = 0
+        self.items_run = 0
+        self._thread = threading.Thread(target=self._loop, name=f"{name}Batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, payload: Any) -> Future:
+        item = BatchItem(payload, self._bucket_key(payload), self._request_id(payload))
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self.name} batcher is closed")
+            self._buckets.setdefault(item.key, []).append(item)
+            self._cond.notify()
+        return item.future
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return sum(len(items) for items in self._buckets.values())
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=5)
+
+    def _take_ready(self) -> List[List[BatchItem]]:
+        now = time.time()
+        ready = []
+        for key in list(self._buckets.keys()):
+            items = self._buckets[key]
+            if len(items) >= self._max_batch_size or now - items[0].enqueued_at >= self._window or self._closed:
+                while items:
+                    ready.append(items[:self._max_batch_size])
+                    del items[:self._max_batch_size]
+                del self._buckets[key]
+        return ready
+
+    def _next_deadline(self) -> Optional[float]:
+        if not self._buckets:
+            return None
+        return min(items[0].enqueued_at for items in self._buckets.values()) + self._window
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    ready = self._take_ready()
+                    if ready or (self._closed and not self._buckets):
+                        break
+                    deadline = self._next_deadline()
+                    timeout = None if deadline is None else max(0.0, deadline - time.time())
+                    self._cond.wait(timeout)
+            for batch in ready:
+                try:
+                    handle = self._dispatch(self._execute, batch)
+                except Exception as e:
+                    self._fail(batch, e)
+                    continue
+                if isinstance(handle, Future):
+                    # A dispatched job can be dropped without running (its
+                    # deadline passed in the lane queue); its items fail with it.
+                    handle.add_done_callback(partial(self._settle, batch))
+            if self._closed and not ready:
+                with self._cond:
+                    if not self._buckets:
+                        return
+
+    def _settle(self, batch: List[BatchItem], job: Future):
+        error = None if job.cancelled() else job.exception()
+        if error is not None:
+            self._fail(batch, error)
+
+    @staticmethod
+    def _fail(batch: List[BatchItem], error: BaseException):
+        for item in batch:
+            if not item.future.done():
+                item.future.set_exception(error)
+
+    def _abandon(self, item: BatchItem) -> bool:
+        error = self._check_abandoned(item.deadline, item.request_id)
+        if error is None:
+            return False
+        ABANDONED_WORK.labels(self.name.lower(), "queued", getattr(error, "reason", "abandoned")).inc()
+        logger.info(f"[{self.name}] Dropped queued item {item.request_id}: {error}")
+        item.future.set_exception(error)
+        return True
+
+    def _execute(self, batch: List[BatchItem]):
+        batch = [item for item in batch if item.future.set_running_or_notify_cancel()]
+        if self._check_abandoned is not None:
+            batch = [item for item in batch if not self._abandon(item)]
+        if not batch:
+            return
+        self.batches_run += 1
+        self.items_run += len(batch)
+        try:
+            results = self._run_batch(batch)
+        except Exception as e:
+            logger.error(f"[{self.name}] Batch of {len(batch)} failed: {e}")
+            self._fail(batch, e)
+            return
+        for item, result in zip(batch, results):
+            self._resolve(item, result)
+
+    @staticmethod
+    def _resolve(item: BatchItem, result: Any):
+        if item.future.done():
+            return
+        if isinstance(result, Exception):
+            item.future.set_exception(result)
+        else:
+            item.future.set_result(result)
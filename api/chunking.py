@@ -0,0 +1,100 @@
+import re
+from typing import List, Optional, Tuple
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])[\"')\]]*\s+")
+_CLAUSE_END = re.compile(r"(?<=[,;:—])\s+")
+_TAG_START = re.compile(r"\s+(?=\[[^\[\]]+\])")
+
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    if len(sentence) <= max_chars:
+        return [sentence]
+    parts = []
+    current = ""
+    for clause in _CLAUSE_END.split(sentence):
+        candidate = f"{current} {clause}".strip() if current else clause
+        if len(candidate) <= max_chars or not current:
+            current = candidate
+        else:
+            parts.append(current)
+            current = clause
+    if current:
+        parts.append(current)
+
+    # Clauses that are still too long are cut at the last space before the limit.
+    result = []
+    for part in parts:
+        while len(part) > max_chars:
+            cut = part.rfind(" ", 0, max_chars)
+            tag_open = part.rfind("[", 0, cut)
+            if tag_open > part.rfind("]", 0, cut):
+                cut = tag_open
+            if cut <= 0:
+                cut = max_chars
+            result.append(part[:cut].strip())
+            part = part[cut:].strip()
+        if part:
+            result.append(part)
+    return result
+
+
+def split_into_chunks(text: str, max_chars: int = 250, min_chars: int = 40, split_at_tags: bool = False) -> List[str]:
+    """
+    Split text into sentence-sized chunks for incremental synthesis.
+
+    Sentences longer than ``max_chars`` are split further at clause
+    punctuation, and chunks shorter than ``min_chars`` are merged into the
+    following one so the engine is not asked to render single words.
+    Paralinguistic tags such as ``[laugh]`` are never split apart; with
+    ``split_at_tags`` a tag also starts a new piece.
+    """
+    text = " ".join(text.split())
+    if not text:
+        return []
+
+    pieces = []
+    for sentence in _SENTENCE_END.split(text):
+        for part in _TAG_START.split(sentence) if split_at_tags else [sentence]:
+            part = part.strip()
+            if part:
+                pieces.extend(_split_long(part, max_chars))
+
+    chunks: List[str] = []
+    pending = ""
+    for piece in pieces:
+        pending = f"{pending} {piece}".strip() if pending else piece
+        if len(pending) >= min_chars:
+            chunks.append(pending)
+            pending = ""
+    if pending:
+        if chunks and len(chunks[-1]) + len(pending) + 1 <= max_chars:
+            chunks[-1] = f"{chunks[-1]} {pending}"
+        else:
+            chunks.append(pending)
+    return chunks
+
+
+def split_in_two(text: str) -> Optional[Tuple[str, str]]:
+    """
+    Split text into two halves of similar length at a sentence or tag
+    boundary, or at the space nearest the middle when there is none; None
+    for a single word.
+    """
+    text = " ".join(text.split())
+    pieces = split_into_chunks(text, max_chars=max(1, len(text)), min_chars=1, split_at_tags=True)
+    if len(pieces) >= 2:
+        running = 0
+        for index, piece in enumerate(pieces[:-1], 1):
+            running += len(piece) + 1
+            if running >= len(text) / 2:
+                break
+        return " ".join(pieces[:index]), " ".join(pieces[index:])
+    middle = len(text) // 2
+    spaces = [
+        position for position, char in enumerate(text)
+        if char == " " and text.rfind("[", 0, position) <= text.rfind("]", 0, position)
+    ]
+    if not spaces:
+        return None
+    cut = min(spaces, key=lambda position: abs(position - middle))
+    return text[:cut], text[cut + 1:]
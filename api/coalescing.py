@@ -0,0 +1,100 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from config import COALESCE_LEADER_TTL_SEC
+from metrics import COALESCED_REQUESTS
+
+
+class _Flight:
+    __slots__ = ("started_at", "followers")
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.followers: List[Future] = []
+
+
+class RequestCoalescer:
+    """
+    Single-flight table for identical requests, kept by the model server so
+    every API worker process shares it.
+
+    ``join(key)`` resolves at once to ``{"role": "leader"}`` for the first
+    caller, who does the work and hands the outcome to ``complete``. Callers
+    that join while the flight is open get a future that resolves to
+    ``{"role": "follower", "result": ...}`` when the leader completes; a
+    ``None`` result means the leader failed and the follower has to do the
+    work itself. A leader silent for longer than ``leader_ttl`` (its worker
+    died) is replaced by the next caller.
+    """
+
+    def __init__(self, leader_ttl: float):
+        self._leader_ttl = leader_ttl
+        self._flights: Dict[str, _Flight] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.fallbacks = 0
+
+    def join(self, key: str) -> Future:
+        future: Future = Future()
+        stale = None
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and time.time() - flight.started_at > self._leader_ttl:
+                stale, flight = self._flights.pop(key), None
+            if flight is None:
+                self._flights[key] = _Flight()
+                self.leaders += 1
+                leader = True
+            else:
+                flight.followers.append(future)
+                self.coalesced += 1
+                leader = False
+        if stale is not None:
+            logger.warning(f"[{key}] Leader of a coalesced request went silent, handing over")
+            self._resolve(stale, None)
+        if leader:
+            future.set_result({"role": "leader"})
+        return future
+
+    def complete(self, key: str, result: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            flight = self._flights.pop(key, None)
+        if flight is not None:
+            self._resolve(flight, result)
+
+    def _resolve(self, flight: _Flight, result: Optional[Dict[str, Any]]):
+        outcome = "served" if result is not None else "fallback"
+        if flight.followers:
+            COALESCED_REQUESTS.labels(outcome).inc(len(flight.followers))
+        if result is None:
+            with self._lock:
+                self.fallbacks += len(flight.followers)
+        for future in flight.followers:
+            future.set_result({"role": "follower", "result": result})
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "waiting": sum(len(flight.followers) for flight in self._flights.values()),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "fallbacks": self.fallbacks,
+            }
+
+
+_coalescer: Optional[RequestCoalescer] = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer() -> RequestCoalescer:
+    global _coalescer
+    with _coalescer_lock:
+        if _coalescer is None:
+            _coalescer = RequestCoalescer(COALESCE_LEADER_TTL_SEC)
+        return _coalescer
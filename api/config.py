@@ -4,7 +4,6 @@ TRIAL_MODE = False
 TEMP_SAVE_DIR = "/tmp/audio/"
 MAX_CACHE_SIZE_MB = 500 
 MAX_CACHE_FILES = 100    
-MAX_CONCURRENT_OPERATIONS = 5 
 WORKERS = 4
 THREADS = 8
 POLLINATIONS_ENDPOINT_TEXT = "https://gen.pollinations.ai/v1/chat/completions"
@@ -22,4 +21,157 @@ paralinguistics_tags = {
 STORE_CACHE = False
 POLLINATIONS_MODEL = "gemini-fast"
 TTS_MODEL = "ResembleAI/chatterbox-turbo"
-TRANSCRIBE_MODEL_SIZE = "small" #Systran/faster-whisper-small
\ No newline at end of file
+TRANSCRIBE_MODEL_SIZE = "small" #Systran/faster-whisper-small
+TTS_SAMPLING = {"top_p": 0.95, "temperature": 0.8, "top_k": 1000, "repetition_penalty": 1.2}
+SCHEDULER_AGING_RATE = 1.0
+SCHEDULER_PRIORITY_STEP_SEC = 30.0
+TTS_COST_PER_CHAR_SEC = 0.02
+STT_COST_PER_AUDIO_SEC = 0.1
+# Chatterbox keeps the speaker conditionals on the engine instance, so its lane stays serialized.
+TTS_LANE_WORKERS = 1
+TTS_LANE_MAX_CONCURRENT = 1
+TTS_LANE_SERIALIZE = True
+# CTranslate2 runs num_workers=STT_LANE_MAX_CONCURRENT transcriptions in parallel; 0 threads = library default.
+STT_LANE_WORKERS = 2
+STT_LANE_MAX_CONCURRENT = 2
+STT_LANE_SERIALIZE = False
+STT_CPU_THREADS = 0
+# STT jobs queued within the window are transcribed together: clips shorter
+# than STT_BATCH_MAX_CLIP_SEC share batched Whisper passes of STT_BATCH_SIZE
+# chunks, longer ones and lone clips take the serial path. Batched decoding
+# has no temperature fallback, so it stays off until
+# testing/bench_stt_batch.py --max-wer has passed on real clips.
+STT_BATCHING_ENABLED = False
+STT_BATCH_WINDOW_MS = 20
+STT_MAX_BATCH_REQUESTS = 8
+STT_BATCH_SIZE = 8
+STT_BATCH_MAX_CLIP_SEC = 30
+# Live transcription sessions: a segment is finalized after this much
+# trailing silence; partials are requested at most this often.
+STT_STREAM_ENDPOINT_MS = 600
+STT_STREAM_PARTIAL_INTERVAL_MS = 1000
+STT_STREAM_MAX_SEGMENT_SEC = 25
+STT_STREAM_SESSION_TTL_SEC = 120
+STT_STREAM_READ_BYTES = 6400
+VOICE_COND_CACHE_SIZE = 64
+STREAM_CHUNK_MAX_CHARS = 250
+STREAM_CHUNK_MIN_CHARS = 40
+# Long-form synthesis: replies of at least LONG_FORM_MIN_CHARS are split at
+# sentence and tag boundaries, rendered concurrently and stitched in order.
+LONG_FORM_ENABLED = True
+LONG_FORM_MIN_CHARS = 400
+LONG_FORM_CHUNK_MAX_CHARS = 250
+LONG_FORM_CHUNK_MIN_CHARS = 80
+LONG_FORM_MAX_INFLIGHT = 8
+LONG_FORM_CROSSFADE_MS = 20
+LONG_FORM_PAUSE_MS = 120
+STREAM_TTL_SEC = 300
+SHM_POOL_MAX_MB = 256
+SHM_LEASE_TTL_SEC = 120
+# Engine profile: "default", "cpu" (int8 dynamic quantization of the
+# Chatterbox linear layers, thread counts from the core count) or "auto"
+# (cpu on hosts without a GPU).
+ENGINE_PROFILE = "auto"
+ENGINE_QUANTIZE_COMPONENTS = ("t3", "s3gen")
+# Engines loaded in parallel at startup ("tts", "stt"); the others load on
+# first use. A call waits this long for a loading engine before it is answered
+# with EngineLoadingError.
+PRELOAD_ENGINES = ("tts", "stt")
+ENGINE_LOAD_WAIT_SEC = 0
+# Warmup set run after the RPC socket is up and before the server reports
+# ready: one synthesis per voice (None = every built-in voice) and one
+# transcription of a bundled clip.
+WARMUP_ENABLED = True
+WARMUP_VOICES = None
+WARMUP_TEXT = "Warming up the voice engine."
+WARMUP_STT_CLIP = "voices_b64/raw_wav/alloy.wav"
+HEALTH_CHECK_TIMEOUT_SEC = 2
+# Prometheus multiprocess directory shared by the API workers and the model
+# server; entrypoint.sh clears it on start.
+METRICS_MULTIPROC_DIR = "/tmp/lixaudio_metrics"
+METRICS_SAMPLE_INTERVAL_SEC = 5
+# Memory admission: per-job footprint estimates (from text length or audio
+# seconds), how long a job may wait for headroom, and the reserved fraction of
+# the CUDA budget above which the allocator cache is emptied. The CPU budget
+# defaults to current RSS plus the host's available memory.
+CUDA_MEMORY_FRACTION = 0.5
+ADMISSION_TTS_BASE_MB = 300
+ADMISSION_TTS_MB_PER_CHAR = 2.0
+ADMISSION_STT_BASE_MB = 200
+ADMISSION_STT_MB_PER_SEC = 2.0
+ADMISSION_WAIT_SEC = 30
+ADMISSION_PRESSURE_FRACTION = 0.85
+ADMISSION_CPU_BUDGET_MB = None
+ADMISSION_MAX_SPLIT_DEPTH = 3
+# Deadlines: every API request carries one (just under the gunicorn timeout)
+# down to the model server, which drops queued work past it and aborts
+# generation between decoding steps. Streams are bounded by disconnects
+# instead. Cancelled request ids are remembered this long.
+REQUEST_DEADLINE_SEC = 115
+CANCELLED_REQUEST_TTL_SEC = 300
+# Generated response cache (audio_cache.py), bounded by MAX_CACHE_SIZE_MB and
+# MAX_CACHE_FILES. A relative directory is taken from the repository root;
+# the index is saved after this many changes and on shutdown.
+AUDIO_CACHE_DIR = "genAudio"
+AUDIO_CACHE_INDEX_SAVE_EVERY = 50
+# Recently used audio is also kept, ready to send, in a shared-memory tier of
+# this size. On disk audio is stored as 16-bit "flac" or "wav"; entries are
+# evicted by regeneration cost per byte, and entries of unknown cost (found
+# by a directory scan) count as this many seconds.
+AUDIO_CACHE_HOT_MB = 64
+AUDIO_CACHE_DISK_FORMAT = "flac"
+AUDIO_CACHE_DEFAULT_COST_SEC = 5.0
+# Single flight: identical concurrent /generate requests (same cache name)
+# wait for the first one's result instead of running the pipeline again. A
+# leader that has not completed after this long is replaced.
+COALESCE_ENABLED = True
+COALESCE_LEADER_TTL_SEC = 130
+# Cache pre-warming (prewarm.py): /generate requests with a built-in voice and
+# no speech input are appended to the popularity log, which is rotated at
+# PREWARM_LOG_MAX_MB. After startup the PREWARM_TOP_N most requested entries of
+# the log and of the phrase files (JSONL of text, voice, system, seed) are
+# generated into the response cache at background priority, only after the
+# model server has had no other work for PREWARM_IDLE_SEC. An entry is
+# abandoned and retried later as soon as other work arrives. Pre-warming
+# stops once the cache reaches PREWARM_MAX_CACHE_FRACTION of its limits.
+PREWARM_ENABLED = True
+PREWARM_RECORD_REQUESTS = True
+PREWARM_POPULARITY_LOG = "logs/popularity.jsonl"
+PREWARM_LOG_MAX_MB = 50
+PREWARM_PHRASE_FILES = ()
+PREWARM_TOP_N = 200
+PREWARM_IDLE_SEC = 5
+PREWARM_POLL_SEC = 0.5
+PREWARM_MAX_CACHE_FRACTION = 0.8
+# Sentence cache (sentence_cache.py): non-streamed replies are rendered
+# sentence by sentence (pieces shorter than SENTENCE_CACHE_MIN_CHARS are
+# merged) and each rendered sentence is kept in shared memory, keyed by its
+# normalized text, the voice and the engine settings, so replies sharing a
+# sentence (a templated intro or sign-off) only synthesize the rest. Replies
+# under SENTENCE_CACHE_MIN_REPLY_CHARS are about one sentence: there is no
+# other sentence to share, an identical reply is already served whole by the
+# response cache, and splitting would only add stitching, so they are
+# rendered in one generation.
+SENTENCE_CACHE_ENABLED = True
+SENTENCE_CACHE_MAX_MB = 128
+SENTENCE_CACHE_MIN_CHARS = 20
+SENTENCE_CACHE_MIN_REPLY_CHARS = 60
+# Local router (router.py): /generate requests are routed by input modality
+# and cue scoring without the LLM round trip when the confidence reaches
+# ROUTER_MIN_CONFIDENCE; the rest go to the LLM router. Every decision is
+# appended to the audit log, which rotates to .1 past ROUTER_AUDIT_LOG_MAX_MB.
+ROUTER_LOCAL_ENABLED = True
+ROUTER_MIN_CONFIDENCE = 0.9
+ROUTER_AUDIT_LOG = "logs/router_audit.jsonl"
+ROUTER_AUDIT_LOG_MAX_MB = 64
+MODEL_SERVER_SOCKET = "/tmp/lixaudio_model_server.sock"
+MODEL_CLIENT_TIMEOUT_SEC = None
+RPC_SERVER_THREADS = 64
+RPC_JOB_RESULT_TTL_SEC = 120
+# Replica pool (replica_pool.py): each replica gets one GPU (round robin) and a
+# disjoint CPU core set; None splits the available cores evenly.
+MODEL_REPLICAS = 1
+MODEL_REPLICA_SOCKET_DIR = "/tmp/lixaudio_replicas"
+MODEL_REPLICA_CPU_CORES = None
+MODEL_REPLICA_LOAD_POLL_MS = 200
+MODEL_REPLICA_RESTART_DELAY_SEC = 5
@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Optional
+
+# Absolute wall-clock deadline (time.time()) of the request being served.
+# RPCClient attaches it to outgoing calls and RPCServer restores it around the
+# method it invokes, so it follows a request from the API worker through the
+# replica router to the lane job that does the work.
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+
+
+class RequestAbandoned(RuntimeError):
+    """The work was dropped because nobody is waiting for its result any more."""
+    reason = "abandoned"
+
+
+class DeadlineExceeded(RequestAbandoned):
+    reason = "deadline"
+
+
+class RequestCancelled(RequestAbandoned):
+    reason = "cancelled"
+
+
+def remaining(deadline: Optional[float]) -> Optional[float]:
+    return None if deadline is None else deadline - time.time()
+
+
+def latest(deadlines) -> Optional[float]:
+    """Deadline of a group of requests: the latest one, or None if any has none."""
+    deadlines = list(deadlines)
+    if not deadlines or any(deadline is None for deadline in deadlines):
+        return None
+    return max(deadlines)
+
+
+class CancellationRegistry:
+    """
+    Request ids whose client went away, remembered for ``ttl`` seconds. The
+    chunks of a long-form reply run as ``<id>-<n>`` and are cancelled with
+    their request.
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 4096):
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._cancelled: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cancel(self, request_id: str):
+        with self._lock:
+            self._cancelled[request_id] = time.time()
+            self._cancelled.move_to_end(request_id)
+            while len(self._cancelled) > self._max_entries:
+                self._cancelled.popitem(last=False)
+
+    def is_cancelled(self, request_id: Optional[str]) -> bool:
+        if request_id is None:
+            return False
+        with self._lock:
+            cutoff = time.time() - self._ttl
+            while self._cancelled and next(iter(self._cancelled.values())) < cutoff:
+                self._cancelled.popitem(last=False)
+            return request_id in self._cancelled or request_id.rsplit("-", 1)[0] in self._cancelled
+
+    def check(self, deadline: Optional[float], request_id: Optional[str]) -> Optional[RequestAbandoned]:
+        """The error to fail the work with, or None while someone still waits for it."""
+        if deadline is not None and time.time() >= deadline:
+            return DeadlineExceeded(f"Deadline passed {time.time() - deadline:.1f}s ago")
+        if self.is_cancelled(request_id):
+            return RequestCancelled(f"Request {request_id} was cancelled by its client")
+        return None
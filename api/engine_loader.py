@@ -0,0 +1,81 @@
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from loguru import logger
+
+
+class EngineLoadingError(RuntimeError):
+    """A call needed an engine that has not finished loading yet."""
+
+
+class LazyEngine:
+    """
+    One model engine, loaded on a background thread.
+
+    ``start()`` begins loading (it is a no-op once loading has begun, and
+    retries after a failed load), so engines started together load in
+    parallel. ``get()`` starts the load if needed and waits for it; with a
+    timeout it raises ``EngineLoadingError`` instead of waiting longer.
+    ``after_load`` runs on the loader thread once the engine is already
+    usable, for work such as cache warming that needs the engine itself.
+    """
+
+    def __init__(self, name: str, load: Callable[[], Any], after_load: Optional[Callable[[Any], None]] = None):
+        self.name = name
+        self._load = load
+        self._after_load = after_load
+        self._value = None
+        self._error: Optional[BaseException] = None
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.load_seconds: Optional[float] = None
+
+    def start(self) -> "LazyEngine":
+        with self._lock:
+            if self._thread is None or (self._error is not None and not self._thread.is_alive()):
+                self._error = None
+                self._loaded.clear()
+                self._thread = threading.Thread(target=self._run, name=f"Load-{self.name}", daemon=True)
+                self._thread.start()
+        return self
+
+    def _run(self):
+        start_time = time.time()
+        logger.info(f"[Startup] Loading {self.name} engine...")
+        try:
+            value = self._load()
+        except BaseException as e:
+            logger.error(f"[Startup] Failed to load {self.name} engine: {e}")
+            self._error = e
+            self._loaded.set()
+            return
+        self.load_seconds = time.time() - start_time
+        self._value = value
+        self._loaded.set()
+        logger.info(f"[Startup] {self.name} engine loaded in {self.load_seconds:.2f} seconds")
+        if self._after_load is not None:
+            try:
+                self._after_load(value)
+            except Exception as e:
+                logger.warning(f"[Startup] Post-load step for {self.name} engine failed: {e}")
+
+    def get(self, timeout: Optional[float] = None):
+        self.start()
+        if not self._loaded.wait(timeout):
+            raise EngineLoadingError(f"{self.name} engine is loading, retry shortly")
+        if self._error is not None:
+            raise RuntimeError(f"{self.name} engine failed to load: {self._error}")
+        return self._value
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait for an engine that has been started; True if it loaded successfully."""
+        return self._loaded.wait(timeout) and self._error is None
+
+    def status(self) -> str:
+        if self._thread is None:
+            return "not_loaded"
+        if not self._loaded.is_set():
+            return "loading"
+        return "failed" if self._error is not None else "ready"
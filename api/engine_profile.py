@@ -0,0 +1,115 @@
+import os
+from typing import Iterable, NamedTuple, Optional
+
+import torch
+from loguru import logger
+
+from config import ENGINE_PROFILE, ENGINE_QUANTIZE_COMPONENTS, STT_LANE_MAX_CONCURRENT
+
+PROFILES = ("default", "cpu")
+
+
+class ThreadPlan(NamedTuple):
+    torch_threads: int
+    torch_interop_threads: int
+    ct2_cpu_threads: int
+    ct2_num_workers: int
+
+
+def resolve_profile(name: str = ENGINE_PROFILE, device: str = None) -> str:
+    """"auto" picks the CPU profile on hosts without a GPU."""
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    if name == "auto":
+        return "cpu" if device == "cpu" else "default"
+    if name not in PROFILES:
+        raise ValueError(f"Unknown engine profile '{name}', expected one of {PROFILES} or 'auto'")
+    if name == "cpu" and device != "cpu":
+        # Dynamically quantized modules only have CPU kernels.
+        logger.warning(f"CPU engine profile requested on {device}, using the default profile")
+        return "default"
+    return name
+
+
+def plan_cpu_threads(cores: Optional[int] = None, stt_workers: int = STT_LANE_MAX_CONCURRENT) -> ThreadPlan:
+    """
+    Thread counts for the cores this process may run on (the replica's core
+    set when pinned). Synthesis is serialized on one lane, so torch gets every
+    core for intra-op work and a single inter-op thread; the CTranslate2
+    workers share half the cores so a transcription running next to a
+    synthesis does not oversubscribe the host.
+    """
+    if cores is None:
+        cores = len(os.sched_getaffinity(0))
+    workers = max(1, min(stt_workers, cores))
+    return ThreadPlan(
+        torch_threads=cores,
+        torch_interop_threads=1,
+        ct2_cpu_threads=max(1, cores // (2 * workers)),
+        ct2_num_workers=workers,
+    )
+
+
+def apply_engine_profile(profile: str) -> Optional[ThreadPlan]:
+    """Process-wide settings for the profile; call before the engines load."""
+    if profile != "cpu":
+        return None
+    plan = plan_cpu_threads()
+    torch.set_num_threads(plan.torch_threads)
+    try:
+        torch.set_num_interop_threads(plan.torch_interop_threads)
+    except RuntimeError:
+        # Only settable once per process; replica placement may have done it already.
+        pass
+    logger.info(f"CPU engine profile: {plan}")
+    return plan
+
+
+def _conv1d_to_linear(module: torch.nn.Module) -> torch.nn.Linear:
+    # transformers' GPT-2 Conv1D stores the weight as (in, out); dynamic
+    # quantization only recognizes nn.Linear.
+    linear = torch.nn.Linear(module.weight.shape[0], module.weight.shape[1], bias=module.bias is not None)
+    linear.weight.data = module.weight.data.t().contiguous()
+    if module.bias is not None:
+        linear.bias.data = module.bias.data
+    return linear
+
+
+def _linearize(module: torch.nn.Module) -> int:
+    replaced = 0
+    for name, child in module.named_children():
+        if type(child).__name__ == "Conv1D" and getattr(child, "weight", None) is not None and child.weight.dim() == 2:
+            setattr(module, name, _conv1d_to_linear(child))
+            replaced += 1
+        else:
+            replaced += _linearize(child)
+    return replaced
+
+
+def quantize_linear_layers(engine, components: Iterable[str] = ENGINE_QUANTIZE_COMPONENTS):
+    """Dynamic int8 quantization of the linear layers of the engine's torch submodules."""
+    for name in components:
+        module = getattr(engine, name, None)
+        if not isinstance(module, torch.nn.Module):
+            continue
+        converted = _linearize(module)
+        linears = sum(isinstance(child, torch.nn.Linear) for child in module.modules())
+        torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        logger.info(f"Quantized {linears} linear layers in '{name}' to int8 ({converted} converted from Conv1D)")
+    return engine
+
+
+def prepare_tts_engine(engine, profile: str):
+    if profile == "cpu":
+        quantize_linear_layers(engine)
+    return engine
+
+
+def whisper_threads(plan: Optional[ThreadPlan], cpu_threads: int = 0, placement_threads: Optional[int] = None) -> dict:
+    """
+    cpu_threads / num_workers for WhisperModel: an explicit thread count wins,
+    then the CPU profile's plan, then the replica's core count.
+    """
+    if plan is not None:
+        return dict(cpu_threads=cpu_threads or plan.ct2_cpu_threads, num_workers=plan.ct2_num_workers)
+    return dict(cpu_threads=cpu_threads or placement_threads or 0, num_workers=STT_LANE_MAX_CONCURRENT)
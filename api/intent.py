@@ -5,6 +5,7 @@ from dotenv import load_dotenv
 import os
 import asyncio
 from config import paralinguistics_tags, POLLINATIONS_ENDPOINT_TEXT, POLLINATIONS_MODEL
+from metrics import LLM_CALLS
 
 load_dotenv()
 
@@ -97,6 +98,7 @@ Output constraints:
 
     try:
         response = requests.post(POLLINATIONS_ENDPOINT_TEXT, json=payload, headers=header, timeout=30)
+        LLM_CALLS.labels("intent", "ok" if response.status_code == 200 else "error").inc()
         if response.status_code != 200:
             raise RuntimeError(f"Request failed: {response.status_code}, {response.text}")
 
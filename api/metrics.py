@@ -0,0 +1,138 @@
+"""
+Prometheus metrics shared by the API workers and the model server.
+
+Every process writes to the multiprocess directory, and ``/metrics`` on the
+API aggregates all of them, so gunicorn workers and model-server replicas
+show up as one set of series. The directory must be set before
+prometheus_client is imported, which is why it is only imported here.
+"""
+import functools
+import os
+import threading
+import time
+from typing import Callable, Tuple
+
+from loguru import logger
+
+from config import METRICS_MULTIPROC_DIR
+
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", METRICS_MULTIPROC_DIR)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess  # noqa: E402
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0)
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0)
+
+HTTP_LATENCY = Histogram(
+    "lixaudio_http_request_duration_seconds", "Time to response headers per endpoint",
+    ["endpoint", "method", "status"], buckets=LATENCY_BUCKETS,
+)
+PIPELINE_LATENCY = Histogram(
+    "lixaudio_pipeline_duration_seconds", "End-to-end latency per pipeline",
+    ["pipeline", "outcome"], buckets=LATENCY_BUCKETS,
+)
+QUEUE_WAIT = Histogram(
+    "lixaudio_queue_wait_seconds", "Time a job waited in a model-server lane queue",
+    ["op"], buckets=WAIT_BUCKETS,
+)
+LOCK_HOLD = Histogram(
+    "lixaudio_engine_lock_hold_seconds", "Time a lane slot and its engine lock were held",
+    ["lane"], buckets=LATENCY_BUCKETS,
+)
+GENERATION_TIME = Histogram(
+    "lixaudio_generation_seconds", "Model compute time per synthesis item or transcription batch",
+    ["op"], buckets=LATENCY_BUCKETS,
+)
+REAL_TIME_FACTOR = Histogram(
+    "lixaudio_real_time_factor", "Compute time divided by audio duration",
+    ["op"], buckets=RTF_BUCKETS,
+)
+ACTIVE_OPERATIONS = Gauge(
+    "lixaudio_active_operations", "Operations holding a lane slot",
+    ["lane"], multiprocess_mode="livesum",
+)
+QUEUE_DEPTH = Gauge(
+    "lixaudio_queue_depth", "Jobs waiting in a lane queue or micro-batcher",
+    ["queue"], multiprocess_mode="livesum",
+)
+CACHE_ENTRIES = Gauge(
+    "lixaudio_cache_entries", "Entries held by a cache",
+    ["cache"], multiprocess_mode="livesum",
+)
+CACHE_HITS = Counter("lixaudio_cache_hits", "Cache lookups answered from the cache", ["cache"])
+CACHE_MISSES = Counter("lixaudio_cache_misses", "Cache lookups that had to compute", ["cache"])
+LLM_CALLS = Counter("lixaudio_llm_calls", "Calls to the text model API", ["caller", "outcome"])
+ADMISSION_DECISIONS = Counter("lixaudio_admission_decisions", "Memory admission outcomes per job", ["op", "decision"])
+OOM_REJECTIONS = Counter("lixaudio_oom_rejections", "Requests rejected after running out of memory", ["op"])
+ROUTER_DECISIONS = Counter("lixaudio_router_decisions", "Pipeline routing decisions per source (rules, classifier, llm)", ["source", "pipeline"])
+COALESCED_REQUESTS = Counter(
+    "lixaudio_coalesced_requests", "Requests that waited on an identical in-flight request instead of running it",
+    ["outcome"],
+)
+ABANDONED_WORK = Counter(
+    "lixaudio_abandoned_work", "Jobs dropped from a queue or aborted mid-generation because their deadline passed or their client went away",
+    ["op", "stage", "reason"],
+)
+ABANDONED_SECONDS = Counter(
+    "lixaudio_abandoned_work_seconds", "Estimated compute seconds of queued jobs dropped before they ran",
+    ["op", "reason"],
+)
+
+
+def render() -> Tuple[bytes, str]:
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int):
+    """Drop the live gauges of an exited process so they stop counting."""
+    try:
+        multiprocess.mark_process_dead(pid)
+    except Exception as e:
+        logger.warning(f"Failed to clear metrics of process {pid}: {e}")
+
+
+def child_exit(server, worker):
+    """gunicorn hook: a recycled worker's gauges must not linger."""
+    mark_process_dead(worker.pid)
+
+
+def observe_generation(op: str, seconds: float, audio_seconds: float):
+    GENERATION_TIME.labels(op).observe(seconds)
+    if audio_seconds > 0:
+        REAL_TIME_FACTOR.labels(op).observe(seconds / audio_seconds)
+
+
+def timed_pipeline(pipeline: str):
+    """Decorator for the async pipeline entry points (generate_tts, ...)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.time()
+            outcome = "error"
+            try:
+                result = await fn(*args, **kwargs)
+                outcome = "ok"
+                return result
+            finally:
+                PIPELINE_LATENCY.labels(pipeline, outcome).observe(time.time() - start)
+        return wrapper
+    return decorator
+
+
+def start_sampler(sample: Callable[[], None], interval: float) -> threading.Thread:
+    """Refresh gauges from ``sample`` every ``interval`` seconds on a daemon thread."""
+    def _run():
+        while True:
+            try:
+                sample()
+            except Exception as e:
+                logger.debug(f"Metrics sampling failed: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=_run, name="MetricsSampler", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+from functools import partial
+from typing import Any, Optional
+
+from config import MODEL_SERVER_SOCKET, MODEL_CLIENT_TIMEOUT_SEC
+from rpc import RPCClient
+
+
+class ModelServiceClient:
+    """
+    Client for the model server shared by every pipeline module.
+
+    Attribute access returns a callable for the remote method of the same
+    name, so ``service.speechSynthesis(text=..., audio_prompt_path=...)``
+    works as it did with the BaseManager proxy. The connection is opened
+    lazily and re-established after a fork or a server restart.
+    """
+
+    def __init__(self, path: str = MODEL_SERVER_SOCKET, timeout: Optional[float] = MODEL_CLIENT_TIMEOUT_SEC):
+        self._client = RPCClient(path, timeout=timeout)
+
+    def call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        return self._client.call(method, *args, **kwargs)
+
+    def call_async(self, method: str, *args: Any, **kwargs: Any):
+        return self._client.call_async(method, *args, **kwargs)
+
+    def submit(self, method: str, *args: Any, **kwargs: Any):
+        return self._client.submit(method, *args, **kwargs)
+
+    def poll(self, job_id: str) -> dict:
+        return self._client.poll(job_id)
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return partial(self._client.call, name)
+
+
+class AsyncModelClient:
+    """
+    asyncio front end to the model server.
+
+    ``await aservice.speechSynthesis_shared(...)`` submits the call as a
+    server-side job and suspends until the completion notification arrives,
+    so one event loop can hold many outstanding operations without parking a
+    thread on each of them. Safe to use from any loop, including the
+    short-lived ones created by ``asyncio.run`` per request.
+    """
+
+    def __init__(self, client: ModelServiceClient):
+        self._client = client
+
+    async def submit(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        return await asyncio.wrap_future(self._client.submit(method, *args, **kwargs))
+
+    async def poll(self, job_id: str) -> dict:
+        return await asyncio.to_thread(self._client.poll, job_id)
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return partial(self.submit, name)
+
+
+_service: Optional[ModelServiceClient] = None
+_service_lock = threading.Lock()
+
+
+def get_service() -> ModelServiceClient:
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = ModelServiceClient()
+        return _service
+
+
+service = get_service()
+aservice = AsyncModelClient(service)
@@ -1,4 +1,3 @@
-from multiprocessing.managers import BaseManager
 from faster_whisper import WhisperModel
 import numpy as np
 import torch
@@ -6,22 +5,58 @@ from loguru import logger
 import time, resource
 import hashlib
 import string
-from config import TRANSCRIBE_MODEL_SIZE, MAX_CACHE_SIZE_MB, MAX_CACHE_FILES, MAX_CONCURRENT_OPERATIONS
+from config import TRANSCRIBE_MODEL_SIZE, TTS_SAMPLING
+from config import TTS_LANE_WORKERS, TTS_LANE_MAX_CONCURRENT, TTS_LANE_SERIALIZE
+from config import STT_LANE_WORKERS, STT_LANE_MAX_CONCURRENT, STT_LANE_SERIALIZE, STT_CPU_THREADS
+from config import SCHEDULER_AGING_RATE, SCHEDULER_PRIORITY_STEP_SEC, TTS_COST_PER_CHAR_SEC, STT_COST_PER_AUDIO_SEC
+from config import VOICE_COND_CACHE_SIZE, STREAM_TTL_SEC, SHM_POOL_MAX_MB, SHM_LEASE_TTL_SEC
+from config import STT_BATCHING_ENABLED, STT_BATCH_WINDOW_MS, STT_MAX_BATCH_REQUESTS, STT_BATCH_SIZE, STT_BATCH_MAX_CLIP_SEC
+from config import STT_STREAM_ENDPOINT_MS, STT_STREAM_PARTIAL_INTERVAL_MS, STT_STREAM_MAX_SEGMENT_SEC, STT_STREAM_SESSION_TTL_SEC
+from config import MODEL_SERVER_SOCKET, RPC_SERVER_THREADS, RPC_JOB_RESULT_TTL_SEC
+from config import WARMUP_ENABLED, WARMUP_VOICES, WARMUP_TEXT, WARMUP_STT_CLIP
+from config import PRELOAD_ENGINES, ENGINE_LOAD_WAIT_SEC, ENGINE_PROFILE
+from config import METRICS_SAMPLE_INTERVAL_SEC, CUDA_MEMORY_FRACTION, ADMISSION_MAX_SPLIT_DEPTH
+from config import CANCELLED_REQUEST_TTL_SEC
+from batching import MicroBatcher
+from audio_io import load_audio
+from stt_batching import BatchedTranscriber
+from engine_loader import LazyEngine
+from admission import AdmissionController, is_out_of_memory
+from deadlines import CancellationRegistry, RequestAbandoned, current_deadline, latest
+from chunking import split_in_two
+from stitching import stitch
+from metrics import ACTIVE_OPERATIONS, QUEUE_DEPTH, CACHE_ENTRIES, OOM_REJECTIONS, ABANDONED_WORK, observe_generation, start_sampler, mark_process_dead
+from engine_profile import resolve_profile, apply_engine_profile, prepare_tts_engine, whisper_threads
+from stt_stream import StreamingTranscriptionSession
+from voice_cache import VoiceConditioningCache
+from audio_cache import get_audio_cache, close_audio_cache
+from sentence_cache import get_sentence_cache, close_sentence_cache
+from coalescing import get_coalescer
+from shm_transport import SharedAudioPool, open_shared_bytes
+from rpc import RPCServer, RPCClient
+from replica_pool import apply_replica_placement
+from voiceMap import VOICE_BASE64_MAP
+from scheduler import ExecutionLane, then
 from chatterbox.tts_turbo import ChatterboxTurboTTS
+import argparse
 import os
+import signal
 import time
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor
 import threading
-from functools import wraps
-from pydub import AudioSegment
+import uuid
+import io
+import wave
+from collections import deque
+from contextlib import contextmanager
+from typing import BinaryIO, List, NamedTuple, Optional, Union
 
 BASE62 = string.digits + string.ascii_letters
 device = "cuda" if torch.cuda.is_available() else "cpu"
 cache_dir = "model_cache"
 Path(cache_dir).mkdir(exist_ok=True)
 if device == "cuda":
-    torch.cuda.set_per_process_memory_fraction(0.5, 0)
+    torch.cuda.set_per_process_memory_fraction(CUDA_MEMORY_FRACTION, 0)
 
 
 def base62_encode(num: int) -> str:
@@ -34,112 +69,214 @@ def base62_encode(num: int) -> str:
         digits.append(BASE62[rem])
     return ''.join(reversed(digits))
 
-def thread_safe_gpu_operation(func):
-    @wraps(func)
-    def wrapper(self, *args, **kwargs):
-        with self._gpu_lock:
-            return func(self, *args, **kwargs)
-    return wrapper
+def estimate_audio_duration(path: Union[str, BinaryIO]) -> float:
+    """Audio duration in seconds from the WAV header, falling back to a 16 kHz int16 guess."""
+    try:
+        with wave.open(path, "rb") as wav_file:
+            return wav_file.getnframes() / float(wav_file.getframerate())
+    except Exception:
+        try:
+            if isinstance(path, str):
+                return os.path.getsize(path) / (16000 * 2)
+            return len(path.getbuffer()) / (16000 * 2)
+        except (OSError, AttributeError):
+            return 0.0
+    finally:
+        if not isinstance(path, str):
+            path.seek(0)
 
-def load_audio(path: str) -> np.ndarray:
-    """Load audio file and convert to 16kHz mono"""
-    audio = AudioSegment.from_file(path).set_channels(1).set_frame_rate(16000)
-    samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
-    samples /= np.iinfo(audio.array_type).max
-    return samples
+class TranscriptionRequest(NamedTuple):
+    audio: Union[str, BinaryIO]
+    reqID: Optional[str]
+    priority: str
+
+WHISPER_OPTIONS = dict(beam_size=5, language="en", task="transcribe")
 
 class ipcModules:
     logger.info("Loading IPC Device...")
-    def __init__(self):
-        logger.info("Loading Faster-Whisper model...")
-        self.model = WhisperModel(
+    def __init__(self, cpu_threads: Optional[int] = None):
+        init_start = time.time()
+        self.startup_timings = {}
+        self._cpu_threads = cpu_threads
+        self._default_conds = None
+        self.engine_profile = resolve_profile(ENGINE_PROFILE, device)
+        self.admission = AdmissionController(device)
+        self.thread_plan = apply_engine_profile(self.engine_profile)
+        logger.info(f"Engine profile: {self.engine_profile}")
+        # Engines load on background threads: the preloaded ones start together
+        # at the end of __init__, the rest on first use.
+        self.stt_engine = LazyEngine("STT", self._load_stt_engine, after_load=lambda _: self.admission.calibrate())
+        self.tts_engine = LazyEngine("TTS", self._load_tts_engine, after_load=self._after_tts_load)
+        self.engines = {"stt": self.stt_engine, "tts": self.tts_engine}
+        # Queued work is dropped and running generation aborted once its
+        # deadline passes or its client cancels it.
+        self.cancellations = CancellationRegistry(CANCELLED_REQUEST_TTL_SEC)
+        self._active = threading.local()
+        self.tts_lane = ExecutionLane(
+            "TTSLane",
+            operations=("tts",),
+            workers=TTS_LANE_WORKERS,
+            max_concurrent=TTS_LANE_MAX_CONCURRENT,
+            serialize=TTS_LANE_SERIALIZE,
+            aging_rate=SCHEDULER_AGING_RATE,
+            priority_step=SCHEDULER_PRIORITY_STEP_SEC,
+            check_abandoned=self.cancellations.check,
+        )
+        self.stt_lane = ExecutionLane(
+            "STTLane",
+            operations=("stt",),
+            workers=STT_LANE_WORKERS,
+            max_concurrent=STT_LANE_MAX_CONCURRENT,
+            serialize=STT_LANE_SERIALIZE,
+            aging_rate=SCHEDULER_AGING_RATE,
+            priority_step=SCHEDULER_PRIORITY_STEP_SEC,
+            check_abandoned=self.cancellations.check,
+        )
+        self.lanes = (self.tts_lane, self.stt_lane)
+        self.voice_cache = VoiceConditioningCache(VOICE_COND_CACHE_SIZE)
+        self.shm_pool = SharedAudioPool(SHM_POOL_MAX_MB * 1024 * 1024, SHM_LEASE_TTL_SEC)
+        self._streams = {}
+        self._streams_lock = threading.Lock()
+        self._stt_sessions = {}
+        self._stt_sessions_lock = threading.Lock()
+        self._ready = threading.Event()
+        self.warmup_timings = {}
+        self.stt_batcher = MicroBatcher(
+            "STT",
+            run_batch=self._transcribe_batch_items,
+            bucket_key=lambda request: request.priority,
+            window_ms=STT_BATCH_WINDOW_MS,
+            max_batch_size=STT_MAX_BATCH_REQUESTS,
+            dispatch=self._dispatch_transcription_batch,
+            request_id=lambda request: request.reqID,
+            check_abandoned=self.cancellations.check,
+        )
+        self.startup_timings["init"] = round(time.time() - init_start, 3)
+        start_sampler(self._sample_metrics, METRICS_SAMPLE_INTERVAL_SEC)
+        for name in PRELOAD_ENGINES:
+            self.engines[name].start()
+
+    def _load_stt_engine(self) -> BatchedTranscriber:
+        model = WhisperModel(
             TRANSCRIBE_MODEL_SIZE, 
             device="cuda" if torch.cuda.is_available() else "cpu", 
             compute_type="int8_float32", 
-            download_root="model_cache"
+            download_root="model_cache",
+            **whisper_threads(self.thread_plan, STT_CPU_THREADS, self._cpu_threads),
         )
-        logger.info("Loading ChatterboxTurboTTS model...")
-        self.serve_engine = ChatterboxTurboTTS.from_pretrained(device=device, cache_dir=cache_dir)
-        logger.info("Models loaded successfully")
-        self.executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_OPERATIONS, thread_name_prefix="AudioOp")
-        self._gpu_lock = threading.Lock()
-        self._operation_semaphore = threading.Semaphore(MAX_CONCURRENT_OPERATIONS)
+        return BatchedTranscriber(model, STT_BATCH_SIZE)
+
+    def _load_tts_engine(self) -> ChatterboxTurboTTS:
+        engine = prepare_tts_engine(ChatterboxTurboTTS.from_pretrained(device=device, cache_dir=cache_dir), self.engine_profile)
+        # Captured before any request can swap in a cloned voice.
+        self._default_conds = getattr(engine, "conds", None)
+        # The T3 transformer runs once per decoded token, which makes its
+        # forward the place to abort generation nobody is waiting for.
+        getattr(engine.t3, "tfmr", engine.t3).register_forward_pre_hook(self._check_abort)
+        return engine
+
+    def _after_tts_load(self, engine):
+        self.admission.calibrate()
+        self.precompute_builtin_voices()
+
+    @property
+    def serve_engine(self) -> ChatterboxTurboTTS:
+        return self.tts_engine.get()
+
+    @property
+    def batched_transcriber(self) -> BatchedTranscriber:
+        return self.stt_engine.get()
+
+    @property
+    def model(self) -> WhisperModel:
+        return self.stt_engine.get().model
+
+    def _require(self, name: str):
+        """Front-door check: start a lazy engine and answer "loading" rather than queueing behind it."""
+        return self.engines[name].get(timeout=ENGINE_LOAD_WAIT_SEC)
+
+    def get_engine_status(self):
+        return {name: engine.status() for name, engine in self.engines.items()}
+
+    def cancel_request(self, reqID: str):
+        """The client of ``reqID`` went away: drop its queued work and abort its generation."""
+        self.cancellations.cancel(reqID)
+        logger.info(f"[{reqID}] Cancelled by client")
+
+    @contextmanager
+    def _abortable(self, op: str, deadline: Optional[float], reqID: Optional[str]):
+        """Scope of one request's model work on this thread, checked by ``_check_abort``."""
+        previous = getattr(self._active, "job", None)
+        self._active.job = (deadline, reqID)
+        try:
+            yield
+        except RequestAbandoned as e:
+            ABANDONED_WORK.labels(op, "running", e.reason).inc()
+            logger.info(f"[{reqID}] Aborted {op} generation: {e}")
+            raise
+        finally:
+            self._active.job = previous
+
+    def _check_abort(self, *_):
+        job = getattr(self._active, "job", None)
+        if job is not None:
+            error = self.cancellations.check(*job)
+            if error is not None:
+                raise error
+
+    def _sample_metrics(self):
+        for lane in self.lanes:
+            ACTIVE_OPERATIONS.labels(lane.name).set(lane.active_count())
+            QUEUE_DEPTH.labels(lane.name).set(lane.scheduler.queue_depth())
+        QUEUE_DEPTH.labels("stt_batch").set(self.stt_batcher.pending_count())
+        CACHE_ENTRIES.labels("voice_conditionals").set(self.voice_cache.stats()["entries"])
+        CACHE_ENTRIES.labels("shared_audio").set(self.shm_pool.stats()["leased"])
+        with self._streams_lock:
+            CACHE_ENTRIES.labels("synthesis_streams").set(len(self._streams))
 
     def stop_cleanup(self):
         try:
             self.request_queue.put("STOP")
         except Exception as e:
             logger.error(f"Error stopping cache cleanup: {e}")
-        self.executor.shutdown(wait=True, timeout=30)
+        self.stt_batcher.close()
+        for lane in self.lanes:
+            lane.shutdown(wait=True, timeout=30)
+        self.shm_pool.close()
+        close_audio_cache()
+        close_sentence_cache()
 
-    @staticmethod
-    def cleanup_old_cache_files(): 
-        try:
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            gen_audio_folder = os.path.join(script_dir, "..", "genAudio")
-            
-            if not os.path.exists(gen_audio_folder):
-                return
-            
-            files_info = []
-            total_size = 0
-            
-            for filename in os.listdir(gen_audio_folder):
-                if filename.endswith('.wav'):
-                    file_path = os.path.join(gen_audio_folder, filename)
-                    try:
-                        stat = os.stat(file_path)
-                        files_info.append({
-                            'path': file_path,
-                            'filename': filename,
-                            'atime': stat.st_atime, 
-                            'size': stat.st_size
-                        })
-                        total_size += stat.st_size
-                    except OSError as e:
-                        logger.warning(f"Failed to stat cache file {filename}: {e}")
-            
-            files_info.sort(key=lambda x: x['atime'])
-            
-            total_size_mb = total_size / (1024 * 1024)
-            cleaned_count = 0
-            freed_mb = 0
-            files_to_remove = []
-
-            if total_size_mb > MAX_CACHE_SIZE_MB:
-                target_size = MAX_CACHE_SIZE_MB * 0.8 * 1024 * 1024  
-                current_size = total_size
-                
-                for file_info in files_info:
-                    if current_size <= target_size:
-                        break
-                    files_to_remove.append(file_info)
-                    current_size -= file_info['size']
-            
-           
-            if len(files_info) > MAX_CACHE_FILES:
-                excess_count = len(files_info) - int(MAX_CACHE_FILES * 0.8)  
-                for i in range(excess_count):
-                    if files_info[i] not in files_to_remove:
-                        files_to_remove.append(files_info[i])
-            
-            
-            for file_info in files_to_remove:
-                try:
-                    os.remove(file_info['path'])
-                    cleaned_count += 1
-                    freed_mb += file_info['size'] / (1024 * 1024)
-                    logger.debug(f"Removed LRU cache file: {file_info['filename']}")
-                except OSError as e:
-                    logger.warning(f"Failed to remove cache file {file_info['filename']}: {e}")
-            
-            if cleaned_count > 0:
-                logger.info(f"LRU cache cleanup: removed {cleaned_count} files, freed {freed_mb:.2f} MB")
-            else:
-                logger.debug(f"Cache within limits: {len(files_info)} files, {total_size_mb:.2f} MB")
-                
-        except Exception as e:
-            logger.error(f"Error during LRU cache cleanup: {e}")
+    def cache_lookup(self, key: str):
+        """Where to read the cached response for ``key`` (see ``read_cached``), or None."""
+        return get_audio_cache().lookup(key)
+
+    def cache_store(self, key: str, data: bytes, kind: str = "wav", cost=None) -> str:
+        return get_audio_cache().store(key, data, kind, cost)
+
+    def cache_contains(self, key: str) -> bool:
+        return get_audio_cache().contains(key)
+
+    def get_audio_cache_stats(self):
+        return get_audio_cache().stats()
+
+    def sentence_cache_lookup(self, keys):
+        return get_sentence_cache().lookup(keys)
+
+    def sentence_cache_store(self, key: str, pcm: bytes, sample_rate: int):
+        get_sentence_cache().store(key, pcm, sample_rate)
+
+    def get_sentence_cache_stats(self):
+        return get_sentence_cache().stats()
+
+    def coalesce_join(self, key: str):
+        """Resolves to {"role": "leader"} at once, or to the leader's result for a duplicate."""
+        return get_coalescer().join(key)
+
+    def coalesce_complete(self, key: str, result=None):
+        get_coalescer().complete(key, result)
+
+    def get_coalescing_stats(self):
+        return get_coalescer().stats()
 
     @staticmethod
     def cacheName(query: str, length: int = 16) -> str:  
@@ -149,61 +286,289 @@ class ipcModules:
         encoded = base62_encode(num)
         return encoded[:length]
 
-    def _speechSynthesis_worker(self, text: str, audio_prompt_path: str = None):
-        with self._operation_semaphore:
+    def _prepare_conditionals(self, audio_prompt_path: str):
+        # Must run inside the TTS lane slot: prepare_conditionals writes to engine.conds.
+        self.serve_engine.prepare_conditionals(audio_prompt_path)
+        return self.serve_engine.conds
+
+    def precompute_builtin_voices(self):
+        start_time = time.time()
+        with self.tts_lane.slot(), torch.inference_mode():
+            for voice, path in VOICE_BASE64_MAP.items():
+                try:
+                    self.voice_cache.get(path, self._prepare_conditionals)
+                except Exception as e:
+                    logger.warning(f"Failed to precompute conditionals for voice '{voice}': {e}")
+        self.startup_timings["voice_conditionals"] = round(time.time() - start_time, 3)
+        logger.info(f"Precomputed built-in voice conditionals in {time.time() - start_time:.2f} seconds")
+
+    def get_voice_cache_stats(self):
+        return self.voice_cache.stats()
+
+    def warmup(self):
+        """
+        Wait for the preloaded engines, run the warmup set for them through the
+        normal request path, then mark the server ready. A failed step
+        is logged and recorded but does not keep the server from coming up;
+        lazily loaded engines are not warmed.
+        """
+        timings = {"tts": {}, "stt": None}
+        start_time = time.time()
+        for name in PRELOAD_ENGINES:
+            engine = self.engines[name]
+            engine.wait()
+            self.startup_timings[f"{name}_load"] = round(engine.load_seconds, 3) if engine.load_seconds is not None else engine.status()
+        self.startup_timings["engines_ready"] = round(time.time() - start_time, 3)
+        start_time = time.time()
+        if WARMUP_ENABLED and self.tts_engine.status() == "ready":
+            voices = WARMUP_VOICES if WARMUP_VOICES is not None else list(VOICE_BASE64_MAP)
+            for voice in voices:
+                step_start = time.time()
+                try:
+                    self.speechSynthesis(WARMUP_TEXT, VOICE_BASE64_MAP[voice], reqID=f"warmup-{voice}", priority="background")
+                    timings["tts"][voice] = round(time.time() - step_start, 3)
+                except Exception as e:
+                    logger.warning(f"Warmup synthesis for voice '{voice}' failed: {e}")
+                    timings["tts"][voice] = f"failed: {e}"
+        if WARMUP_ENABLED and WARMUP_STT_CLIP and self.stt_engine.status() == "ready":
+            step_start = time.time()
+            try:
+                self.transcribe(WARMUP_STT_CLIP, "warmup-stt", priority="background")
+                timings["stt"] = round(time.time() - step_start, 3)
+            except Exception as e:
+                logger.warning(f"Warmup transcription of {WARMUP_STT_CLIP} failed: {e}")
+                timings["stt"] = f"failed: {e}"
+        timings["total"] = round(time.time() - start_time, 3)
+        self.warmup_timings = timings
+        self.startup_timings["warmup"] = timings["total"]
+        self._ready.set()
+        logger.info(f"Warmup finished in {timings['total']:.2f} seconds")
+        return timings
+
+    def is_ready(self) -> bool:
+        return self.get_readiness()["ready"]
+
+    def get_readiness(self):
+        ready = self._ready.is_set() and all(self.engines[name].status() == "ready" for name in PRELOAD_ENGINES)
+        return {
+            "ready": ready,
+            "engines": self.get_engine_status(),
+            "startup": self.startup_timings,
+            "warmup": self.warmup_timings,
+        }
+
+    def _speechSynthesis_worker(self, text: str, audio_prompt_path: str = None, reqID: str = None):
+        # One lane job per text: the engine cannot batch, so the scheduler
+        # orders every text on its own (shortest first within a class) and
+        # voice_cache keeps switching voices between jobs cheap.
+        with self.tts_lane.slot(), torch.inference_mode(), self._abortable("tts", current_deadline.get(), reqID):
             thread_id = threading.current_thread().name
-            logger.info(f"[{thread_id}] Starting generation...")
+            logger.info(f"[{thread_id}] Starting generation for request {reqID}...")
             start_time = time.time()
-            
+
             try:
-                with self._gpu_lock:
-                    wav = self.serve_engine.generate(
-                        text=text,
-                        top_p=0.95,
-                        temperature=0.8,
-                        top_k=1000,
-                        repetition_penalty=1.2,
-                        audio_prompt_path=audio_prompt_path
-                    )
-                    if device == "cuda":
-                        torch.cuda.empty_cache()
-                    
-            except RuntimeError as e:
-                if "CUDA out of memory" in str(e) or "out of memory" in str(e).lower():
-                    logger.error(f"[{thread_id}] GPU OOM — request denied")
-                    return None, None
-                raise e
+                if audio_prompt_path:
+                    self.serve_engine.conds = self.voice_cache.get(audio_prompt_path, self._prepare_conditionals)
+                elif self._default_conds is not None:
+                    self.serve_engine.conds = self._default_conds
+            except Exception as e:
+                if not is_out_of_memory(e):
+                    raise e
+                logger.error(f"[{thread_id}] Out of memory while preparing voice — request denied")
+                OOM_REJECTIONS.labels("tts").inc()
+                self.admission.relieve_pressure(force=True)
+                return None, None
 
+            wav = self._generate_speech(text, thread_id)
             elapsed_time = time.time() - start_time
             logger.info(f"[{thread_id}] Generation time: {elapsed_time:.2f} seconds")
-            if isinstance(wav, torch.Tensor):
-                wav = wav.cpu().numpy()
-            
-            return wav, self.serve_engine.sr
+            return (wav, self.serve_engine.sr) if wav is not None else (None, None)
+
+    def _generate_speech(self, text: str, thread_id: str, depth: int = 0) -> Optional[np.ndarray]:
+        """
+        Generate one text under memory admission. Text whose estimate cannot
+        fit the budget, or whose generation runs out of memory, is split in
+        two at a sentence boundary and the halves are rendered and stitched;
+        None once splitting is exhausted.
+        """
+        estimate = self.admission.estimate("tts", len(text))
+        halves = split_in_two(text) if depth < ADMISSION_MAX_SPLIT_DEPTH else None
+        if halves is not None and not self.admission.fits_at_all(estimate):
+            logger.info(f"[{thread_id}] {len(text)} chars exceed the memory budget, splitting")
+            return self._generate_halves(halves, thread_id, depth)
+
+        item_start = time.time()
+        try:
+            with self.admission.admit("tts", estimate):
+                wav = self.serve_engine.generate(text=text, **TTS_SAMPLING)
+                if isinstance(wav, torch.Tensor):
+                    wav = wav.cpu().numpy()
+        except Exception as e:
+            if not is_out_of_memory(e):
+                raise
+            self.admission.relieve_pressure(force=True)
+            if halves is None:
+                logger.error(f"[{thread_id}] Out of memory — request denied")
+                OOM_REJECTIONS.labels("tts").inc()
+                return None
+            logger.warning(f"[{thread_id}] Out of memory on {len(text)} chars, retrying as two halves")
+            return self._generate_halves(halves, thread_id, depth)
+        observe_generation("tts", time.time() - item_start, wav.shape[-1] / self.serve_engine.sr)
+        return wav
+
+    def _generate_halves(self, halves, thread_id: str, depth: int) -> Optional[np.ndarray]:
+        parts = [self._generate_speech(half, thread_id, depth + 1) for half in halves]
+        if any(part is None for part in parts):
+            return None
+        return stitch(parts, self.serve_engine.sr, crossfade_ms=10, pause_ms=0).reshape(1, -1)
+
+    def speechSynthesis(self, text: str, audio_prompt_path: str = None, reqID: str = None, priority: str = "interactive"):
+        return self.speechSynthesis_async(text, audio_prompt_path, reqID, priority).result()
+
+    def speechSynthesis_async(self, text: str, audio_prompt_path: str = None, reqID: str = None, priority: str = "interactive"):
+        self._require("tts")
+        cost = len(text) * TTS_COST_PER_CHAR_SEC
+        return self.tts_lane.submit("tts", self._speechSynthesis_worker, text, audio_prompt_path, reqID, cost=cost, priority=priority, job_id=reqID)
+
+    def speechSynthesis_shared(self, text: str, audio_prompt_path: str = None, reqID: str = None, priority: str = "interactive"):
+        """Like speechSynthesis, but returns a shared-memory handle instead of the waveform."""
+        return self.speechSynthesis_shared_async(text, audio_prompt_path, reqID, priority).result()
+
+    def speechSynthesis_shared_async(self, text: str, audio_prompt_path: str = None, reqID: str = None, priority: str = "interactive"):
+        return then(self.speechSynthesis_async(text, audio_prompt_path, reqID, priority), self._share_audio)
+
+    def _share_audio(self, result):
+        wav, sample_rate = result
+        if wav is None:
+            return None
+        handle = self.shm_pool.put(np.asarray(wav, dtype=np.float32))
+        if handle is None:
+            raise RuntimeError("Shared audio pool exhausted")
+        handle["sample_rate"] = sample_rate
+        return handle
+
+    def release_shared_audio(self, name: str):
+        self.shm_pool.release(name)
+
+    def speechSynthesis_stream_start(self, chunks, audio_prompt_path: str = None, reqID: str = None, priority: str = "interactive") -> str:
+        # All chunks are queued up front so the engine renders chunk n+1 while
+        # the client is still receiving chunk n; results are handed out in order.
+        self._purge_stale_streams()
+        stream_id = uuid.uuid4().hex[:16]
+        futures = deque(self.speechSynthesis_async(chunk, audio_prompt_path, reqID, priority) for chunk in chunks)
+        with self._streams_lock:
+            self._streams[stream_id] = (time.time(), futures)
+        logger.info(f"[{reqID}] Opened synthesis stream {stream_id} with {len(futures)} chunk(s)")
+        return stream_id
+
+    def speechSynthesis_stream_next(self, stream_id: str):
+        with self._streams_lock:
+            entry = self._streams.get(stream_id)
+            if entry is None:
+                raise KeyError(f"Unknown synthesis stream {stream_id}")
+            futures = entry[1]
+            future = futures.popleft() if futures else None
+        if future is None:
+            self.speechSynthesis_stream_close(stream_id)
+            return None
+        # Handed back unresolved: the RPC server replies when the chunk is
+        # rendered instead of parking one of its threads on it.
+        return future
+
+    def speechSynthesis_stream_close(self, stream_id: str):
+        with self._streams_lock:
+            entry = self._streams.pop(stream_id, None)
+        if entry is not None:
+            for future in entry[1]:
+                future.cancel()
+
+    def _purge_stale_streams(self):
+        cutoff = time.time() - STREAM_TTL_SEC
+        with self._streams_lock:
+            stale = [stream_id for stream_id, (opened_at, _) in self._streams.items() if opened_at < cutoff]
+        for stream_id in stale:
+            logger.warning(f"Closing abandoned synthesis stream {stream_id}")
+            self.speechSynthesis_stream_close(stream_id)
+
+    def stt_session_open(self, sample_rate: int = 16000, reqID: str = None) -> str:
+        """Start a live transcription session fed with 16-bit mono PCM at ``sample_rate``."""
+        self._require("stt")
+        self._purge_stale_stt_sessions()
+        session_id = uuid.uuid4().hex[:16]
+        session = StreamingTranscriptionSession(
+            session_id,
+            transcribe=lambda samples, final: self._transcribe_segment_async(samples, reqID, final),
+            sample_rate=sample_rate,
+            endpoint_ms=STT_STREAM_ENDPOINT_MS,
+            partial_interval_ms=STT_STREAM_PARTIAL_INTERVAL_MS,
+            max_segment_sec=STT_STREAM_MAX_SEGMENT_SEC,
+        )
+        with self._stt_sessions_lock:
+            self._stt_sessions[session_id] = [time.time(), session]
+        logger.info(f"[{reqID}] Opened streaming transcription session {session_id} at {sample_rate} Hz")
+        return session_id
+
+    def _get_stt_session(self, session_id: str) -> StreamingTranscriptionSession:
+        with self._stt_sessions_lock:
+            entry = self._stt_sessions.get(session_id)
+            if entry is None:
+                raise KeyError(f"Unknown transcription session {session_id}")
+            entry[0] = time.time()
+            return entry[1]
+
+    def stt_session_feed(self, session_id: str, pcm: bytes):
+        """Append audio; returns the partial/final events produced since the last call."""
+        return self._get_stt_session(session_id).feed(pcm)
+
+    def stt_session_poll(self, session_id: str):
+        return self._get_stt_session(session_id).drain()
+
+    def stt_session_close(self, session_id: str):
+        """Flush the session; resolves to the remaining events and the full transcript."""
+        session = self._get_stt_session(session_id)
+        with self._stt_sessions_lock:
+            self._stt_sessions.pop(session_id, None)
+        return session.close()
+
+    def _purge_stale_stt_sessions(self):
+        cutoff = time.time() - STT_STREAM_SESSION_TTL_SEC
+        with self._stt_sessions_lock:
+            stale = [session_id for session_id, (seen, _) in self._stt_sessions.items() if seen < cutoff]
+            for session_id in stale:
+                logger.warning(f"Dropping abandoned transcription session {session_id}")
+                del self._stt_sessions[session_id]
+
+    def _transcribe_segment_async(self, samples: np.ndarray, reqID, final: bool):
+        # Finals are what the caller waits on; partials are best effort.
+        cost = len(samples) / 16000 * STT_COST_PER_AUDIO_SEC
+        priority = "interactive" if final else "default"
+        return self.stt_lane.submit("stt", self._transcribe_segment, samples, reqID, cost=cost, priority=priority, request_id=reqID)
 
-    def speechSynthesis(self, text: str, audio_prompt_path: str = None):
-        future = self.executor.submit(self._speechSynthesis_worker, text, audio_prompt_path)
-        return future.result()  
+    def _transcribe_segment(self, samples: np.ndarray, reqID) -> str:
+        with self.stt_lane.slot(), self._abortable("stt", current_deadline.get(), reqID):
+            return self._transcribe_samples(samples)
 
-    def speechSynthesis_async(self, text: str, audio_prompt_path: str = None):
-        return self.executor.submit(self._speechSynthesis_worker, text, audio_prompt_path)
+    def _transcribe_samples(self, samples: np.ndarray) -> str:
+        start_time = time.time()
+        with self.admission.admit("stt", self.admission.estimate("stt", len(samples) / 16000)):
+            segments, _ = self.model.transcribe(samples, vad_filter=True, **WHISPER_OPTIONS)
+            # Segments are decoded lazily; stopping between them stops decoding.
+            texts = []
+            for seg in segments:
+                self._check_abort()
+                texts.append(seg.text)
+            text = "".join(texts)
+        observe_generation("stt", time.time() - start_time, len(samples) / 16000)
+        return text
 
-    def _transcribe_worker(self, audio_path: str, reqID):
-        with self._operation_semaphore:
+    def _transcribe_worker(self, audio_path: Union[str, BinaryIO], reqID):
+        with self.stt_lane.slot(), self._abortable("stt", current_deadline.get(), reqID):
             thread_id = threading.current_thread().name
             logger.info(f"[{thread_id}] Starting transcription for request {reqID}")
             start_time = time.time()
             
             try:
-                samples = load_audio(audio_path)
-                segments, _ = self.model.transcribe(
-                    samples, 
-                    beam_size=5, 
-                    vad_filter=True, 
-                    language="en", 
-                    task="transcribe"
-                )
-                text = "".join(seg.text for seg in segments)
+                text = self._transcribe_samples(load_audio(audio_path))
                 elapsed_time = time.time() - start_time
                 logger.info(f"[{thread_id}] Transcription time: {elapsed_time:.2f} seconds")
                 return text
@@ -211,33 +576,182 @@ class ipcModules:
                 logger.error(f"[{thread_id}] Transcription error: {e}")
                 raise e
 
-    def transcribe(self, audio_path: str, reqID) -> str:
-        future = self.executor.submit(self._transcribe_worker, audio_path, reqID)
-        return future.result()  
+    def _dispatch_transcription_batch(self, fn, items):
+        cost = sum(estimate_audio_duration(item.payload.audio) for item in items) * STT_COST_PER_AUDIO_SEC
+        deadline = latest(item.deadline for item in items)
+        return self.stt_lane.submit("stt", fn, items, cost=cost, priority=items[0].payload.priority, deadline=deadline)
 
-    def transcribe_async(self, audio_path: str, reqID):
-        return self.executor.submit(self._transcribe_worker, audio_path, reqID)
+    def _transcribe_batch_items(self, items):
+        # One queued job transcribes like the serial path; several short ones
+        # are packed into batched forward passes (see _transcribe_many).
+        with self.stt_lane.slot():
+            thread_id = threading.current_thread().name
+            start_time = time.time()
+            for item in items:
+                self.stt_lane.scheduler.record_wait("stt", item.payload.reqID, start_time - item.enqueued_at)
+            results = []
+            audios = []
+            for item in items:
+                try:
+                    audios.append(load_audio(item.payload.audio))
+                    results.append(None)
+                except Exception as e:
+                    logger.error(f"[{thread_id}] Failed to load audio for request {item.payload.reqID}: {e}")
+                    results.append(e)
+            ready = [index for index, result in enumerate(results) if result is None]
+            if not ready:
+                return results
+
+            # A lone request can be aborted between segments; a packed batch runs to the end.
+            job = (items[ready[0]].deadline, items[ready[0]].payload.reqID) if len(ready) == 1 else (None, None)
+            with self._abortable("stt", *job):
+                texts = self._transcribe_many(audios)
+            for index, text in zip(ready, texts):
+                results[index] = text
+            logger.info(f"[{thread_id}] Transcribed {len(ready)} request(s) in {time.time() - start_time:.2f} seconds")
+            return results
+
+    def _transcribe_many(self, audios: List[np.ndarray]) -> List[str]:
+        # Only several short clips are packed into batched passes: a clip of
+        # one Whisper window loses no previous-text conditioning. Lone and
+        # long clips are transcribed serially.
+        short = [index for index, samples in enumerate(audios) if len(samples) < STT_BATCH_MAX_CLIP_SEC * 16000]
+        if not STT_BATCHING_ENABLED or len(short) < 2:
+            return [self._transcribe_samples(samples) for samples in audios]
+        texts = [None if index in short else self._transcribe_samples(samples) for index, samples in enumerate(audios)]
+        for index, text in zip(short, self._transcribe_batched([audios[index] for index in short])):
+            texts[index] = text
+        return texts
+
+    def _transcribe_batched(self, audios: List[np.ndarray]) -> List[str]:
+        start_time = time.time()
+        seconds = sum(len(samples) for samples in audios) / 16000
+        estimate = self.admission.estimate("stt", seconds)
+        if not self.admission.fits_at_all(estimate):
+            return [self._transcribe_samples(samples) for samples in audios]
+        try:
+            with self.admission.admit("stt", estimate):
+                texts = self.batched_transcriber.transcribe(audios, **WHISPER_OPTIONS)
+        except Exception as e:
+            if not is_out_of_memory(e) or len(audios) == 1:
+                raise
+            # Retry one clip at a time; a clip that still does not fit fails on its own.
+            logger.warning(f"Out of memory on a batch of {len(audios)} clips, transcribing them one by one")
+            self.admission.relieve_pressure(force=True)
+            return [self._transcribe_samples(samples) for samples in audios]
+        observe_generation("stt", time.time() - start_time, seconds)
+        return texts
+
+    def _transcribe_batch_worker(self, audio_paths: List[str], reqID):
+        with self.stt_lane.slot(), self._abortable("stt", current_deadline.get(), reqID):
+            start_time = time.time()
+            texts = self._transcribe_many([load_audio(path) for path in audio_paths])
+            logger.info(f"[{reqID}] Batch transcription of {len(audio_paths)} file(s) in {time.time() - start_time:.2f} seconds")
+            return texts
+
+    def transcribe_batch(self, audio_paths: List[str], reqID: str = None, priority: str = "default") -> List[str]:
+        return self.transcribe_batch_async(audio_paths, reqID, priority).result()
+
+    def transcribe_batch_async(self, audio_paths: List[str], reqID: str = None, priority: str = "default"):
+        """Transcribe several files in batched passes; results are in input order."""
+        self._require("stt")
+        cost = sum(estimate_audio_duration(path) for path in audio_paths) * STT_COST_PER_AUDIO_SEC
+        return self.stt_lane.submit("stt", self._transcribe_batch_worker, list(audio_paths), reqID, cost=cost, priority=priority, job_id=reqID)
+
+    def transcribe(self, audio_path: str, reqID, priority: str = "interactive") -> str:
+        return self.transcribe_async(audio_path, reqID, priority).result()
+
+    def transcribe_shared(self, handle: dict, reqID, priority: str = "interactive") -> str:
+        return self.transcribe_shared_async(handle, reqID, priority).result()
+
+    def transcribe_shared_async(self, handle: dict, reqID, priority: str = "interactive"):
+        # BytesIO takes its own copy, so the segment can be detached before the
+        # job is even scheduled; the client frees it once the job completes.
+        shm, view = open_shared_bytes(handle)
+        try:
+            audio = io.BytesIO(view)
+        finally:
+            view.release()
+            shm.close()
+        return self.transcribe_async(audio, reqID, priority)
+
+    def transcribe_async(self, audio_path: Union[str, BinaryIO], reqID, priority: str = "interactive"):
+        self._require("stt")
+        if STT_BATCHING_ENABLED:
+            return self.stt_batcher.submit(TranscriptionRequest(audio_path, reqID, priority))
+        cost = estimate_audio_duration(audio_path) * STT_COST_PER_AUDIO_SEC
+        return self.stt_lane.submit("stt", self._transcribe_worker, audio_path, reqID, cost=cost, priority=priority, job_id=reqID)
+
+    def get_sample_rate(self) -> int:
+        return self._require("tts").sr
 
     def get_active_operations_count(self):
-        return MAX_CONCURRENT_OPERATIONS - self._operation_semaphore._value
+        return sum(lane.active_count() for lane in self.lanes)
+
+    def get_queue_wait(self, reqID: str):
+        for lane in self.lanes:
+            wait = lane.scheduler.get_queue_wait(reqID)
+            if wait is not None:
+                return wait
+        return None
+
+    def get_foreground_activity(self):
+        """Foreground jobs queued or running, and seconds since the lanes last saw one."""
+        active, last = 0, 0.0
+        for lane in self.lanes:
+            lane_active, lane_last = lane.scheduler.foreground_activity()
+            active += lane_active
+            last = max(last, lane_last)
+        return {"active": active, "idle_sec": time.time() - last}
+
+    def get_scheduler_stats(self):
+        stats = {lane.name: lane.stats() for lane in self.lanes}
+        stats["stt_batch_pending"] = self.stt_batcher.pending_count()
+        stats["admission"] = self.admission.stats()
+        return stats
 
-class ModelManager(BaseManager): pass
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Model server")
+    parser.add_argument("--socket", default=MODEL_SERVER_SOCKET)
+    parser.add_argument("--replica-id", type=int, default=None)
+    parser.add_argument("--supervisor", default=None, help="Supervisor socket to register with when running as a replica")
+    args = parser.parse_args()
+    # The supervisor stops replicas with SIGTERM; unwind like Ctrl+C so shared memory is released.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    process_start = time.time()
     try:
-        server = ipcModules()
-        ModelManager.register("Service", callable=lambda: server)
-        
-        manager = ModelManager(address=("localhost", 6000), authkey=b"secret")
-        print(f"[Producer] Server started at localhost:6000 with {MAX_CONCURRENT_OPERATIONS} concurrent operations")
-        
+        replica_threads = apply_replica_placement()
+        server = ipcModules(cpu_threads=replica_threads)
+        rpc_server = RPCServer(server, args.socket, workers=RPC_SERVER_THREADS, job_ttl=RPC_JOB_RESULT_TTL_SEC)
+        rpc_server.start()
+        server.startup_timings["socket_up"] = round(time.time() - process_start, 3)
+        print(f"[Producer] Server started at {args.socket} with lanes TTS={TTS_LANE_MAX_CONCURRENT} STT={STT_LANE_MAX_CONCURRENT} concurrent operations")
+        # The socket is up while the engines load, so /health can report
+        # "warming up" instead of connection errors; replicas only join the
+        # router once they are warm.
+        server.warmup()
+        server.startup_timings["ready"] = round(time.time() - process_start, 3)
+        logger.info(f"[Startup] Phase timings (s): {server.startup_timings}")
+        supervisor = RPCClient(args.supervisor, timeout=10) if args.supervisor else None
+        if supervisor is not None:
+            supervisor.call("register_replica", args.replica_id, args.socket, os.getpid())
+            print(f"[Replica {args.replica_id}] Ready", flush=True)
+        else:
+            print(f"[SERVER_READY] Warmup took {server.warmup_timings['total']:.2f}s", flush=True)
+
         try:
-            manager.get_server().serve_forever()
+            rpc_server.serve_forever()
         except KeyboardInterrupt:
             logger.info("Shutting down server...")
         finally:
+            if supervisor is not None:
+                try:
+                    supervisor.call("deregister_replica", args.replica_id)
+                except Exception as e:
+                    logger.warning(f"Failed to deregister from supervisor: {e}")
+            rpc_server.stop()
             server.stop_cleanup()
+            mark_process_dead(os.getpid())
             
     except Exception as e:
-        logger.error(f"Error in producer main: {e}")
-
-
+        logger.error(f"Error in producer main: {e}")
\ No newline at end of file
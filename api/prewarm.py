@@ -0,0 +1,223 @@
+"""
+Cache pre-warming: regenerate the most requested /generate responses into the
+response cache while the model server has nothing else to do.
+
+The popularity log is appended to by the API (``record_request``); phrase
+files are JSONL with the same ``text``, ``voice``, ``system`` and ``seed``
+fields and an optional ``count``. Run after the model server is up:
+
+    python api/prewarm.py [--phrases prompts.jsonl] [--top 200]
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from loguru import logger
+
+from audio_cache import ROOT, append_jsonl
+from config import (
+    PREWARM_ENABLED, PREWARM_RECORD_REQUESTS, PREWARM_POPULARITY_LOG, PREWARM_LOG_MAX_MB, PREWARM_PHRASE_FILES,
+    PREWARM_TOP_N, PREWARM_IDLE_SEC, PREWARM_POLL_SEC, PREWARM_MAX_CACHE_FRACTION,
+)
+from model_client import service
+from voiceMap import VOICE_BASE64_MAP
+
+
+class PrewarmEntry(NamedTuple):
+    key: str
+    text: str
+    voice: str
+    system: Optional[str]
+    seed: int
+    count: int
+
+
+def _path(path: str) -> str:
+    return path if os.path.isabs(path) else os.path.join(ROOT, path)
+
+
+def cache_key(text: str, system: Optional[str], voice: str, seed) -> str:
+    """Response cache name of a /generate request without speech input."""
+    return service.cacheName(f"{text}{system if system else ''}{voice}{str(seed) if seed else 42}")
+
+
+def record_request(key: str, text: str, voice: str, system: Optional[str], seed):
+    """Append one request to the popularity log; only requests that can be replayed are worth recording."""
+    if not PREWARM_RECORD_REQUESTS or voice not in VOICE_BASE64_MAP:
+        return
+    record = {"ts": round(time.time(), 3), "key": key, "text": text, "voice": voice, "system": system, "seed": seed}
+    try:
+        append_jsonl(PREWARM_POPULARITY_LOG, record, PREWARM_LOG_MAX_MB)
+    except OSError as e:
+        logger.debug(f"Failed to record request {key} in the popularity log: {e}")
+
+
+def load_popularity(paths: Iterable[str]) -> List[PrewarmEntry]:
+    """Entries of the given JSONL files, most requested first."""
+    counts: Counter = Counter()
+    requests: Dict[str, dict] = {}
+    for path in paths:
+        try:
+            f = open(path, "r", encoding="utf-8")
+        except FileNotFoundError:
+            continue
+        with f:
+            for number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                    text = record["text"]
+                except (ValueError, KeyError, TypeError):
+                    logger.debug(f"Skipping malformed line {number} of {path}")
+                    continue
+                voice = record.get("voice") or "alloy"
+                if not isinstance(text, str) or not text.strip() or voice not in VOICE_BASE64_MAP:
+                    continue
+                request = {"text": text, "voice": voice, "system": record.get("system"), "seed": record.get("seed") or 42}
+                identity = json.dumps(request, sort_keys=True)
+                counts[identity] += int(record.get("count", 1))
+                requests[identity] = request
+    entries = []
+    for identity, count in counts.most_common():
+        request = requests[identity]
+        key = cache_key(request["text"], request["system"], request["voice"], request["seed"])
+        entries.append(PrewarmEntry(key, count=count, **request))
+    return entries
+
+
+class PrewarmJob:
+    """
+    Generates ``entries`` into the response cache, one at a time, at
+    background priority.
+
+    An entry only starts once the model server has had no foreground work for
+    ``idle_sec``. If foreground work arrives while it runs, the entry is
+    cancelled (the model server aborts it between decoding steps) and retried
+    after the next idle period. The job ends when every entry is cached or
+    the cache reaches ``max_cache_fraction`` of its limits; cached entries
+    already present are skipped.
+    """
+
+    def __init__(self, entries: List[PrewarmEntry], idle_sec: float = PREWARM_IDLE_SEC, poll_sec: float = PREWARM_POLL_SEC, max_cache_fraction: float = PREWARM_MAX_CACHE_FRACTION):
+        self.entries = entries
+        self.idle_sec = idle_sec
+        self.poll_sec = poll_sec
+        self.max_cache_fraction = max_cache_fraction
+        self.warmed = 0
+        self.skipped = 0
+        self.interrupted = 0
+        self.failed = 0
+
+    def run(self):
+        start_time = time.time()
+        pending = list(self.entries)
+        while pending:
+            if self._cache_full():
+                logger.info(f"[Prewarm] Response cache is at {self.max_cache_fraction:.0%} of its limits, stopping")
+                break
+            entry = pending[0]
+            if service.cache_contains(entry.key):
+                self.skipped += 1
+                pending.pop(0)
+                continue
+            self._wait_idle()
+            outcome = self._warm(entry)
+            if outcome == "interrupted":
+                self.interrupted += 1
+                continue
+            pending.pop(0)
+            if outcome == "warmed":
+                self.warmed += 1
+            else:
+                self.failed += 1
+        logger.info(
+            f"[Prewarm] Done in {time.time() - start_time:.1f}s: {self.warmed} warmed, {self.skipped} already cached, "
+            f"{self.failed} failed, {self.interrupted} interruption(s), {len(pending)} left"
+        )
+
+    def _cache_full(self) -> bool:
+        stats = service.get_audio_cache_stats()
+        return (
+            stats["size_mb"] >= stats["max_size_mb"] * self.max_cache_fraction
+            or stats["entries"] >= stats["max_files"] * self.max_cache_fraction
+        )
+
+    def _busy(self) -> bool:
+        activity = service.get_foreground_activity()
+        return activity["active"] > 0 or activity["idle_sec"] < self.idle_sec
+
+    def _wait_idle(self):
+        while self._busy():
+            time.sleep(self.poll_sec)
+
+    def _warm(self, entry: PrewarmEntry) -> str:
+        # A fresh id per attempt: cancelled ids stay cancelled for a while.
+        request_id = f"prewarm-{uuid.uuid4().hex[:10]}"
+        outcome: dict = {}
+
+        def _run():
+            from server import run_audio_pipeline
+            try:
+                outcome["result"] = asyncio.run(run_audio_pipeline(
+                    reqID=request_id,
+                    text=entry.text,
+                    voice=VOICE_BASE64_MAP[entry.voice],
+                    system_instruction=entry.system,
+                    priority="background",
+                    cache_key=entry.key,
+                ))
+            except Exception as e:
+                outcome["result"] = {"type": "error", "message": str(e)}
+
+        worker = threading.Thread(target=_run, name="PrewarmPipeline", daemon=True)
+        worker.start()
+        interrupted = False
+        while worker.is_alive():
+            worker.join(self.poll_sec)
+            if not interrupted and worker.is_alive() and service.get_foreground_activity()["active"] > 0:
+                logger.info(f"[Prewarm] Foreground traffic arrived, abandoning {entry.key}")
+                service.cancel_request(request_id)
+                interrupted = True
+        if interrupted:
+            return "interrupted"
+        result = outcome.get("result") or {}
+        if result.get("type") == "audio":
+            logger.info(f"[Prewarm] Cached {entry.key} ({entry.count} request(s)): {entry.text[:60]!r}")
+            return "warmed"
+        # Text-only replies are not cached; they are not retried either.
+        logger.info(f"[Prewarm] {entry.key} produced no audio: {result.get('message', result.get('type'))}")
+        return "failed"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-warm the response cache")
+    parser.add_argument("--log", default=PREWARM_POPULARITY_LOG, help="Popularity log written by the API")
+    parser.add_argument("--phrases", action="append", default=list(PREWARM_PHRASE_FILES), help="JSONL phrase list (repeatable)")
+    parser.add_argument("--top", type=int, default=PREWARM_TOP_N)
+    args = parser.parse_args()
+    if not PREWARM_ENABLED:
+        logger.info("[Prewarm] Disabled")
+        return
+    log = _path(args.log)
+    entries = load_popularity([f"{log}.1", log, *(_path(path) for path in args.phrases)])[:args.top]
+    if not entries:
+        logger.info("[Prewarm] Nothing to pre-warm")
+        return
+    while True:
+        try:
+            if service.is_ready():
+                break
+        except OSError:
+            pass
+        time.sleep(1)
+    logger.info(f"[Prewarm] Pre-warming up to {len(entries)} entries")
+    PrewarmJob(entries).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+import argparse
+import os
+import subprocess
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import partial
+from typing import Dict, List, Optional
+
+from loguru import logger
+
+from config import MODEL_SERVER_SOCKET, RPC_SERVER_THREADS, RPC_JOB_RESULT_TTL_SEC
+from config import MODEL_REPLICAS, MODEL_REPLICA_SOCKET_DIR, MODEL_REPLICA_CPU_CORES
+from config import MODEL_REPLICA_LOAD_POLL_MS, MODEL_REPLICA_RESTART_DELAY_SEC
+from rpc import RPCClient, RPCServer
+from metrics import mark_process_dead
+from audio_cache import get_audio_cache, close_audio_cache
+from sentence_cache import get_sentence_cache, close_sentence_cache
+from coalescing import get_coalescer
+
+CPU_CORES_ENV = "LIXAUDIO_CPU_CORES"
+_THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+_CONTROL_TIMEOUT_SEC = 5.0
+
+# Methods whose result identifies server-side state that later calls must
+# reach again (result -> affinity key), and methods that carry such a key as
+# their first argument.
+_STICKY_RESULTS = {
+    "speechSynthesis_stream_start": lambda result: result,
+    "speechSynthesis_shared": lambda result: result and result["name"],
+    "speechSynthesis_shared_async": lambda result: result and result["name"],
+    "stt_session_open": lambda result: result,
+}
+_STICKY_ARGS = {
+    "speechSynthesis_stream_next": False,
+    "speechSynthesis_stream_close": True,
+    "release_shared_audio": True,
+    "stt_session_feed": False,
+    "stt_session_poll": False,
+    "stt_session_close": True,
+}
+_MAX_AFFINITIES = 4096
+
+
+def plan_placements(replicas: int, cores_per_replica: Optional[int] = None) -> List[Dict[str, str]]:
+    """
+    Environment overrides for each replica: one CUDA device each (round robin
+    when there are more replicas than GPUs) and a disjoint set of CPU cores
+    with matching torch / CTranslate2 / BLAS thread counts.
+    """
+    available = sorted(os.sched_getaffinity(0))
+    per_replica = cores_per_replica or max(1, len(available) // replicas)
+    try:
+        import torch
+        gpus = torch.cuda.device_count()
+    except ImportError:
+        gpus = 0
+
+    placements = []
+    for index in range(replicas):
+        cores = available[index * per_replica:(index + 1) * per_replica]
+        if not cores:
+            # More replicas than cores: wrap around rather than leave one unpinned.
+            start = (index * per_replica) % len(available)
+            cores = (available + available)[start:start + per_replica]
+        env = {CPU_CORES_ENV: ",".join(str(core) for core in cores)}
+        for var in _THREAD_ENV_VARS:
+            env[var] = str(len(cores))
+        if gpus:
+            env["CUDA_VISIBLE_DEVICES"] = str(index % gpus)
+        placements.append(env)
+    return placements
+
+
+def apply_replica_placement() -> Optional[int]:
+    """Pin the current process to the cores in its placement; returns the thread count."""
+    spec = os.environ.get(CPU_CORES_ENV)
+    if not spec:
+        return None
+    cores = {int(core) for core in spec.split(",") if core}
+    os.sched_setaffinity(0, cores)
+    import torch
+    torch.set_num_threads(len(cores))
+    torch.set_num_interop_threads(1)
+    return len(cores)
+
+
+class Replica:
+    def __init__(self, replica_id: int, socket_path: str, env: Dict[str, str]):
+        self.replica_id = replica_id
+        self.socket_path = socket_path
+        self.env = env
+        self.process: Optional[subprocess.Popen] = None
+        self.client: Optional[RPCClient] = None
+        self.pid: Optional[int] = None
+        self.reported_active = 0
+        self.inflight = 0
+        self.picked_at = 0
+
+    @property
+    def registered(self) -> bool:
+        return self.client is not None
+
+    def load(self):
+        # Ties go to the replica picked least recently, so idle replicas share sequential traffic.
+        return self.reported_active + self.inflight, self.inflight, self.picked_at
+
+
+class ReplicaRouter:
+    """
+    RPC target of the supervisor socket.
+
+    Any method not defined here is forwarded to the least-loaded registered
+    replica, where load is the replica's last reported
+    ``get_active_operations_count`` plus the calls this router has in flight
+    to it. Stream ids and shared-audio handles stay pinned to the replica
+    that created them.
+    """
+
+    def __init__(self, replicas: List[Replica]):
+        self._replicas = {replica.replica_id: replica for replica in replicas}
+        self._affinity: "OrderedDict[str, int]" = OrderedDict()
+        self._picks = 0
+        self._lock = threading.Lock()
+
+    def register_replica(self, replica_id: int, socket_path: str, pid: int):
+        with self._lock:
+            replica = self._replicas[replica_id]
+            if replica.client is not None:
+                replica.client.close()
+            replica.client = RPCClient(socket_path, timeout=_CONTROL_TIMEOUT_SEC)
+            replica.socket_path = socket_path
+            replica.pid = pid
+            replica.reported_active = 0
+            replica.inflight = 0
+        logger.info(f"[Supervisor] Replica {replica_id} registered (pid {pid}, {socket_path})")
+        return True
+
+    def deregister_replica(self, replica_id: int):
+        with self._lock:
+            replica = self._replicas.get(replica_id)
+            if replica is None or replica.client is None:
+                return False
+            client, replica.client = replica.client, None
+            for key in [key for key, owner in self._affinity.items() if owner == replica_id]:
+                del self._affinity[key]
+        client.close()
+        logger.info(f"[Supervisor] Replica {replica_id} deregistered")
+        return True
+
+    def list_replicas(self):
+        with self._lock:
+            return [
+                {
+                    "replica_id": replica.replica_id,
+                    "pid": replica.pid,
+                    "socket": replica.socket_path,
+                    "registered": replica.registered,
+                    "active": replica.reported_active,
+                    "inflight": replica.inflight,
+                    "cpu_cores": replica.env.get(CPU_CORES_ENV),
+                    "cuda_device": replica.env.get("CUDA_VISIBLE_DEVICES"),
+                }
+                for replica in self._replicas.values()
+            ]
+
+    def _registered(self) -> List[Replica]:
+        with self._lock:
+            return [replica for replica in self._replicas.values() if replica.registered]
+
+    def _gather(self, method: str, *args):
+        return {replica.replica_id: replica.client.call(method, *args) for replica in self._registered()}
+
+    def get_active_operations_count(self):
+        return sum(self._gather("get_active_operations_count").values())
+
+    def get_scheduler_stats(self):
+        return {str(replica_id): stats for replica_id, stats in self._gather("get_scheduler_stats").items()}
+
+    def get_voice_cache_stats(self):
+        return {str(replica_id): stats for replica_id, stats in self._gather("get_voice_cache_stats").items()}
+
+    def get_foreground_activity(self):
+        activity = list(self._gather("get_foreground_activity").values())
+        return {
+            "active": sum(entry["active"] for entry in activity),
+            "idle_sec": min((entry["idle_sec"] for entry in activity), default=0.0),
+        }
+
+    def get_queue_wait(self, reqID: str):
+        for wait in self._gather("get_queue_wait", reqID).values():
+            if wait is not None:
+                return wait
+        return None
+
+    # The response and sentence caches and the single-flight table are shared
+    # by all replicas, so the router owns them.
+    def cache_lookup(self, key: str):
+        return get_audio_cache().lookup(key)
+
+    def cache_store(self, key: str, data: bytes, kind: str = "wav", cost=None) -> str:
+        return get_audio_cache().store(key, data, kind, cost)
+
+    def cache_contains(self, key: str) -> bool:
+        return get_audio_cache().contains(key)
+
+    def get_audio_cache_stats(self):
+        return get_audio_cache().stats()
+
+    def sentence_cache_lookup(self, keys):
+        return get_sentence_cache().lookup(keys)
+
+    def sentence_cache_store(self, key: str, pcm: bytes, sample_rate: int):
+        get_sentence_cache().store(key, pcm, sample_rate)
+
+    def get_sentence_cache_stats(self):
+        return get_sentence_cache().stats()
+
+    def coalesce_join(self, key: str):
+        return get_coalescer().join(key)
+
+    def coalesce_complete(self, key: str, result=None):
+        get_coalescer().complete(key, result)
+
+    def get_coalescing_stats(self):
+        return get_coalescer().stats()
+
+    def cancel_request(self, reqID: str):
+        # Chunks of one request may be spread over every replica.
+        for replica in self._registered():
+            replica.client.call_async("cancel_request", reqID)
+
+    def is_ready(self) -> bool:
+        # Replicas register only after their warmup, so any registered replica can serve.
+        return bool(self._registered())
+
+    def get_readiness(self):
+        replicas = {str(replica_id): readiness for replica_id, readiness in self._gather("get_readiness").items()}
+        return {"ready": any(readiness.get("ready") for readiness in replicas.values()), "replicas": replicas}
+
+    def refresh_loads(self):
+        for replica in self._registered():
+            try:
+                replica.reported_active = replica.client.call("get_active_operations_count")
+            except Exception as e:
+                logger.warning(f"[Supervisor] Load poll of replica {replica.replica_id} failed: {e}")
+
+    def _pick(self, method: str, args: tuple) -> Replica:
+        with self._lock:
+            if method in _STICKY_ARGS and args:
+                owner = self._affinity.get(args[0])
+                if owner is not None and self._replicas[owner].registered:
+                    return self._replicas[owner]
+                for replica in self._replicas.values():
+                    # Pool segments are named lixaudio_<pid>_<n> by the replica that owns them.
+                    if replica.registered and str(args[0]).startswith(f"lixaudio_{replica.pid}_"):
+                        return replica
+            candidates = [replica for replica in self._replicas.values() if replica.registered]
+            if not candidates:
+                raise RuntimeError("No model server replica is available")
+            replica = min(candidates, key=Replica.load)
+            self._picks += 1
+            replica.picked_at = self._picks
+            return replica
+
+    def _forward(self, method: str, *args, **kwargs) -> Future:
+        replica = self._pick(method, args)
+        future = replica.client.call_async(method, *args, **kwargs)
+        with self._lock:
+            replica.inflight += 1
+        future.add_done_callback(partial(self._forwarded, replica, method, args))
+        return future
+
+    def _forwarded(self, replica: Replica, method: str, args: tuple, future: Future):
+        with self._lock:
+            replica.inflight -= 1
+            if future.cancelled() or future.exception() is not None:
+                return
+            result = future.result()
+            if method in _STICKY_RESULTS:
+                key = _STICKY_RESULTS[method](result)
+                if key:
+                    self._affinity[key] = replica.replica_id
+                    while len(self._affinity) > _MAX_AFFINITIES:
+                        self._affinity.popitem(last=False)
+            elif method in _STICKY_ARGS and args and (_STICKY_ARGS[method] or result is None):
+                # Released handles and finished streams no longer need routing.
+                self._affinity.pop(args[0], None)
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return partial(self._forward, name)
+
+
+class ReplicaSupervisor:
+    """Launches the replicas, restarts the ones that die and serves the router on the main socket."""
+
+    def __init__(self, replicas: int, socket_path: str = MODEL_SERVER_SOCKET, cores_per_replica: Optional[int] = MODEL_REPLICA_CPU_CORES):
+        os.makedirs(MODEL_REPLICA_SOCKET_DIR, exist_ok=True)
+        self.socket_path = socket_path
+        self.replicas = [
+            Replica(index, os.path.join(MODEL_REPLICA_SOCKET_DIR, f"replica_{index}.sock"), env)
+            for index, env in enumerate(plan_placements(replicas, cores_per_replica))
+        ]
+        self.router = ReplicaRouter(self.replicas)
+        self.rpc_server = RPCServer(self.router, socket_path, workers=RPC_SERVER_THREADS, job_ttl=RPC_JOB_RESULT_TTL_SEC)
+        self._stopping = threading.Event()
+
+    def _launch(self, replica: Replica):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_server.py")
+        env = dict(os.environ, **replica.env)
+        replica.process = subprocess.Popen(
+            [
+                sys.executable, script,
+                "--socket", replica.socket_path,
+                "--replica-id", str(replica.replica_id),
+                "--supervisor", self.socket_path,
+            ],
+            env=env,
+        )
+        placement = f"cores {replica.env[CPU_CORES_ENV]}"
+        if "CUDA_VISIBLE_DEVICES" in replica.env:
+            placement += f", cuda:{replica.env['CUDA_VISIBLE_DEVICES']}"
+        logger.info(f"[Supervisor] Launched replica {replica.replica_id} (pid {replica.process.pid}, {placement})")
+
+    def _monitor(self):
+        interval = MODEL_REPLICA_LOAD_POLL_MS / 1000.0
+        announced = False
+        while not self._stopping.wait(interval):
+            if not announced and all(replica.registered for replica in self.replicas):
+                print(f"[SERVER_READY] {len(self.replicas)} replica(s) registered", flush=True)
+                announced = True
+            for replica in self.replicas:
+                if replica.process is None or replica.process.poll() is None:
+                    continue
+                logger.error(f"[Supervisor] Replica {replica.replica_id} exited with code {replica.process.returncode}")
+                mark_process_dead(replica.process.pid)
+                self.router.deregister_replica(replica.replica_id)
+                replica.process = None
+                threading.Timer(MODEL_REPLICA_RESTART_DELAY_SEC, self._restart, args=(replica,)).start()
+            self.router.refresh_loads()
+
+    def _restart(self, replica: Replica):
+        if not self._stopping.is_set():
+            self._launch(replica)
+
+    def serve_forever(self):
+        # The router socket has to be up before the replicas try to register.
+        self.rpc_server.start()
+        for replica in self.replicas:
+            self._launch(replica)
+        threading.Thread(target=self._monitor, name="ReplicaMonitor", daemon=True).start()
+        print(f"[Supervisor] Routing {self.socket_path} across {len(self.replicas)} replica(s)")
+        try:
+            self.rpc_server.serve_forever()
+        finally:
+            self.stop()
+
+    def stop(self):
+        self._stopping.set()
+        for replica in self.replicas:
+            if replica.process is not None and replica.process.poll() is None:
+                replica.process.terminate()
+        for replica in self.replicas:
+            if replica.process is not None:
+                try:
+                    replica.process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    replica.process.kill()
+        self.rpc_server.stop()
+        close_audio_cache()
+        close_sentence_cache()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run several model server replicas behind one socket")
+    parser.add_argument("--replicas", type=int, default=MODEL_REPLICAS)
+    parser.add_argument("--cores-per-replica", type=int, default=MODEL_REPLICA_CPU_CORES)
+    args = parser.parse_args()
+    supervisor = ReplicaSupervisor(args.replicas, cores_per_replica=args.cores_per_replica)
+    try:
+        supervisor.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down supervisor...")
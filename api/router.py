@@ -0,0 +1,95 @@
+"""
+Local pipeline router for /generate.
+
+Most requests are mechanical to route: the input modality picks between the
+speech (STS, STT) and text (TTS, TTT) families, and only an explicit request
+for a written answer moves a request to the text-output pipeline of its
+family. ``classify`` scores a request and ``is_clear_cut`` tells whether
+that is good enough to skip the LLM router in server.py. Every decision,
+local or not, is appended to the audit log with its confidence.
+"""
+import math
+import re
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+from loguru import logger
+
+from audio_cache import append_jsonl
+from config import ROUTER_LOCAL_ENABLED, ROUTER_MIN_CONFIDENCE, ROUTER_AUDIT_LOG, ROUTER_AUDIT_LOG_MAX_MB
+from metrics import ROUTER_DECISIONS
+
+# Cues for "the user wants text back, not audio", as (pattern, weight) of a
+# logistic score. The bias makes audio the default, as the LLM router's rules
+# do; negative weights are cues for spoken output.
+_BIAS = -3.0
+_CUES: List[Tuple[re.Pattern, float]] = [(re.compile(pattern, re.IGNORECASE), weight) for pattern, weight in (
+    (r"\b(text|written|writing)[ -](only|response|reply|answer|format|output)\b", 6.0),
+    (r"\b(reply|respond|answer|output)\s+(in|with|as|via)\s+(plain\s+)?(text|writing)\b", 6.0),
+    (r"\b(no|without)\s+(audio|voice|speech|sound)\b", 6.0),
+    (r"\b(don'?t|do not|never)\s+(speak|talk|read\b.*\b(aloud|out loud)|say it|use (audio|voice))", 5.0),
+    (r"\b(just|only)\s+(write|type|text)\b", 5.0),
+    (r"\btranscri(be|bed|ption|pt)\b", 5.5),
+    (r"\b(in|as)\s+(a\s+)?(text|written)\b", 2.5),
+    (r"\b(write|summari[sz]e|list|bullet points?)\b", 1.0),
+    (r"\b(say|speak|narrate|pronounce|sing|voice ?over|tell me)\b", -2.0),
+    (r"\b(read\b.*\b(aloud|out)|out loud|aloud|spoken|audio)\b", -1.5),
+)]
+
+
+class RouteDecision(NamedTuple):
+    pipeline: str
+    # None for decisions of the LLM router.
+    confidence: Optional[float]
+    source: str
+    reason: str
+
+
+def _text_output_probability(text: str, system: Optional[str]) -> Tuple[float, List[str]]:
+    prompt = f"{text}\n{system or ''}"
+    score = _BIAS
+    matched = []
+    for pattern, weight in _CUES:
+        match = pattern.search(prompt)
+        if match:
+            score += weight
+            matched.append(match.group(0).lower())
+    return 1.0 / (1.0 + math.exp(-score)), matched
+
+
+def classify(text: str, system: Optional[str], has_audio: bool) -> RouteDecision:
+    """The most likely pipeline and how sure the local rules are of it."""
+    probability, matched = _text_output_probability(text, system)
+    if has_audio:
+        pipeline = "generate_stt" if probability >= 0.5 else "generate_sts"
+    else:
+        pipeline = "generate_ttt" if probability >= 0.5 else "generate_tts"
+    confidence = max(probability, 1.0 - probability)
+    if matched:
+        return RouteDecision(pipeline, confidence, "classifier", f"cues: {', '.join(matched)}")
+    return RouteDecision(pipeline, confidence, "rules", "speech input" if has_audio else "text input")
+
+
+def is_clear_cut(decision: RouteDecision) -> bool:
+    return ROUTER_LOCAL_ENABLED and decision.confidence >= ROUTER_MIN_CONFIDENCE
+
+
+def audit(reqID: str, decision: RouteDecision, has_audio: bool, local: Optional[RouteDecision] = None):
+    """Record a routing decision; ``local`` is the local guess an LLM decision overrode."""
+    ROUTER_DECISIONS.labels(decision.source, decision.pipeline).inc()
+    record = {
+        "ts": round(time.time(), 3),
+        "reqID": reqID,
+        "pipeline": decision.pipeline,
+        "confidence": None if decision.confidence is None else round(decision.confidence, 4),
+        "source": decision.source,
+        "reason": decision.reason,
+        "has_audio": has_audio,
+    }
+    if local is not None:
+        record["local_pipeline"] = local.pipeline
+        record["local_confidence"] = round(local.confidence, 4)
+    try:
+        append_jsonl(ROUTER_AUDIT_LOG, record, ROUTER_AUDIT_LOG_MAX_MB)
+    except OSError as e:
+        logger.debug(f"[{reqID}] Failed to write the routing audit record: {e}")
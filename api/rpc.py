@@ -0,0 +1,434 @@
+import os
+import socket
+import struct
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import count
+from typing import Any, Dict, List, Optional
+
+import msgpack
+import numpy as np
+from loguru import logger
+
+from deadlines import current_deadline
+
+_HEADER = struct.Struct(">I")
+_NDARRAY_EXT = 1
+
+
+class RemoteError(Exception):
+    """Raised on the client when the remote method raised."""
+
+    def __init__(self, type_name: str, message: str):
+        super().__init__(f"{type_name}: {message}")
+        self.type_name = type_name
+        self.remote_message = message
+
+
+def _describe_error(error: BaseException):
+    # Errors relayed from another RPC hop keep their original type name.
+    if isinstance(error, RemoteError):
+        return error.type_name, error.remote_message
+    return type(error).__name__, str(error)
+
+
+def pack(message: dict) -> List[Any]:
+    """
+    Encode a message as a list of buffers ready for ``sendmsg``.
+
+    Frame layout: 4-byte body length, 4-byte header length, msgpack header,
+    then the raw bytes of every numpy array in the message. Arrays are
+    replaced in the header by an ext record (dtype, shape, offset, nbytes)
+    pointing into the attachment area, so audio is never copied into the
+    msgpack body.
+    """
+    attachments: List[memoryview] = []
+    offset = 0
+
+    def default(obj: Any):
+        nonlocal offset
+        if isinstance(obj, np.ndarray):
+            array = np.ascontiguousarray(obj)
+            record = msgpack.packb([array.dtype.str, list(array.shape), offset, array.nbytes])
+            attachments.append(memoryview(array).cast("B") if array.nbytes else memoryview(b""))
+            offset += array.nbytes
+            return msgpack.ExtType(_NDARRAY_EXT, record)
+        if isinstance(obj, np.generic):
+            return obj.item()
+        raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+    header = msgpack.packb(message, default=default, use_bin_type=True)
+    body_len = _HEADER.size + len(header) + offset
+    return [_HEADER.pack(body_len) + _HEADER.pack(len(header)) + header, *attachments]
+
+
+def unpack(body: bytearray) -> dict:
+    (header_len,) = _HEADER.unpack_from(body)
+    base = _HEADER.size + header_len
+
+    def ext_hook(code: int, data: bytes):
+        if code == _NDARRAY_EXT:
+            dtype, shape, offset, nbytes = msgpack.unpackb(data)
+            dtype = np.dtype(dtype)
+            # A view on the received frame, no extra copy.
+            return np.frombuffer(body, dtype=dtype, count=nbytes // dtype.itemsize, offset=base + offset).reshape(shape)
+        return msgpack.ExtType(code, data)
+
+    return msgpack.unpackb(memoryview(body)[_HEADER.size:base], ext_hook=ext_hook, raw=False)
+
+
+def send_frame(sock: socket.socket, buffers: List[Any]):
+    views = [memoryview(buffer) for buffer in buffers if len(buffer)]
+    while views:
+        sent = sock.sendmsg(views)
+        while sent:
+            if sent >= len(views[0]):
+                sent -= len(views[0])
+                views.pop(0)
+            else:
+                views[0] = views[0][sent:]
+                sent = 0
+
+
+def _recv_exact(sock: socket.socket, size: int) -> Optional[bytearray]:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            return None
+        received += n
+    return buf
+
+
+def read_frame(sock: socket.socket) -> Optional[dict]:
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    (length,) = _HEADER.unpack(header)
+    body = _recv_exact(sock, length)
+    if body is None:
+        return None
+    return unpack(body)
+
+
+class RPCServer:
+    """
+    Serves the public methods of ``target`` over a Unix domain socket.
+
+    Frames are length-prefixed msgpack headers with raw array attachments. Calls are
+    tagged with a client-chosen id and executed on a thread pool, so one
+    connection carries many in-flight requests and responses come back in
+    completion order. numpy arrays and bytes travel as raw binary.
+
+    A ``submit`` message runs the method as a job: the server acknowledges
+    with a job id straight away and pushes a ``done``/``failed`` frame when it
+    finishes. If the method returns a ``Future`` the job completes with the
+    future, so no server thread waits on it. Results that could not be
+    delivered are kept for ``job_ttl`` seconds for ``poll``.
+    """
+
+    def __init__(self, target: Any, path: str, workers: int, job_ttl: float = 120.0):
+        self.target = target
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="RPC")
+        self._sock: Optional[socket.socket] = None
+        self._stopped = threading.Event()
+        self._job_ttl = job_ttl
+        self._jobs: Dict[str, dict] = {}
+        self._jobs_lock = threading.Lock()
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self._sock.listen(128)
+        threading.Thread(target=self._accept_loop, name="RPCAccept", daemon=True).start()
+        logger.info(f"RPC server listening on {self.path}")
+
+    def serve_forever(self):
+        if self._sock is None:
+            self.start()
+        self._stopped.wait()
+
+    def stop(self):
+        self._stopped.set()
+        if self._sock is not None:
+            self._sock.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._executor.shutdown(wait=False)
+
+    def _accept_loop(self):
+        while not self._stopped.is_set():
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._connection_loop, args=(conn,), name="RPCConn", daemon=True).start()
+
+    def _connection_loop(self, conn: socket.socket):
+        write_lock = threading.Lock()
+
+        def send(message: dict):
+            buffers = pack(message)
+            with write_lock:
+                send_frame(conn, buffers)
+
+        try:
+            while True:
+                message = read_frame(conn)
+                if message is None:
+                    return
+                kind = message.get("t")
+                if kind == "submit":
+                    self._executor.submit(self._handle_submit, message, send)
+                elif kind == "poll":
+                    self._executor.submit(self._handle_poll, message, send)
+                else:
+                    self._executor.submit(self._handle_call, message, send)
+        except OSError:
+            return
+        finally:
+            conn.close()
+
+    def _invoke(self, message: dict) -> Any:
+        method = message.get("m", "")
+        if method.startswith("_") or not callable(getattr(self.target, method, None)):
+            raise AttributeError(f"Unknown method '{method}'")
+        # The caller's deadline is visible to the method and to any call it makes onwards.
+        token = current_deadline.set(message.get("dl"))
+        try:
+            return getattr(self.target, method)(*message.get("a", ()), **message.get("k", {}))
+        finally:
+            current_deadline.reset(token)
+
+    def _handle_call(self, message: dict, send):
+        call_id = message.get("id")
+        method = message.get("m", "")
+        try:
+            result = self._invoke(message)
+            if isinstance(result, Future):
+                result.add_done_callback(lambda future: self._reply_from_future(call_id, method, send, future))
+                return
+            reply = {"t": "result", "id": call_id, "r": result}
+        except Exception as e:
+            name, text = _describe_error(e)
+            reply = {"t": "error", "id": call_id, "e": name, "msg": text}
+        self._reply(call_id, method, send, reply)
+
+    def _reply_from_future(self, call_id, method: str, send, future: Future):
+        try:
+            reply = {"t": "result", "id": call_id, "r": future.result()}
+        except BaseException as e:
+            name, text = _describe_error(e)
+            reply = {"t": "error", "id": call_id, "e": name, "msg": text}
+        try:
+            self._executor.submit(self._reply, call_id, method, send, reply)
+        except RuntimeError:
+            self._reply(call_id, method, send, reply)
+
+    def _reply(self, call_id, method: str, send, reply: dict):
+        try:
+            send(reply)
+        except TypeError as e:
+            send({"t": "error", "id": call_id, "e": "TypeError", "msg": str(e)})
+        except OSError:
+            logger.debug(f"Client went away before reply to {method}")
+
+    def _handle_submit(self, message: dict, send):
+        job_id = uuid.uuid4().hex
+        with self._jobs_lock:
+            self._purge_jobs()
+            self._jobs[job_id] = {"status": "pending", "method": message.get("m", ""), "finished_at": None}
+        try:
+            send({"t": "accepted", "id": message.get("id"), "job": job_id})
+        except OSError:
+            pass  # Still run the job; the client can poll for it after reconnecting.
+        try:
+            result = self._invoke(message)
+        except Exception as e:
+            self._finish_job(job_id, send, error=e)
+            return
+        if isinstance(result, Future):
+            result.add_done_callback(lambda future: self._complete_from_future(job_id, send, future))
+        else:
+            self._finish_job(job_id, send, result=result)
+
+    def _complete_from_future(self, job_id: str, send, future: Future):
+        # Runs on whichever thread resolved the future (usually a lane worker);
+        # the notification is written from the RPC pool instead.
+        try:
+            result, error = future.result(), None
+        except BaseException as e:
+            result, error = None, e
+        try:
+            self._executor.submit(self._finish_job, job_id, send, result, error)
+        except RuntimeError:
+            self._finish_job(job_id, send, result, error)
+
+    def _finish_job(self, job_id: str, send, result: Any = None, error: Optional[BaseException] = None):
+        if error is None:
+            notice = {"t": "done", "job": job_id, "r": result}
+        else:
+            name, text = _describe_error(error)
+            notice = {"t": "failed", "job": job_id, "e": name, "msg": text}
+        try:
+            try:
+                send(notice)
+            except TypeError as e:
+                notice = {"t": "failed", "job": job_id, "e": "TypeError", "msg": str(e)}
+                send(notice)
+        except OSError:
+            # Keep the outcome around so the client can poll for it.
+            with self._jobs_lock:
+                job = self._jobs.get(job_id)
+                if job is not None:
+                    job.update(notice, status=notice["t"], finished_at=time.time())
+            logger.debug(f"Client went away before job {job_id} finished")
+            return
+        with self._jobs_lock:
+            self._jobs.pop(job_id, None)
+
+    def _handle_poll(self, message: dict, send):
+        with self._jobs_lock:
+            job = self._jobs.get(message.get("job"))
+            if job is None:
+                status = {"status": "unknown"}
+            else:
+                status = {key: job[key] for key in ("status", "r", "e", "msg") if key in job}
+        try:
+            send({"t": "result", "id": message.get("id"), "r": status})
+        except OSError:
+            pass
+
+    def _purge_jobs(self):
+        cutoff = time.time() - self._job_ttl
+        for job_id, job in list(self._jobs.items()):
+            if job["finished_at"] is not None and job["finished_at"] < cutoff:
+                del self._jobs[job_id]
+
+
+class RPCClient:
+    """
+    Multiplexing client for ``RPCServer``: one socket per process, any number
+    of threads calling concurrently. Reconnects after fork or connection loss.
+
+    ``submit`` returns a ``Future`` that resolves from the server's completion
+    notification; its ``job_id`` attribute is set once the server accepts it.
+    Calls made while ``current_deadline`` is set carry that deadline.
+    """
+
+    def __init__(self, path: str, timeout: Optional[float] = None):
+        self.path = path
+        self.timeout = timeout
+        self._sock: Optional[socket.socket] = None
+        self._pid: Optional[int] = None
+        self._pending: Dict[int, Future] = {}
+        self._jobs: Dict[str, Future] = {}
+        self._ids = count()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def _ensure_connected(self) -> socket.socket:
+        with self._lock:
+            if self._sock is not None and self._pid == os.getpid():
+                return self._sock
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.path)
+            self._sock = sock
+            self._pid = os.getpid()
+            self._pending = {}
+            self._jobs = {}
+            threading.Thread(target=self._reader_loop, args=(sock,), name="RPCReader", daemon=True).start()
+            return sock
+
+    def _reader_loop(self, sock: socket.socket):
+        try:
+            while True:
+                message = read_frame(sock)
+                if message is None:
+                    break
+                self._dispatch(message)
+        except OSError:
+            pass
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+            if self._sock is None:
+                pending = list(self._pending.values()) + list(self._jobs.values())
+                self._pending, self._jobs = {}, {}
+            else:
+                pending = []
+        for future in pending:
+            if not future.done():
+                future.set_exception(ConnectionError(f"Lost connection to model server at {self.path}"))
+
+    def _dispatch(self, message: dict):
+        kind = message.get("t")
+        with self._lock:
+            if kind in ("done", "failed"):
+                future = self._jobs.pop(message.get("job"), None)
+            elif kind == "accepted":
+                future = self._pending.pop(message.get("id"), None)
+                if future is not None:
+                    future.job_id = message.get("job")
+                    self._jobs[future.job_id] = future
+                return
+            else:
+                future = self._pending.pop(message.get("id"), None)
+        if future is None:
+            return
+        if kind in ("error", "failed"):
+            future.set_exception(RemoteError(message.get("e", "Exception"), message.get("msg", "")))
+        else:
+            future.set_result(message.get("r"))
+
+    def _send(self, message: dict) -> Future:
+        sock = self._ensure_connected()
+        future: Future = Future()
+        future.job_id = None
+        call_id = next(self._ids)
+        with self._lock:
+            self._pending[call_id] = future
+        buffers = pack(dict(message, id=call_id))
+        try:
+            with self._write_lock:
+                send_frame(sock, buffers)
+        except OSError as e:
+            with self._lock:
+                self._pending.pop(call_id, None)
+                if self._sock is sock:
+                    self._sock = None
+            raise ConnectionError(f"Failed to reach model server at {self.path}: {e}") from e
+        return future
+
+    def _request(self, kind: str, method: str, args: tuple, kwargs: dict) -> Future:
+        message = {"t": kind, "m": method, "a": list(args), "k": kwargs}
+        deadline = current_deadline.get()
+        if deadline is not None:
+            message["dl"] = deadline
+        return self._send(message)
+
+    def call_async(self, method: str, *args: Any, **kwargs: Any) -> Future:
+        return self._request("call", method, args, kwargs)
+
+    def submit(self, method: str, *args: Any, **kwargs: Any) -> Future:
+        return self._request("submit", method, args, kwargs)
+
+    def poll(self, job_id: str) -> dict:
+        return self._send({"t": "poll", "job": job_id}).result(timeout=self.timeout)
+
+    def call(self, method: str, *args: Any, **kwargs: Any) -> Any:
+        return self.call_async(method, *args, **kwargs).result(timeout=self.timeout)
+
+    def close(self):
+        with self._lock:
+            sock, self._sock = self._sock, None
+        if sock is not None:
+            sock.close()
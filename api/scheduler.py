@@ -0,0 +1,340 @@
+import contextvars
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from loguru import logger
+
+from deadlines import current_deadline
+from metrics import ABANDONED_SECONDS, ABANDONED_WORK, LOCK_HOLD, QUEUE_WAIT
+
+PRIORITY_CLASSES = {
+    "interactive": 0,
+    "default": 1,
+    "background": 2,
+}
+
+
+def then(future: Future, fn: Callable[[Any], Any]) -> Future:
+    """Future for ``fn(future.result())``; ``fn`` runs on the thread that resolves ``future``."""
+    chained: Future = Future()
+
+    def _done(source: Future):
+        if source.cancelled():
+            chained.cancel()
+            return
+        try:
+            chained.set_result(fn(source.result()))
+        except Exception as e:
+            chained.set_exception(e)
+
+    future.add_done_callback(_done)
+    return chained
+
+
+class ScheduledJob:
+    __slots__ = (
+        "op", "fn", "args", "cost", "priority", "job_id", "request_id", "deadline", "context",
+        "future", "enqueued_at", "started_at",
+    )
+
+    def __init__(
+        self,
+        op: str,
+        fn: Callable,
+        args: tuple,
+        cost: float,
+        priority: str,
+        job_id: Optional[str],
+        request_id: Optional[str],
+        deadline: Optional[float],
+    ):
+        self.op = op
+        self.fn = fn
+        self.args = args
+        self.cost = cost
+        self.priority = priority
+        self.job_id = job_id
+        self.request_id = request_id
+        self.deadline = deadline
+        # The job runs in the submitter's context, so it sees the same deadline.
+        self.context = contextvars.copy_context()
+        self.future: Future = Future()
+        self.enqueued_at = time.time()
+        self.started_at: Optional[float] = None
+
+    @property
+    def wait_time(self) -> float:
+        return (self.started_at or time.time()) - self.enqueued_at
+
+
+class OperationScheduler:
+    """
+    Worker pool that dispatches jobs from per-operation queues.
+
+    The next job is the one with the lowest score across all queues, where
+    score = priority_class * priority_step + estimated_cost - aging_rate * waited.
+    Cost is an estimate in seconds, so inside a priority class this is
+    shortest-job-first, and aging guarantees long or low-priority jobs are
+    eventually picked while short interactive work keeps arriving.
+
+    Jobs above the background class count as foreground traffic; background
+    work (warmup, cache pre-warming) checks ``foreground_activity`` to stay
+    out of its way.
+
+    ``check_abandoned(deadline, request_id)`` returns the error for a job
+    nobody waits for any more; such jobs are failed with it when a worker
+    next looks at the queues instead of being run.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        operations: Iterable[str],
+        workers: int,
+        aging_rate: float,
+        priority_step: float,
+        wait_history: int = 512,
+        check_abandoned: Optional[Callable[[Optional[float], Optional[str]], Optional[BaseException]]] = None,
+    ):
+        self.name = name
+        self._check_abandoned = check_abandoned
+        self._aging_rate = aging_rate
+        self._priority_step = priority_step
+        self._queues: Dict[str, list] = {op: [] for op in operations}
+        self._cond = threading.Condition()
+        self._shutdown = False
+        self._waits: "OrderedDict[str, float]" = OrderedDict()
+        self._wait_history_size = wait_history
+        self._wait_history: Dict[str, deque] = {op: deque(maxlen=wait_history) for op in self._queues}
+        self._running = 0
+        self._foreground = 0
+        self._last_foreground = 0.0
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"{name}_{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(
+        self,
+        op: str,
+        fn: Callable,
+        *args: Any,
+        cost: float = 1.0,
+        priority: str = "default",
+        job_id: Optional[str] = None,
+        request_id: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ) -> Future:
+        """``deadline`` defaults to the caller's ``current_deadline``, ``request_id`` to ``job_id``."""
+        if op not in self._queues:
+            raise ValueError(f"Unknown operation '{op}' for scheduler {self.name}")
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class '{priority}'")
+        if deadline is None:
+            deadline = current_deadline.get()
+        job = ScheduledJob(op, fn, args, max(0.0, float(cost)), priority, job_id, request_id or job_id, deadline)
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError(f"Scheduler {self.name} is shut down")
+            self._queues[op].append(job)
+            if job.priority != "background":
+                self._foreground += 1
+                self._last_foreground = job.enqueued_at
+            self._cond.notify()
+        return job.future
+
+    def _score(self, job: ScheduledJob, now: float) -> float:
+        waited = now - job.enqueued_at
+        return PRIORITY_CLASSES[job.priority] * self._priority_step + job.cost - self._aging_rate * waited
+
+    def _pop_next(self, abandoned: list) -> Optional[ScheduledJob]:
+        now = time.time()
+        best = None
+        best_score = None
+        for queue in self._queues.values():
+            if self._check_abandoned is not None:
+                for job in list(queue):
+                    error = self._check_abandoned(job.deadline, job.request_id)
+                    if error is not None:
+                        queue.remove(job)
+                        abandoned.append((job, error))
+            for job in queue:
+                score = self._score(job, now)
+                if best is None or score < best_score:
+                    best, best_score = job, score
+        if best is not None:
+            self._queues[best.op].remove(best)
+        return best
+
+    def _worker(self):
+        while True:
+            abandoned = []
+            with self._cond:
+                job = self._pop_next(abandoned)
+                while job is None and not abandoned:
+                    if self._shutdown:
+                        return
+                    self._cond.wait()
+                    job = self._pop_next(abandoned)
+                if job is not None:
+                    self._running += 1
+
+            # Futures are failed outside the lock: their callbacks may submit more work.
+            for dropped, error in abandoned:
+                self._drop(dropped, error)
+            if job is None:
+                continue
+
+            job.started_at = time.time()
+            # Jobs without an id (e.g. an STT batch) record the waits of the
+            # requests they carry themselves.
+            if job.job_id is not None:
+                self.record_wait(job.op, job.job_id, job.wait_time)
+            try:
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    result = job.context.run(job.fn, *job.args)
+                except BaseException as e:
+                    job.future.set_exception(e)
+                else:
+                    job.future.set_result(result)
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._done(job)
+
+    def _done(self, job: ScheduledJob):
+        if job.priority != "background":
+            self._foreground -= 1
+            self._last_foreground = time.time()
+
+    def _drop(self, job: ScheduledJob, error: BaseException):
+        with self._cond:
+            self._done(job)
+        if not job.future.set_running_or_notify_cancel():
+            return
+        ABANDONED_WORK.labels(job.op, "queued", getattr(error, "reason", "abandoned")).inc()
+        ABANDONED_SECONDS.labels(job.op, getattr(error, "reason", "abandoned")).inc(job.cost)
+        logger.info(f"[{self.name}] Dropped queued {job.op} job {job.request_id}: {error}")
+        job.future.set_exception(error)
+
+    def record_wait(self, op: str, job_id: Optional[str], seconds: float):
+        QUEUE_WAIT.labels(op).observe(seconds)
+        with self._cond:
+            self._wait_history[op].append(seconds)
+            if job_id is not None:
+                self._waits[job_id] = seconds
+                self._waits.move_to_end(job_id)
+                while len(self._waits) > self._wait_history_size:
+                    self._waits.popitem(last=False)
+        if seconds > 1.0:
+            logger.info(f"[{self.name}] {op} job {job_id} waited {seconds:.2f}s in queue")
+
+    def get_queue_wait(self, job_id: str) -> Optional[float]:
+        with self._cond:
+            return self._waits.get(job_id)
+
+    def foreground_activity(self) -> Tuple[int, float]:
+        """Foreground jobs queued or running, and when the last one was submitted or finished."""
+        with self._cond:
+            return self._foreground, self._last_foreground
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = {}
+            for op, queue in self._queues.items():
+                waits = sorted(self._wait_history[op])
+                stats[op] = {
+                    "queued": len(queue),
+                    "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+                    "wait_p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] if waits else 0.0,
+                }
+            stats["running"] = self._running
+            return stats
+
+    def shutdown(self, wait: bool = True, timeout: Optional[float] = None):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join(timeout=timeout)
+
+
+class ExecutionLane:
+    """
+    Execution context for one engine: its own worker pool and queues, its own
+    concurrency limit and, when ``serialize`` is set, an engine-wide lock held
+    for the duration of each job. Engines that are safe to call concurrently
+    (CTranslate2 with ``num_workers`` > 1) run with ``serialize=False``.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        operations: Iterable[str],
+        workers: int,
+        max_concurrent: int,
+        serialize: bool,
+        aging_rate: float,
+        priority_step: float,
+        check_abandoned: Optional[Callable[[Optional[float], Optional[str]], Optional[BaseException]]] = None,
+    ):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.serialize = serialize
+        self._semaphore = threading.Semaphore(max_concurrent)
+        self._engine_lock = threading.Lock() if serialize else nullcontext()
+        self._active = 0
+        self._active_lock = threading.Lock()
+        self.scheduler = OperationScheduler(
+            name,
+            operations=operations,
+            workers=workers,
+            aging_rate=aging_rate,
+            priority_step=priority_step,
+            check_abandoned=check_abandoned,
+        )
+
+    @contextmanager
+    def slot(self):
+        with self._semaphore:
+            with self._active_lock:
+                self._active += 1
+            try:
+                with self._engine_lock:
+                    acquired = time.time()
+                    try:
+                        yield
+                    finally:
+                        LOCK_HOLD.labels(self.name).observe(time.time() - acquired)
+            finally:
+                with self._active_lock:
+                    self._active -= 1
+
+    def submit(self, op: str, fn: Callable, *args: Any, **kwargs: Any) -> Future:
+        return self.scheduler.submit(op, fn, *args, **kwargs)
+
+    def active_count(self) -> int:
+        with self._active_lock:
+            return self._active
+
+    def stats(self) -> Dict[str, Any]:
+        stats = self.scheduler.stats()
+        stats["active"] = self.active_count()
+        stats["max_concurrent"] = self.max_concurrent
+        return stats
+
+    def shutdown(self, wait: bool = True, timeout: Optional[float] = None):
+        self.scheduler.shutdown(wait=wait, timeout=timeout)
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from audio_cache import HotTier
+from config import SENTENCE_CACHE_MAX_MB, TTS_MODEL, TTS_SAMPLING, ENGINE_PROFILE, ENGINE_QUANTIZE_COMPONENTS
+from metrics import CACHE_HITS, CACHE_MISSES
+from shm_transport import open_shared_bytes
+from voiceMap import VOICE_BASE64_MAP
+
+# Anything that changes how a sentence sounds for the same text and voice.
+ENGINE_SETTINGS = json.dumps(
+    {"model": TTS_MODEL, "sampling": TTS_SAMPLING, "profile": ENGINE_PROFILE, "quantize": list(ENGINE_QUANTIZE_COMPONENTS)},
+    sort_keys=True,
+)
+_BUILTIN_VOICES = set(VOICE_BASE64_MAP.values())
+_QUOTES = str.maketrans({"‘": "'", "’": "'", "“": '"', "”": '"'})
+
+
+def normalize_sentence(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).translate(_QUOTES).split())
+
+
+@lru_cache(maxsize=256)
+def _file_digest(path: str, mtime: float, size: int) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def voice_identity(clone_path: Optional[str]) -> str:
+    """Built-in voices by path; uploaded references (one temp path per request) by content."""
+    if not clone_path or clone_path in _BUILTIN_VOICES:
+        return clone_path or ""
+    stat = os.stat(clone_path)
+    return _file_digest(clone_path, stat.st_mtime, stat.st_size)
+
+
+def sentence_key(sentence: str, voice: str) -> str:
+    material = "\x00".join((normalize_sentence(sentence), voice, ENGINE_SETTINGS))
+    return hashlib.sha1(material.encode("utf-8")).hexdigest()
+
+
+def read_sentence(handle: dict) -> Optional[np.ndarray]:
+    """Float samples of a cached sentence, on the API side; None if it was evicted in between."""
+    try:
+        shm, view = open_shared_bytes(handle)
+    except FileNotFoundError:
+        return None
+    try:
+        return np.frombuffer(view, dtype="<i2").astype(np.float32) / 32767.0
+    finally:
+        view.release()
+        shm.close()
+
+
+class SentenceCache:
+    """
+    Rendered sentences (silence-trimmed 16-bit PCM) in shared memory, LRU
+    bounded by ``max_bytes``. Lookups and stores take keys from
+    ``sentence_key``; hits and misses are counted per sentence, apart from
+    the whole-response cache.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.tier = HotTier(max_bytes, name="sentence_audio", prefix="lixaudio_snt")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.hit_seconds = 0.0
+        self.stores = 0
+
+    def lookup(self, keys: List[str]) -> Dict[str, dict]:
+        """Handles (with ``sample_rate``) of the cached ones among ``keys``."""
+        found = {}
+        for key in keys:
+            handle = self.tier.get(key)
+            if handle is not None:
+                found[key] = handle
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+            self.hit_seconds += sum(handle["nbytes"] / 2 / handle["sample_rate"] for handle in found.values())
+        if found:
+            CACHE_HITS.labels("sentence_audio").inc(len(found))
+        if len(keys) > len(found):
+            CACHE_MISSES.labels("sentence_audio").inc(len(keys) - len(found))
+        return found
+
+    def store(self, key: str, pcm: bytes, sample_rate: int):
+        if self.tier.put(key, pcm, sample_rate=sample_rate) is not None:
+            with self._lock:
+                self.stores += 1
+
+    def close(self):
+        self.tier.close()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                **self.tier.stats(),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "audio_seconds_served": round(self.hit_seconds, 1),
+                "stores": self.stores,
+            }
+
+
+_cache: Optional[SentenceCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_sentence_cache() -> SentenceCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SentenceCache(int(SENTENCE_CACHE_MAX_MB * 1024 * 1024))
+        return _cache
+
+
+def close_sentence_cache():
+    with _cache_lock:
+        if _cache is not None:
+            _cache.close()
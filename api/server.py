@@ -5,11 +5,15 @@ import random
 import logging
 import asyncio
 import shutil
+import time
 from typing import Optional
 import torch
 import torchaudio
 from tools import tools
 from config import POLLINATIONS_ENDPOINT_TEXT, TRIAL_MODE, STORE_CACHE, POLLINATIONS_MODEL
+from metrics import LLM_CALLS
+from router import RouteDecision, audit, classify, is_clear_cut
+from model_client import service
 from utility import encode_audio_base64, save_temp_audio, validate_and_decode_base64_audio
 from requestID import reqID
 from voiceMap import VOICE_BASE64_MAP
@@ -25,13 +29,151 @@ POLLINATIONS_TOKEN = os.getenv("POLLI_TOKEN")
 
 
 
+async def execute_pipeline(
+    fn_name: str,
+    fn_args: dict,
+    reqID: str,
+    higgs_dir: str,
+    pipeline_start: float,
+    store_key: Optional[str] = None,
+    priority: str = "interactive"
+) -> Optional[dict]:
+    """
+    Run the pipeline the router picked (``generate_tts``, ...) with its tool
+    arguments; None for an unknown pipeline or in TRIAL_MODE.
+    """
+    if TRIAL_MODE:
+        return None
+    gen_audio_path = "N/A"
+    try:
+        if fn_name == "generate_tts":
+            from tts import generate_tts 
+            logger.info(f"[{reqID}] Calling TTS pipeline")
+            audio_bytes, sample_rate = await generate_tts(
+                text=fn_args.get("text"),
+                requestID=fn_args.get("requestID"),
+                system=fn_args.get("system"),
+                voice=fn_args.get("voice"),
+                priority=priority,
+            )
+
+
+            if store_key:
+                gen_audio_path = service.cache_store(store_key, audio_bytes, cost=time.time() - pipeline_start)
+                logger.info(f"[{reqID}] TTS audio saved to: {gen_audio_path}")
+
+
+            return {
+                "type": "audio",
+                "data": audio_bytes,
+                "file_path": gen_audio_path or "N/A",
+                "reqID": reqID
+            }
+
+        elif fn_name == "generate_ttt":
+            from ttt import generate_ttt
+            logger.info(f"[{reqID}] Calling TTT pipeline")
+
+            text_result = await generate_ttt(
+                text=fn_args.get("text"),
+                requestID=fn_args.get("requestID"),
+                system=fn_args.get("system")
+            )
+
+
+            text_path = os.path.join(higgs_dir, f"{reqID}.txt")
+            with open(text_path, "w", encoding="utf-8") as f:
+                f.write(text_result)
+
+            logger.info(f"[{reqID}] TTT text saved to: {text_path}")
+
+
+            return {
+                "type": "text",
+                "data": text_result,
+                "file_path": text_path,
+                "reqID": reqID
+            }
+
+        elif fn_name == "generate_sts":
+            from sts import generate_sts
+            logger.info(f"[{reqID}] Calling STS pipeline")
+            audio_bytes, sample_rate = await generate_sts(
+                text=fn_args.get("text"),
+                audio_base64_path=fn_args.get("synthesis_audio_path"),
+                requestID=fn_args.get("requestID"),
+                system=fn_args.get("system"),
+                voice=fn_args.get("voice", "alloy"),
+            )
+
+            if store_key:
+                gen_audio_path = service.cache_store(store_key, audio_bytes, cost=time.time() - pipeline_start)
+                logger.info(f"[{reqID}] STS audio saved to: {gen_audio_path}")
+
+            return {
+                "type": "audio",
+                "data": audio_bytes,
+                "file_path": gen_audio_path or "N/A",
+                "reqID": reqID
+            }
+
+        elif fn_name == "generate_stt":
+            from stt import generate_stt
+            logger.info(f"[{reqID}] Calling STT pipeline")
+
+            text_result = await generate_stt(
+                text=fn_args.get("text"),
+                audio_base64_path=fn_args.get("synthesis_audio_path"),
+                requestID=fn_args.get("requestID"),
+                system=fn_args.get("system"),
+            )
+
+
+            text_path = os.path.join(higgs_dir, f"{reqID}.txt")
+            with open(text_path, "w", encoding="utf-8") as f:
+                f.write(text_result)
+
+            logger.info(f"[{reqID}] STT text saved to: {text_path}")
+
+            return {
+                "type": "text",
+                "data": text_result,
+                "file_path": text_path,
+                "reqID": reqID
+            }
+
+        else:
+            logger.warning(f"[{reqID}] Unknown pipeline: {fn_name}")
+            return None
+
+    except Exception as e:
+        logger.error(f"Error executing pipeline {fn_name}: {e}", exc_info=True)
+        return {
+            "type": "error",
+            "message": f"Pipeline {fn_name} failed: {str(e)}",
+            "reqID": reqID
+        }
+
+
 async def run_audio_pipeline(
     reqID: str = None,
     text: str = None,
     voice: str = None,
     synthesis_audio_path: Optional[str] = None, 
-    system_instruction: Optional[str] = None 
+    system_instruction: Optional[str] = None,
+    priority: str = "interactive",
+    cache_key: Optional[str] = None
 ):
+    """
+    Route the request to one pipeline and run it. Clear-cut requests are
+    routed locally (router.py); only ambiguous ones cost an LLM round trip.
+
+    ``priority`` is the model-server priority class of the synthesis. Audio is
+    cached under ``reqID`` when STORE_CACHE is set, or under ``cache_key``
+    whenever one is given.
+    """
+    pipeline_start = time.time()
+    store_key = cache_key or (reqID if STORE_CACHE else None)
     text = text.strip()
     print(f"Recieved the parameters: {reqID}, {text}, {voice}, {synthesis_audio_path}, {system_instruction}")
     logger.info(f" [{reqID}] Starting Audio Pipeline")
@@ -40,7 +182,25 @@ async def run_audio_pipeline(
     os.makedirs(higgs_dir, exist_ok=True)
     logger.info(f"[{reqID}] Created higgs directory: {higgs_dir}")    
     logger.info(f"[{reqID}] Saved base64 for the required media")
+    has_audio = bool(synthesis_audio_path)
     try:
+        local = classify(text, system_instruction, has_audio)
+        if is_clear_cut(local):
+            logger.info(f"[{reqID}] Routed locally to {local.pipeline} ({local.source}, confidence {local.confidence:.2f})")
+            audit(reqID, local, has_audio)
+            fn_args = {
+                "text": text,
+                "requestID": reqID,
+                "system": system_instruction,
+                "voice": voice,
+                "synthesis_audio_path": synthesis_audio_path,
+            }
+            result = await execute_pipeline(local.pipeline, fn_args, reqID, higgs_dir, pipeline_start, store_key, priority)
+            if result is None:
+                return {"type": "error", "message": f"Pipeline {local.pipeline} produced no result", "reqID": reqID}
+            return result
+        logger.info(f"[{reqID}] Ambiguous route ({local.pipeline} at {local.confidence:.2f}, {local.reason}), asking the LLM router")
+
         messages = [
         {
         "role": "system",
@@ -82,7 +242,9 @@ async def run_audio_pipeline(
                 response = requests.post(POLLINATIONS_ENDPOINT_TEXT, headers=headers, json=payload)
                 response.raise_for_status()
                 response_data = response.json()
+                LLM_CALLS.labels("router", "ok").inc()
             except requests.exceptions.RequestException as e:
+                LLM_CALLS.labels("router", "error").inc()
                 error_text = getattr(e.response, "text", "[No error text]")
                 logger.error(f"Pollinations API call failed: {e}\n{error_text}")
                 break
@@ -110,121 +272,10 @@ async def run_audio_pipeline(
                 fn_name = tool_call["function"]["name"]
                 fn_args = json.loads(tool_call["function"]["arguments"])
                 logger.info(f"[reqID={reqID}] Executing pipeline: {fn_name} with args: {fn_args}")
-                if not TRIAL_MODE:
-                    gen_audio_path = "N/A"
-                    try:
-                        if fn_name == "generate_tts":
-                            from tts import generate_tts 
-                            logger.info(f"[{reqID}] Calling TTS pipeline")
-                            audio_bytes, sample_rate = await generate_tts(
-                                text=fn_args.get("text"),
-                                requestID=fn_args.get("requestID"),
-                                system=fn_args.get("system"),
-                                voice=fn_args.get("voice"),
-                            )
-
-
-                            if STORE_CACHE:
-                                os.makedirs("genAudio", exist_ok=True)
-                                gen_audio_path = f"genAudio/{reqID}.wav"
-                                
-                                with open(gen_audio_path, "wb") as f:
-                                    f.write(audio_bytes)
-                                logger.info(f"[{reqID}] TTS audio saved to: {gen_audio_path}")
-                            
-
-                            return {
-                                "type": "audio",
-                                "data": audio_bytes,
-                                "file_path": gen_audio_path or "N/A",
-                                "reqID": reqID
-                            }
-
-                        elif fn_name == "generate_ttt":
-                            from ttt import generate_ttt
-                            logger.info(f"[{reqID}] Calling TTT pipeline")
-                            
-                            text_result = await generate_ttt(
-                                text=fn_args.get("text"),
-                                requestID=fn_args.get("requestID"),
-                                system=fn_args.get("system")
-                            )
-                            
-                            
-                            text_path = os.path.join(higgs_dir, f"{reqID}.txt")
-                            with open(text_path, "w", encoding="utf-8") as f:
-                                f.write(text_result)
-                            
-                            logger.info(f"[{reqID}] TTT text saved to: {text_path}")
-                            
-                            
-                            return {
-                                "type": "text",
-                                "data": text_result,
-                                "file_path": text_path,
-                                "reqID": reqID
-                            }
-
-                        elif fn_name == "generate_sts":
-                            from sts import generate_sts
-                            logger.info(f"[{reqID}] Calling STS pipeline")
-                            audio_bytes, sample_rate = await generate_sts(
-                                text=fn_args.get("text"),
-                                audio_base64_path=fn_args.get("synthesis_audio_path"),
-                                requestID=fn_args.get("requestID"),
-                                system=fn_args.get("system"),
-                                voice=fn_args.get("voice", "alloy"),
-                            )
-
-                            if STORE_CACHE:
-                                os.makedirs("genAudio", exist_ok=True)
-                                gen_audio_path = f"genAudio/{reqID}.wav"
-                                with open(gen_audio_path, "wb") as f:
-                                    f.write(audio_bytes)
-                                logger.info(f"[{reqID}] STS audio saved to: {gen_audio_path}")
-
-                            return {
-                                "type": "audio",
-                                "data": audio_bytes,
-                                "file_path": gen_audio_path or "N/A",
-                                "reqID": reqID
-                            }
-
-                        elif fn_name == "generate_stt":
-                            from stt import generate_stt
-                            logger.info(f"[{reqID}] Calling STT pipeline")
-                            
-                            text_result = await generate_stt(
-                                text=fn_args.get("text"),
-                                audio_base64_path=fn_args.get("synthesis_audio_path"),
-                                requestID=fn_args.get("requestID"),
-                                system=fn_args.get("system"),
-                            )
-                            
-
-                            text_path = os.path.join(higgs_dir, f"{reqID}.txt")
-                            with open(text_path, "w", encoding="utf-8") as f:
-                                f.write(text_result)
-                            
-                            logger.info(f"[{reqID}] STT text saved to: {text_path}")
-                            
-                            return {
-                                "type": "text",
-                                "data": text_result,
-                                "file_path": text_path,
-                                "reqID": reqID
-                            }
-
-                        else:
-                            tool_result = f"Unknown pipeline: {fn_name}"
-
-                    except Exception as e:
-                        logger.error(f"Error executing pipeline {fn_name}: {e}", exc_info=True)
-                        return {
-                            "type": "error",
-                            "message": f"Pipeline {fn_name} failed: {str(e)}",
-                            "reqID": reqID
-                        }
+                audit(reqID, RouteDecision(fn_name, None, "llm", "tool call"), has_audio, local=local)
+                result = await execute_pipeline(fn_name, fn_args, reqID, higgs_dir, pipeline_start, store_key, priority)
+                if result is not None:
+                    return result
 
                 tool_outputs.append({
                     "role": "tool",
@@ -260,6 +311,40 @@ async def run_audio_pipeline(
         
 
 
+async def prepare_audio_stream(
+    reqID: str = None,
+    text: str = None,
+    voice: str = None,
+    synthesis_audio_path: Optional[str] = None,
+    system_instruction: Optional[str] = None
+):
+    """
+    Resolve the content and voice for a streamed audio response.
+
+    Streaming always produces audio, so the router LLM is skipped: speech input
+    goes through STS, text-only input through TTS.
+    """
+    text = text.strip()
+    if synthesis_audio_path:
+        from sts import prepare_sts_stream
+        logger.info(f"[{reqID}] Preparing STS stream")
+        return await prepare_sts_stream(text, synthesis_audio_path, reqID, system_instruction, voice)
+    from tts import prepare_tts_stream
+    logger.info(f"[{reqID}] Preparing TTS stream")
+    return await prepare_tts_stream(text, reqID, system_instruction, voice)
+
+
+def store_stream_cache(reqID: str):
+    stream_start = time.time()
+
+    def on_complete(audio_bytes: bytes, sample_rate: int):
+        if not STORE_CACHE:
+            return
+        gen_audio_path = service.cache_store(reqID, audio_bytes, cost=time.time() - stream_start)
+        logger.info(f"[{reqID}] Streamed audio saved to: {gen_audio_path}")
+    return on_complete
+
+
 if __name__ == "__main__":
     async def main():
         text = "Verbatim: OH MY GODD!! A scientist invents a device that lets people swap memories, but chaos erupts when secrets and identities become dangerously tangled."
@@ -0,0 +1,163 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from itertools import count
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+_MIN_SLAB_BYTES = 1 << 16
+
+
+def _slab_size(nbytes: int) -> int:
+    size = _MIN_SLAB_BYTES
+    while size < nbytes:
+        size <<= 1
+    return size
+
+
+def _attach(name: str) -> SharedMemory:
+    shm = SharedMemory(name=name)
+    # Attaching registers the segment with this process' resource tracker,
+    # which would unlink it when this process exits; the creator owns it.
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+
+class SharedAudioPool:
+    """
+    Slab allocator of shared-memory segments for returning audio to clients.
+
+    Segments are grouped in power-of-two size classes and recycled once the
+    client releases them, so steady traffic maps the same few segments over
+    and over instead of creating one per response. Leases that are never
+    released (a crashed worker) are reclaimed after ``lease_ttl`` seconds.
+    """
+
+    def __init__(self, max_bytes: int, lease_ttl: float):
+        self._max_bytes = max_bytes
+        self._lease_ttl = lease_ttl
+        self._prefix = f"lixaudio_{os.getpid()}_"
+        self._counter = count()
+        self._free: Dict[int, List[SharedMemory]] = {}
+        self._leased: Dict[str, Tuple[SharedMemory, float]] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, array: np.ndarray) -> Optional[dict]:
+        array = np.ascontiguousarray(array)
+        size = _slab_size(array.nbytes)
+        with self._lock:
+            self._reclaim_expired()
+            free = self._free.get(size)
+            if free:
+                shm = free.pop()
+            else:
+                if self._total_bytes + size > self._max_bytes:
+                    self._drop_free_segments()
+                if self._total_bytes + size > self._max_bytes:
+                    logger.warning(f"Shared audio pool exhausted ({self._total_bytes} bytes in use)")
+                    return None
+                shm = SharedMemory(name=f"{self._prefix}{next(self._counter)}", create=True, size=size)
+                self._total_bytes += size
+            self._leased[shm.name] = (shm, time.time())
+
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+        view[...] = array
+        del view
+        return {
+            "name": shm.name,
+            "shape": list(array.shape),
+            "dtype": array.dtype.str,
+        }
+
+    def release(self, name: str):
+        with self._lock:
+            entry = self._leased.pop(name, None)
+            if entry is None:
+                return
+            shm = entry[0]
+            self._free.setdefault(shm.size, []).append(shm)
+
+    def _reclaim_expired(self):
+        cutoff = time.time() - self._lease_ttl
+        for name, (shm, leased_at) in list(self._leased.items()):
+            if leased_at < cutoff:
+                logger.warning(f"Reclaiming unreleased shared audio segment {name}")
+                del self._leased[name]
+                self._free.setdefault(shm.size, []).append(shm)
+
+    def _drop_free_segments(self):
+        for segments in self._free.values():
+            for shm in segments:
+                self._total_bytes -= shm.size
+                shm.close()
+                shm.unlink()
+        self._free.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "total_bytes": self._total_bytes,
+                "leased": len(self._leased),
+                "free": sum(len(segments) for segments in self._free.values()),
+            }
+
+    def close(self):
+        with self._lock:
+            for shm, _ in self._leased.values():
+                self._free.setdefault(shm.size, []).append(shm)
+            self._leased.clear()
+            self._drop_free_segments()
+
+
+_attached: "OrderedDict[str, SharedMemory]" = OrderedDict()
+_attached_lock = threading.Lock()
+_MAX_ATTACHED = 64
+
+
+def read_shared_audio(handle: dict) -> np.ndarray:
+    """Map a pool segment read-only; the view is valid until the handle is released."""
+    name = handle["name"]
+    with _attached_lock:
+        shm = _attached.get(name)
+        if shm is None:
+            shm = _attach(name)
+            _attached[name] = shm
+            while len(_attached) > _MAX_ATTACHED:
+                _, stale = _attached.popitem(last=False)
+                try:
+                    stale.close()
+                except BufferError:
+                    pass
+        _attached.move_to_end(name)
+    array = np.ndarray(tuple(handle["shape"]), dtype=np.dtype(handle["dtype"]), buffer=shm.buf)
+    array.flags.writeable = False
+    return array
+
+
+def write_shared_bytes(data: bytes) -> Tuple[SharedMemory, dict]:
+    """Copy ``data`` into a new segment owned by the caller; free it with ``free_shared_bytes``."""
+    shm = SharedMemory(create=True, size=max(1, len(data)))
+    shm.buf[:len(data)] = data
+    return shm, {"name": shm.name, "nbytes": len(data)}
+
+
+def open_shared_bytes(handle: dict) -> Tuple[SharedMemory, memoryview]:
+    shm = _attach(handle["name"])
+    return shm, shm.buf[:handle["nbytes"]]
+
+
+def free_shared_bytes(shm: SharedMemory):
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
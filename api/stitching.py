@@ -0,0 +1,61 @@
+from typing import Sequence
+
+import numpy as np
+
+
+def trim_silence(samples: np.ndarray, sample_rate: int, threshold_db: float = -45.0, keep_ms: int = 40, frame_ms: int = 10) -> np.ndarray:
+    """
+    Cut leading and trailing silence down to ``keep_ms``, so every chunk
+    starts and ends the same way regardless of how much padding the engine
+    rendered. Returns a view on ``samples``.
+    """
+    samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+    frame = max(1, sample_rate * frame_ms // 1000)
+    frames = len(samples) // frame
+    if frames == 0:
+        return samples
+    energy = np.square(samples[:frames * frame]).reshape(frames, frame).mean(axis=1)
+    voiced = np.flatnonzero(energy > 10 ** (threshold_db / 10))
+    if not len(voiced):
+        return samples[:0]
+    keep = sample_rate * keep_ms // 1000
+    start = max(0, voiced[0] * frame - keep)
+    end = min(len(samples), (voiced[-1] + 1) * frame + keep)
+    return samples[start:end]
+
+
+def stitch(chunks: Sequence[np.ndarray], sample_rate: int, crossfade_ms: int = 20, pause_ms: int = 120) -> np.ndarray:
+    """
+    Join chunks in order: ``pause_ms`` of silence after each chunk but the
+    last, and a crossfade of ``crossfade_ms`` across every boundary. The fade
+    is equal-power when it runs into a pause and linear (equal-gain) when
+    chunks meet directly, since two correlated voiced signals summed at
+    equal power swell by up to 1.41x. The output is written into one
+    preallocated buffer and clipped to [-1, 1].
+    """
+    chunks = [np.asarray(chunk, dtype=np.float32).reshape(-1) for chunk in chunks]
+    chunks = [chunk for chunk in chunks if len(chunk)]
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    pause = sample_rate * pause_ms // 1000
+    lengths = [len(chunk) + pause for chunk in chunks[:-1]] + [len(chunks[-1])]
+    overlap = min([sample_rate * crossfade_ms // 1000] + lengths)
+
+    if pause:
+        ramp = np.linspace(0.0, np.pi / 2, overlap, dtype=np.float32)
+        fade_in, fade_out = np.sin(ramp), np.cos(ramp)
+    else:
+        fade_in = np.linspace(0.0, 1.0, overlap, dtype=np.float32)
+        fade_out = 1.0 - fade_in
+    output = np.zeros(sum(lengths) - overlap * (len(chunks) - 1), dtype=np.float32)
+    position = 0
+    for index, (chunk, length) in enumerate(zip(chunks, lengths)):
+        target = output[position:position + len(chunk)]
+        head = min(overlap, len(chunk)) if index > 0 else 0
+        # The previous chunk's faded-out tail is already in the first ``overlap`` samples.
+        target[:head] += chunk[:head] * fade_in[:head]
+        target[head:] += chunk[head:]
+        if overlap and index < len(chunks) - 1:
+            output[position + length - overlap:position + length] *= fade_out
+        position += length - overlap
+    return np.clip(output, -1.0, 1.0, out=output)
@@ -1,50 +1,33 @@
 from utility import encode_audio_base64, save_temp_audio, validate_and_decode_base64_audio, convertToAudio
-from multiprocessing.managers import BaseManager
-from voiceMap import VOICE_BASE64_MAP
+from model_client import aservice
 from typing import Optional, Tuple
 import asyncio
 import torchaudio
 import torch 
 from intent import getContentRefined
+from tts import resolve_voice_path, synthesize_reply
+from shm_transport import write_shared_bytes, free_shared_bytes
+from metrics import timed_pipeline
 import io
 
 
-class ModelManager(BaseManager): pass
-ModelManager.register("Service")
-manager = ModelManager(address=("localhost", 6000), authkey=b"secret")
-manager.connect()
-service = manager.Service()
 
+async def transcribe_shared(audio_path: str, requestID: str) -> str:
+    with open(audio_path, "rb") as f:
+        shm, handle = write_shared_bytes(f.read())
+    try:
+        return await aservice.transcribe_shared_async(handle, requestID)
+    finally:
+        free_shared_bytes(shm)
+
+@timed_pipeline("sts")
 async def generate_sts(text: str, audio_base64_path: str, requestID: str, system: Optional[str] = None, voice: Optional[str] = "alloy") -> Tuple[bytes, int]:
-    clone_path = None
-    
     print(f"[{requestID}] STS pipeline called with voice: {voice}")
-    
-    # Simple voice handling: name or file path, default to alloy
-    if voice and VOICE_BASE64_MAP.get(voice):
-        # Predefined voice name
-        clone_path = VOICE_BASE64_MAP.get(voice)
-        print(f"[{requestID}] Using predefined voice: {voice}")
-    elif voice:
-        # Try to use as file path
-        try:
-            import os
-            if os.path.isfile(voice):
-                clone_path = voice
-                print(f"[{requestID}] Using voice file: {voice}")
-            else:
-                print(f"[{requestID}] Voice '{voice}' not found in list and not a valid file. Falling back to alloy.")
-                clone_path = VOICE_BASE64_MAP.get("alloy")
-        except Exception as e:
-            print(f"[{requestID}] Error with voice '{voice}': {e}. Falling back to alloy.")
-            clone_path = VOICE_BASE64_MAP.get("alloy")
-    else:
-        clone_path = VOICE_BASE64_MAP.get("alloy")
-        print(f"[{requestID}] No voice specified, using default: alloy")
+    clone_path = resolve_voice_path(voice, requestID)
     
     try:
         print(f"[{requestID}] Transcribing input audio...")
-        transcription = service.transcribe(audio_base64_path, requestID)
+        transcription = await transcribe_shared(audio_base64_path, requestID)
         print(f"[{requestID}] Transcription result: {transcription[:100]}...")
         
         print(f"[{requestID}] Detecting intent and refining content...")
@@ -59,26 +42,7 @@ async def generate_sts(text: str, audio_base64_path: str, requestID: str, system
         print(f"[{requestID}] Intent: {intention}, Generated content: {content[:100]}...")
         
         print(f"[{requestID}] Generating STS audio with voice cloning from: {clone_path}")
-        wav, sample_rate = service.speechSynthesis(text=content, audio_prompt_path=clone_path)
-        
-        if wav is None:
-            raise RuntimeError("Audio generation failed - GPU out of memory or other error")
-        
-        if isinstance(wav, torch.Tensor):
-            audio_tensor = wav
-        else:
-            audio_tensor = torch.from_numpy(wav)
-        
-        if audio_tensor.dim() == 1:
-            audio_tensor = audio_tensor.unsqueeze(0)
-        elif audio_tensor.dim() > 2:
-            audio_tensor = audio_tensor.squeeze()
-            if audio_tensor.dim() == 1:
-                audio_tensor = audio_tensor.unsqueeze(0)
-        
-        buffer = io.BytesIO()
-        torchaudio.save(buffer, audio_tensor, sample_rate, format="wav")
-        audio_bytes = buffer.getvalue()
+        audio_bytes, sample_rate = await synthesize_reply(content, clone_path, requestID)
         
         print(f"[{requestID}] STS generation completed. Audio bytes: {len(audio_bytes)}, Sample rate: {sample_rate}")
         return audio_bytes, sample_rate
@@ -88,6 +52,19 @@ async def generate_sts(text: str, audio_base64_path: str, requestID: str, system
         raise e
 
 
+async def prepare_sts_stream(text: str, audio_base64_path: str, requestID: str, system: Optional[str] = None, voice: Optional[str] = "alloy") -> Tuple[str, str]:
+    clone_path = resolve_voice_path(voice, requestID)
+    print(f"[{requestID}] Transcribing input audio for streaming...")
+    transcription = await transcribe_shared(audio_base64_path, requestID)
+    intention_detection = await getContentRefined(
+        f"This is the prompt and {text} and this is the audio transcript {transcription}",
+        system
+    )
+    content = intention_detection.get("content")
+    print(f"[{requestID}] Intent: {intention_detection.get('intent')}, Streaming content: {content[:100]}...")
+    return content, clone_path
+
+
 if __name__ == "__main__":
     async def main():
         text = "What shall i do now?"
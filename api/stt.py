@@ -2,20 +2,17 @@ from typing import Optional
 import asyncio
 from dotenv import load_dotenv
 from utility import encode_audio_base64, save_temp_audio, convertToAudio
-from multiprocessing.managers import BaseManager
+from sts import transcribe_shared
+from metrics import timed_pipeline
 
 
 load_dotenv()
 
 
-class ModelManager(BaseManager): pass
-ModelManager.register("Service")
-manager = ModelManager(address=("localhost", 6000), authkey=b"secret")
-manager.connect()
-service = manager.Service()
 
+@timed_pipeline("stt")
 async def generate_stt(text: str, audio_base64_path: str, requestID: str, system: Optional[str] = None) -> str:
-    transcription = service.transcribe(audio_base64_path, requestID)
+    transcription = await transcribe_shared(audio_base64_path, requestID)
     
     return transcription
 
@@ -0,0 +1,88 @@
+from bisect import bisect_right
+from dataclasses import replace
+from typing import Any, List
+
+import numpy as np
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+from faster_whisper.vad import VadOptions, collect_chunks, get_speech_timestamps
+
+SAMPLE_RATE = 16000
+MAX_CHUNK_SEC = 30
+
+
+def speech_chunks(samples: np.ndarray, vad_options: VadOptions = None) -> List[np.ndarray]:
+    """
+    Split 16 kHz audio into windows of at most 30 s of speech. Speech is found
+    with the VAD options of the serial path (``vad_filter=True``, library
+    defaults) and packed into windows in order. A speech run longer than a
+    window is split at its silences, as the VAD does with
+    ``max_speech_duration_s``, and cut at the window length as a last resort.
+    """
+    vad_options = vad_options or VadOptions()
+    window = MAX_CHUNK_SEC * SAMPLE_RATE
+    timestamps = []
+    for run in get_speech_timestamps(samples, vad_options):
+        if run["end"] - run["start"] <= window:
+            timestamps.append(run)
+            continue
+        split = replace(vad_options, max_speech_duration_s=MAX_CHUNK_SEC)
+        for part in get_speech_timestamps(samples[run["start"]:run["end"]], split):
+            timestamps.append({"start": run["start"] + part["start"], "end": run["start"] + part["end"]})
+    if not timestamps:
+        return []
+    chunks, _ = collect_chunks(samples, timestamps, max_duration=MAX_CHUNK_SEC)
+    return [chunk[start:start + window] for chunk in chunks for start in range(0, len(chunk), window)]
+
+
+class BatchedTranscriber:
+    """
+    Transcribes several clips in batched forward passes.
+
+    Every clip is cut into VAD speech chunks, the chunks of all clips are laid
+    end to end in one buffer and handed to ``BatchedInferencePipeline`` as
+    explicit clip timestamps, so chunks from different requests share a
+    batch but never a window. Segments are mapped back to the clip that owns
+    their chunk.
+
+    Transcripts can still differ from the serial path, which decodes the
+    speech as one stream: windows end at silences picked by the VAD instead
+    of after the last complete segment, no window is
+    conditioned on the text of the previous one, and only the first
+    temperature is tried, without fallback on low-confidence output.
+    testing/bench_stt_batch.py checks the word error rate against serial.
+    """
+
+    def __init__(self, model: WhisperModel, batch_size: int):
+        self.model = model
+        self.pipeline = BatchedInferencePipeline(model=model)
+        self.batch_size = batch_size
+
+    def transcribe(self, audios: List[np.ndarray], **options: Any) -> List[str]:
+        parts: List[np.ndarray] = []
+        clips = []
+        clip_starts = []
+        owners = []
+        position = 0
+        for index, samples in enumerate(audios):
+            for chunk in speech_chunks(samples):
+                clips.append({"start": position / SAMPLE_RATE, "end": (position + len(chunk)) / SAMPLE_RATE})
+                clip_starts.append(position / SAMPLE_RATE)
+                owners.append(index)
+                parts.append(chunk)
+                position += len(chunk)
+
+        texts: List[List[str]] = [[] for _ in audios]
+        if not clips:
+            return ["" for _ in audios]
+
+        segments, _ = self.pipeline.transcribe(
+            np.concatenate(parts),
+            clip_timestamps=clips,
+            batch_size=self.batch_size,
+            **options,
+        )
+        for segment in segments:
+            midpoint = (segment.start + segment.end) / 2
+            clip = max(0, bisect_right(clip_starts, midpoint) - 1)
+            texts[owners[clip]].append(segment.text)
+        return ["".join(text) for text in texts]
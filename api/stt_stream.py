@@ -0,0 +1,224 @@
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, List
+
+import numpy as np
+import soxr
+from faster_whisper.vad import VadOptions, get_speech_timestamps, get_vad_model
+
+SAMPLE_RATE = 16000
+# Silero scores 512-sample frames, each with the tail of the previous one as context.
+FRAME = 512
+
+
+class StreamingTranscriptionSession:
+    """
+    Incremental transcription of one live 16-bit PCM stream.
+
+    Audio is appended to an open segment. Every ``vad_step_ms`` of new audio,
+    Silero VAD scores only the frames added since the last step and the
+    speech / trailing-silence state is carried over, so VAD work stays
+    proportional to the audio fed. Once speech is followed by ``endpoint_ms``
+    of silence (or the segment reaches ``max_segment_sec``) the segment is
+    closed and sent for a final transcription, and a new one
+    starts. While a segment is open, a partial transcription of it is
+    requested every ``partial_interval_ms``.
+
+    ``transcribe(samples, final)`` must return a ``Future`` of the text.
+    Events come out of ``drain``: partials for the open segment, and finals
+    strictly in segment order.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        transcribe: Callable[[np.ndarray, bool], Future],
+        sample_rate: int = SAMPLE_RATE,
+        endpoint_ms: int = 600,
+        partial_interval_ms: int = 1000,
+        vad_step_ms: int = 200,
+        max_segment_sec: float = 25.0,
+    ):
+        self.session_id = session_id
+        self._transcribe = transcribe
+        self._resampler = None if sample_rate == SAMPLE_RATE else soxr.ResampleStream(sample_rate, SAMPLE_RATE, 1, dtype="float32")
+        self._vad = VadOptions(min_silence_duration_ms=endpoint_ms, speech_pad_ms=100)
+        self._vad_model = get_vad_model()
+        self._threshold = self._vad.threshold
+        self._neg_threshold = self._vad.neg_threshold or max(self._threshold - 0.15, 0.01)
+        self._endpoint_samples = endpoint_ms * SAMPLE_RATE // 1000
+        self._min_speech = self._vad.min_speech_duration_ms * SAMPLE_RATE // 1000
+        self._speech_pad = self._vad.speech_pad_ms * SAMPLE_RATE // 1000
+        self._partial_samples = partial_interval_ms * SAMPLE_RATE // 1000
+        self._vad_step = vad_step_ms * SAMPLE_RATE // 1000
+        self._max_segment = int(max_segment_sec * SAMPLE_RATE)
+        self._lead_in = SAMPLE_RATE // 2
+
+        self._leftover = b""
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._pending_start = 0
+        self._segment = 0
+        # VAD state, as offsets into _pending: how far it has been scored,
+        # where the current speech run and the silence after it started.
+        self._vad_pos = 0
+        self._triggered = False
+        self._speech_start = 0
+        self._silence_start = None
+        self._has_speech = False
+        self._since_vad = 0
+        self._since_partial = 0
+        self._partial_inflight = False
+
+        self._finals: deque = deque()
+        self._events: List[dict] = []
+        self._texts: List[str] = []
+        self._lock = threading.Lock()
+        self._feed_lock = threading.Lock()
+
+    def feed(self, pcm: bytes) -> List[dict]:
+        """Append little-endian int16 mono PCM and return the events ready so far."""
+        with self._feed_lock:
+            data = self._leftover + bytes(pcm)
+            usable = len(data) & ~1
+            self._leftover = data[usable:]
+            samples = np.frombuffer(data[:usable], dtype="<i2") * np.float32(1.0 / 32767)
+            self._append(samples, last=False)
+        return self.drain()
+
+    def close(self) -> Future:
+        """Finalize the open segment; resolves to the remaining events and the full transcript."""
+        with self._feed_lock:
+            if self._resampler is not None:
+                self._append(np.zeros(0, dtype=np.float32), last=True)
+            if len(self._pending) and (self._has_speech or get_speech_timestamps(self._pending, self._vad)):
+                self._finalize(len(self._pending))
+
+        done: Future = Future()
+        with self._lock:
+            outstanding = [future for _, _, _, future in self._finals]
+
+        def _check(_=None):
+            if all(future.done() for future in outstanding) and not done.done():
+                try:
+                    done.set_result({"events": self.drain(), "text": "".join(self._texts).strip()})
+                except Exception as e:
+                    done.set_exception(e)
+
+        if not outstanding:
+            _check()
+        for future in outstanding:
+            future.add_done_callback(_check)
+        return done
+
+    def drain(self) -> List[dict]:
+        with self._lock:
+            while self._finals and self._finals[0][3].done():
+                segment, start, end, future = self._finals.popleft()
+                try:
+                    text = future.result()
+                except Exception as e:
+                    self._events.append({"type": "error", "segment": segment, "message": str(e)})
+                    continue
+                self._texts.append(text)
+                self._events.append({"type": "final", "segment": segment, "start": start, "end": end, "text": text.strip()})
+            events, self._events = self._events, []
+        return events
+
+    def _append(self, samples: np.ndarray, last: bool):
+        if self._resampler is not None:
+            samples = self._resampler.resample_chunk(samples, last=last)
+        if not len(samples):
+            return
+        self._pending = np.concatenate([self._pending, samples.astype(np.float32, copy=False)])
+        self._since_vad += len(samples)
+        self._since_partial += len(samples)
+        if self._since_vad >= self._vad_step:
+            self._since_vad = 0
+            self._endpoint()
+
+    def _endpoint(self):
+        frames = (len(self._pending) - self._vad_pos) // FRAME
+        if frames <= 0:
+            return
+        context = self._pending[max(0, self._vad_pos - FRAME):self._vad_pos]
+        audio = np.concatenate([
+            np.zeros(FRAME - len(context), dtype=np.float32),
+            context,
+            self._pending[self._vad_pos:self._vad_pos + frames * FRAME],
+        ])
+        for probability in self._vad_model(audio).reshape(-1)[1:]:
+            self._score_frame(float(probability))
+
+        if self._has_speech and len(self._pending) >= self._max_segment:
+            self._finalize(len(self._pending))
+        elif self._has_speech and self._since_partial >= self._partial_samples and not self._partial_inflight:
+            self._request_partial()
+        elif not self._triggered and not self._has_speech:
+            # Silence only: keep a short lead-in so the next word is not clipped.
+            self._trim(self._vad_pos - self._lead_in)
+
+    def _score_frame(self, probability: float):
+        # Silero's own hysteresis: speech starts above the threshold and only
+        # ends after endpoint_ms below the lower one.
+        position = self._vad_pos
+        self._vad_pos += FRAME
+        if probability >= self._threshold:
+            if not self._triggered:
+                self._triggered = True
+                self._speech_start = position
+            self._silence_start = None
+        elif probability < self._neg_threshold and self._triggered and self._silence_start is None:
+            self._silence_start = position
+        if not self._triggered:
+            return
+        speech_end = self._vad_pos if self._silence_start is None else self._silence_start
+        if speech_end - self._speech_start >= self._min_speech:
+            self._has_speech = True
+        if self._silence_start is not None and self._vad_pos - self._silence_start >= self._endpoint_samples:
+            self._triggered = False
+            cut = min(self._silence_start + self._speech_pad, self._vad_pos)
+            self._silence_start = None
+            if self._has_speech:
+                self._finalize(cut)
+
+    def _trim(self, excess: int):
+        if excess <= 0:
+            return
+        self._pending = self._pending[excess:]
+        self._pending_start += excess
+        self._vad_pos -= excess
+        self._speech_start -= excess
+
+    def _finalize(self, cut: int):
+        segment = self._segment
+        start = self._pending_start / SAMPLE_RATE
+        end = (self._pending_start + cut) / SAMPLE_RATE
+        future = self._transcribe(self._pending[:cut].copy(), True)
+        with self._lock:
+            self._finals.append((segment, start, end, future))
+            self._segment += 1
+        self._pending = self._pending[cut:]
+        self._pending_start += cut
+        self._vad_pos = max(0, self._vad_pos - cut)
+        self._triggered = False
+        self._silence_start = None
+        self._has_speech = False
+        self._since_partial = 0
+
+    def _request_partial(self):
+        segment = self._segment
+        self._since_partial = 0
+        self._partial_inflight = True
+        future = self._transcribe(self._pending.copy(), False)
+
+        def _done(result: Future):
+            self._partial_inflight = False
+            if result.cancelled() or result.exception() is not None:
+                return
+            with self._lock:
+                # A partial that lands after its segment closed is superseded by the final.
+                if segment == self._segment:
+                    self._events.append({"type": "partial", "segment": segment, "text": result.result().strip()})
+
+        future.add_done_callback(_done)
@@ -1,11 +1,18 @@
-from utility import validate_and_decode_base64_audio
+from utility import validate_and_decode_base64_audio, build_wav_header, float_to_pcm16, encode_wav
+from shm_transport import read_shared_audio
 from voiceMap import VOICE_BASE64_MAP
+from chunking import split_into_chunks
+from stitching import stitch, trim_silence
+from config import STREAM_CHUNK_MAX_CHARS, STREAM_CHUNK_MIN_CHARS
+from config import LONG_FORM_ENABLED, LONG_FORM_MIN_CHARS, LONG_FORM_CHUNK_MAX_CHARS, LONG_FORM_CHUNK_MIN_CHARS
+from config import LONG_FORM_MAX_INFLIGHT, LONG_FORM_CROSSFADE_MS, LONG_FORM_PAUSE_MS
+from config import SENTENCE_CACHE_ENABLED, SENTENCE_CACHE_MIN_CHARS, SENTENCE_CACHE_MIN_REPLY_CHARS
+from sentence_cache import read_sentence, sentence_key, voice_identity
 import asyncio
-from typing import Optional
-from multiprocessing.managers import BaseManager
+from typing import Callable, Iterator, List, Optional, Tuple
+from model_client import service, aservice
 from multiprocessing import set_start_method
 import os
-import threading
 import time
 import torch
 import torchaudio
@@ -13,50 +20,115 @@ import io
 import numpy as np
 import time
 from intent import getContentRefined
+from metrics import timed_pipeline
 
 try:
     set_start_method('spawn', force=True)
 except RuntimeError:
     pass
 
-class ModelManager(BaseManager): pass
-ModelManager.register("Service")
 
-def get_service():
-    try:
-        manager = ModelManager(address=("localhost", 6000), authkey=b"secret")
-        manager.connect()
-        return manager.Service()
-    except Exception as e:
-        print(f"Failed to connect to ModelManager: {e}")
-        raise
-
-service = get_service()
-
-async def generate_tts(text: str, requestID: str, system: Optional[str] = None, voice: Optional[str] = "alloy") -> tuple:
-    global service
-    clone_path = None
-    
+def resolve_voice_path(voice: Optional[str], requestID: str) -> str:
     # Simple voice handling: name or file path, default to alloy
     if voice and VOICE_BASE64_MAP.get(voice):
         # Predefined voice name
-        clone_path = VOICE_BASE64_MAP.get(voice)
         print(f"[{requestID}] Using predefined voice: {voice}")
+        return VOICE_BASE64_MAP.get(voice)
     elif voice:
         # Try to use as file path
         try:
             if os.path.isfile(voice):
-                clone_path = voice
                 print(f"[{requestID}] Using voice file: {voice}")
-            else:
-                print(f"[{requestID}] Voice '{voice}' not found in list and not a valid file. Falling back to alloy.")
-                clone_path = VOICE_BASE64_MAP.get("alloy")
+                return voice
+            print(f"[{requestID}] Voice '{voice}' not found in list and not a valid file. Falling back to alloy.")
         except Exception as e:
             print(f"[{requestID}] Error with voice '{voice}': {e}. Falling back to alloy.")
-            clone_path = VOICE_BASE64_MAP.get("alloy")
-    else:
-        clone_path = VOICE_BASE64_MAP.get("alloy")
-        print(f"[{requestID}] No voice specified, using default: alloy")
+        return VOICE_BASE64_MAP.get("alloy")
+    print(f"[{requestID}] No voice specified, using default: alloy")
+    return VOICE_BASE64_MAP.get("alloy")
+
+async def synthesize_wav_bytes(content: str, clone_path: str, requestID: str, priority: str = "interactive") -> Tuple[bytes, int]:
+    # The waveform comes back through shared memory; it is encoded straight
+    # from the mapped view and the segment is handed back to the server.
+    handle = await aservice.speechSynthesis_shared_async(text=content, audio_prompt_path=clone_path, reqID=requestID, priority=priority)
+    if handle is None:
+        raise RuntimeError("Audio generation failed - GPU out of memory or other error")
+    try:
+        wav = read_shared_audio(handle)
+        audio_bytes = encode_wav(wav, handle["sample_rate"])
+        del wav
+    finally:
+        service.call_async("release_shared_audio", handle["name"])
+    return audio_bytes, handle["sample_rate"]
+
+async def synthesize_long_form(content: str, clone_path: str, requestID: str, priority: str = "interactive") -> Tuple[bytes, int]:
+    """
+    Render ``content`` as sentence chunks submitted concurrently, so the server
+    can batch them and the replica pool can spread them, then stitch the
+    chunks back together in order.
+    """
+    chunks = split_into_chunks(content, LONG_FORM_CHUNK_MAX_CHARS, LONG_FORM_CHUNK_MIN_CHARS, split_at_tags=True)
+    if len(chunks) <= 1:
+        return await synthesize_wav_bytes(content, clone_path, requestID, priority)
+    return await synthesize_chunks(chunks, clone_path, requestID, priority)
+
+async def synthesize_sentences(content: str, clone_path: str, requestID: str, priority: str = "interactive") -> Tuple[bytes, int]:
+    """
+    Render ``content`` sentence by sentence through the sentence cache: only
+    sentences not rendered before with this voice are synthesized.
+    """
+    sentences = split_into_chunks(content, LONG_FORM_CHUNK_MAX_CHARS, SENTENCE_CACHE_MIN_CHARS, split_at_tags=True)
+    if not sentences:
+        raise ValueError("Nothing to synthesize")
+    voice = voice_identity(clone_path)
+    return await synthesize_chunks(sentences, clone_path, requestID, priority, keys=[sentence_key(sentence, voice) for sentence in sentences])
+
+async def synthesize_chunks(chunks: List[str], clone_path: str, requestID: str, priority: str = "interactive", keys: Optional[List[str]] = None) -> Tuple[bytes, int]:
+    """
+    Render ``chunks`` concurrently and stitch them in order. With ``keys``
+    (one sentence-cache key per chunk), cached chunks are reused and newly
+    rendered ones are added to the cache.
+    """
+    cached = await aservice.sentence_cache_lookup(keys) if keys else {}
+    inflight = asyncio.Semaphore(LONG_FORM_MAX_INFLIGHT)
+
+    async def render(index: int, text: str) -> Tuple[np.ndarray, int]:
+        key = keys[index] if keys else None
+        if key in cached:
+            wav = read_sentence(cached[key])
+            if wav is not None:
+                return wav, cached[key]["sample_rate"]
+        async with inflight:
+            handle = await aservice.speechSynthesis_shared_async(text=text, audio_prompt_path=clone_path, reqID=f"{requestID}-{index}", priority=priority)
+        if handle is None:
+            raise RuntimeError(f"Audio generation failed for chunk {index} - GPU out of memory or other error")
+        try:
+            # Only the trimmed chunk is copied out before the segment goes back.
+            wav = trim_silence(read_shared_audio(handle), handle["sample_rate"]).copy()
+        finally:
+            service.call_async("release_shared_audio", handle["name"])
+        if key is not None:
+            service.call_async("sentence_cache_store", key, float_to_pcm16(wav), handle["sample_rate"])
+        return wav, handle["sample_rate"]
+
+    start_time = time.time()
+    rendered = await asyncio.gather(*(render(index, text) for index, text in enumerate(chunks)))
+    sample_rate = rendered[0][1]
+    wav = stitch([chunk for chunk, _ in rendered], sample_rate, LONG_FORM_CROSSFADE_MS, LONG_FORM_PAUSE_MS)
+    reused = f", {len(cached)} from the sentence cache" if keys else ""
+    print(f"[{requestID}] Synthesis of {len(chunks)} chunk(s){reused} took {time.time() - start_time:.2f}s")
+    return encode_wav(wav, sample_rate), sample_rate
+
+async def synthesize_reply(content: str, clone_path: str, requestID: str, priority: str = "interactive") -> Tuple[bytes, int]:
+    if SENTENCE_CACHE_ENABLED and len(content) >= SENTENCE_CACHE_MIN_REPLY_CHARS:
+        return await synthesize_sentences(content, clone_path, requestID, priority)
+    if LONG_FORM_ENABLED and len(content) >= LONG_FORM_MIN_CHARS:
+        return await synthesize_long_form(content, clone_path, requestID, priority)
+    return await synthesize_wav_bytes(content, clone_path, requestID, priority)
+
+@timed_pipeline("tts")
+async def generate_tts(text: str, requestID: str, system: Optional[str] = None, voice: Optional[str] = "alloy", priority: str = "interactive") -> tuple:
+    clone_path = resolve_voice_path(voice, requestID)
     
     intention_detection = await getContentRefined(
             f"This is the prompt and {text} ",
@@ -66,55 +138,83 @@ async def generate_tts(text: str, requestID: str, system: Optional[str] = None,
     intention = intention_detection.get("intent")
     content = intention_detection.get("content")
     print(f"[{requestID}] Intent: {intention}, Generated content: {content[:100]}...")
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            print(f"[{requestID}] Generating TTS audio with voice: {voice} (attempt {attempt + 1}/{max_retries})")
-            try:
-                wav, sample_rate = service.speechSynthesis(text=content, audio_prompt_path=clone_path)
-            except Exception as conn_error:
-                if "digest sent was rejected" in str(conn_error) or "AuthenticationError" in str(type(conn_error)):
-                    print(f"[{requestID}] Connection error, attempting to reconnect...")
-                    service = get_service()
-                    wav, sample_rate = service.speechSynthesis(text=content, audio_prompt_path=clone_path)
-                else:
-                    raise
-            
+    # No retry here: the model server already queues jobs for memory and
+    # splits ones that run out of it, so a failure is final.
+    print(f"[{requestID}] Generating TTS audio with voice: {voice}")
+    audio_bytes, sample_rate = await synthesize_reply(content, clone_path, requestID, priority)
+    print(f"[{requestID}] TTS generation completed. Audio bytes: {len(audio_bytes)}, Sample rate: {sample_rate}")
+    return audio_bytes, sample_rate
+    
+    
+async def prepare_tts_stream(text: str, requestID: str, system: Optional[str] = None, voice: Optional[str] = "alloy") -> Tuple[str, str]:
+    clone_path = resolve_voice_path(voice, requestID)
+    intention_detection = await getContentRefined(
+            f"This is the prompt and {text} ",
+            system
+        )
+    content = intention_detection.get("content")
+    print(f"[{requestID}] Intent: {intention_detection.get('intent')}, Streaming content: {content[:100]}...")
+    return content, clone_path
+
+def _next_stream_chunk(stream_id: str):
+    # A server-side job: the model server holds no thread while the chunk
+    # renders, and a dropped connection can still collect the result by polling.
+    job = service.submit("speechSynthesis_stream_next", stream_id)
+    try:
+        return job.result()
+    except ConnectionError:
+        if getattr(job, "job_id", None) is None:
+            raise
+    while True:
+        status = service.poll(job.job_id)
+        if status["status"] == "done":
+            return status.get("r")
+        if status["status"] != "pending":
+            raise RuntimeError(f"Stream chunk job {job.job_id} {status['status']}: {status.get('msg', '')}")
+        time.sleep(0.05)
+
+
+def stream_tts(content: str, clone_path: str, requestID: str, response_format: str = "wav", on_complete: Optional[Callable[[bytes, int], None]] = None) -> Iterator[bytes]:
+    """
+    Synthesize ``content`` chunk by chunk and yield audio as each chunk is ready.
+
+    ``wav`` yields a streaming WAV header followed by 16-bit PCM, ``pcm`` yields
+    raw 16-bit little-endian PCM. When the stream finishes, ``on_complete`` is
+    called with the full WAV file bytes and sample rate.
+    """
+    chunks = split_into_chunks(content, STREAM_CHUNK_MAX_CHARS, STREAM_CHUNK_MIN_CHARS)
+    if not chunks:
+        raise ValueError("Nothing to synthesize")
+    stream_id = service.speechSynthesis_stream_start(chunks, clone_path, requestID)
+    pcm_parts = []
+    sample_rate = None
+    completed = False
+    try:
+        while True:
+            result = _next_stream_chunk(stream_id)
+            if result is None:
+                break
+            wav, sr = result
             if wav is None:
                 raise RuntimeError("Audio generation failed - GPU out of memory or other error")
+            pcm = float_to_pcm16(wav)
+            if sample_rate is None:
+                sample_rate = sr
+                if response_format == "wav":
+                    yield build_wav_header(sample_rate)
+            pcm_parts.append(pcm)
+            yield pcm
+        completed = True
+    finally:
+        if not completed:
+            print(f"[{requestID}] Stream aborted, releasing remaining chunks")
+            service.speechSynthesis_stream_close(stream_id)
+
+    print(f"[{requestID}] Streamed {len(chunks)} chunk(s)")
+    if on_complete is not None and sample_rate is not None:
+        pcm_data = b"".join(pcm_parts)
+        on_complete(build_wav_header(sample_rate, data_size=len(pcm_data)) + pcm_data, sample_rate)
 
-            if isinstance(wav, torch.Tensor):
-                audio_tensor = wav
-            elif isinstance(wav, np.ndarray):
-                audio_tensor = torch.from_numpy(wav)
-            else:
-                audio_tensor = torch.from_numpy(np.array(wav))
-            
-            # Ensure 2D shape (channels, samples)
-            if audio_tensor.dim() == 1:
-                audio_tensor = audio_tensor.unsqueeze(0)  # Add channel dimension
-            elif audio_tensor.dim() > 2:
-                audio_tensor = audio_tensor.squeeze()  # Remove extra dimensions
-                if audio_tensor.dim() == 1:
-                    audio_tensor = audio_tensor.unsqueeze(0)
-            
-            buffer = io.BytesIO()
-            torchaudio.save(buffer, audio_tensor, sample_rate, format="wav")
-            audio_bytes = buffer.getvalue()
-            
-            print(f"[{requestID}] TTS generation completed. Audio bytes: {len(audio_bytes)}, Sample rate: {sample_rate}")
-            return audio_bytes, sample_rate
-            
-        except Exception as e:
-            print(f"[{requestID}] Error during TTS generation (attempt {attempt + 1}): {e}")
-            if attempt < max_retries - 1:
-                print(f"[{requestID}] Retrying...")
-                await asyncio.sleep(1)
-            else:
-                print(f"[{requestID}] Max retries exceeded")
-                raise e
-    
-    
 if __name__ == "__main__":
     async def main():
         text = "Verbatim: Scientific progress often arrives quietly, reshaping daily life not through spectacle but through accumulation—small, precise improvements that compound until the world behaves differently than it did before."
@@ -122,23 +222,12 @@ if __name__ == "__main__":
         system = None
         voice = "alloy"
         
-        def cleanup_cache():
-            while True:
-                try:
-                    service.cleanup_old_cache_files()
-                except Exception as e:
-                    print(f"Cleanup error: {e}")
-
-                time.sleep(600)
-
-        cleanup_thread = threading.Thread(target=cleanup_cache, daemon=True)
-        cleanup_thread.start()
         cache_name = service.cacheName(text)
         
         audio_bytes, audio_sample = await generate_tts(text, requestID, system, voice)
         audio_tensor = torch.from_numpy(np.frombuffer(audio_bytes, dtype=np.int16)).unsqueeze(0)
         torchaudio.save(f"{cache_name}.wav", audio_tensor, audio_sample)
-        torchaudio.save(f"genAudio/{cache_name}.wav", audio_tensor, audio_sample)
+        service.cache_store(cache_name, audio_bytes)
         print(f"Audio saved as {cache_name}.wav")
 
     asyncio.run(main())
\ No newline at end of file
@@ -6,6 +6,7 @@ import os
 from dotenv import load_dotenv
 import requests
 from config import POLLINATIONS_ENDPOINT_TEXT, POLLINATIONS_MODEL
+from metrics import LLM_CALLS, timed_pipeline
 import random
 import time
 
@@ -55,6 +56,7 @@ async def generate_reply(prompt: str, max_tokens: Optional[int] = 5000, timing_s
 
     try:
         response = requests.post(POLLINATIONS_ENDPOINT_TEXT, headers=header, json=payload, timeout=30)
+        LLM_CALLS.labels("ttt", "ok" if response.status_code == 200 else "error").inc()
         if response.status_code != 200:
             raise RuntimeError(f"Request failed: {response.status_code}, {response.text}")
 
@@ -74,6 +76,7 @@ async def generate_reply(prompt: str, max_tokens: Optional[int] = 5000, timing_s
             timing_stats.end_timer("TTT_API_CALL")
         return f"{prompt}"
 
+@timed_pipeline("ttt")
 async def generate_ttt(text: str, requestID:str, system: str = None):
     replyText = await generate_reply(f"Prompt: {text} & System: {system}", 300)
     print(f"The generated reply text is: {replyText}")
@@ -144,6 +144,34 @@ def convert_default_voices_to_wav_audio(audio_path: str) -> str:
         logger.debug(f"Saved {len(base64_data)} bytes WAV to {file_path}")
 
 
+def build_wav_header(sample_rate: int, num_channels: int = 1, bits_per_sample: int = 16, data_size: Optional[int] = None, audio_format: int = 1) -> bytes:
+    """WAV header (1 = PCM, 3 = IEEE float); without ``data_size`` the sizes are set to 0xFFFFFFFF for streaming."""
+    import struct
+    byte_rate = sample_rate * num_channels * bits_per_sample // 8
+    block_align = num_channels * bits_per_sample // 8
+    riff_size = 0xFFFFFFFF if data_size is None else 36 + data_size
+    data_size = 0xFFFFFFFF if data_size is None else data_size
+    return (
+        b"RIFF" + struct.pack("<I", riff_size) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, audio_format, num_channels, sample_rate, byte_rate, block_align, bits_per_sample)
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+def encode_wav(wav, sample_rate: int) -> bytes:
+    """32-bit float WAV bytes from a (samples,) or (channels, samples) array, as torchaudio.save writes for float tensors."""
+    samples = np.asarray(wav)
+    if samples.ndim > 2:
+        samples = samples.squeeze()
+    num_channels = 1 if samples.ndim == 1 else samples.shape[0]
+    if samples.ndim == 2:
+        samples = samples.T if num_channels > 1 else samples[0]
+    data = np.ascontiguousarray(samples, dtype="<f4").tobytes()
+    return build_wav_header(sample_rate, num_channels, 32, len(data), audio_format=3) + data
+
+def float_to_pcm16(wav) -> bytes:
+    samples = np.asarray(wav, dtype=np.float32).reshape(-1)
+    return (np.clip(samples, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+
 def encode_audio_base64(audio_path: str) -> str:
     def is_base64(s: str) -> bool:
         try:
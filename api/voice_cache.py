@@ -0,0 +1,96 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Tuple
+
+from loguru import logger
+
+from metrics import CACHE_HITS, CACHE_MISSES
+
+
+class VoiceConditioningCache:
+    """
+    Bounded LRU of speaker conditionals keyed by the SHA-256 of the reference
+    audio bytes, so the same clip uploaded under different paths shares one
+    entry. Concurrent misses on the same clip are single-flighted: the first
+    caller computes, the others wait on its result.
+    """
+
+    def __init__(self, max_entries: int):
+        self._max_entries = max(1, int(max_entries))
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def content_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        stat_key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._digests.get(stat_key)
+        if digest is not None:
+            return digest
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 16), b""):
+                hasher.update(block)
+        digest = hasher.hexdigest()
+        with self._lock:
+            if len(self._digests) >= self._max_entries * 8:
+                self._digests.clear()
+            self._digests[stat_key] = digest
+        return digest
+
+    def get(self, path: str, compute: Callable[[str], Any]) -> Any:
+        key = self.content_hash(path)
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                CACHE_HITS.labels("voice_conditionals").inc()
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                self.misses += 1
+                CACHE_MISSES.labels("voice_conditionals").inc()
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = compute(path)
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                logger.debug(f"Evicted voice conditionals {evicted[:12]}")
+            self._inflight.pop(key, None)
+        future.set_result(value)
+        return value
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self._max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+            }
@@ -8,8 +8,16 @@ fuser -k 7002/tcp 2>/dev/null || true
 sleep 2
 source venv/bin/activate
 sleep 2
+echo "Resetting metrics directory..."
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/lixaudio_metrics}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
 echo "Starting Model Server..."
-python api/model_server.py 2>&1 | tee model_server.log &
+if [ "${MODEL_REPLICAS:-1}" -gt 1 ]; then
+    python api/replica_pool.py --replicas "$MODEL_REPLICAS" 2>&1 | tee model_server.log &
+else
+    python api/model_server.py 2>&1 | tee model_server.log &
+fi
 MODEL_SERVER_PID=$!
 
 echo "Waiting for Model Server to be ready..."
@@ -19,7 +27,10 @@ timeout 300 bash -c 'while ! grep -q "\[SERVER_READY\]" model_server.log; do sle
     exit 1
 }
 
-echo "Model Server is ready! Starting FastAPI App..."
+echo "Model Server is ready! Starting cache pre-warming in background..."
+python api/prewarm.py 2>&1 | tee prewarm.log &
+
+echo "Starting FastAPI App..."
 python api/app.py
 
 wait $MODEL_SERVER_PID
\ No newline at end of file
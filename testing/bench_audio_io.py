@@ -0,0 +1,148 @@
+"""
+In-process WAV decode (api/audio_io.load_audio) versus the original pydub
+path (load_audio_ffmpeg): output equivalence and decode time.
+
+    python testing/bench_audio_io.py [--seconds 30] [--repeat 20]
+
+Test files are synthesized speech-band chirps in the common WAV layouts.
+Files whose rate is already 16 kHz must match pydub to within one 16-bit
+step. Resampled files are compared by SNR against pydub and against the
+chirp rendered directly at 16 kHz, since pydub's audioop.ratecv and soxr
+are different resamplers. Path inputs ending in .wav are read by pydub
+in-process; in-memory inputs (the shared-memory STT path) go through
+ffmpeg and are timed separately when ffmpeg is installed.
+"""
+import argparse
+import io
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+from audio_io import load_audio, load_audio_ffmpeg  # noqa: E402
+
+CASES = [
+    # (name, sample rate, channels, bits)
+    ("16k mono s16", 16000, 1, 16),
+    ("16k stereo s16", 16000, 2, 16),
+    ("16k mono u8", 16000, 1, 8),
+    ("16k mono s24", 16000, 1, 24),
+    ("16k mono s32", 16000, 1, 32),
+    ("24k mono s16", 24000, 1, 16),
+    ("44.1k stereo s16", 44100, 2, 16),
+    ("48k mono s16", 48000, 1, 16),
+]
+
+
+def synth(seconds: float, rate: int, channels: int) -> np.ndarray:
+    t = np.arange(int(seconds * rate)) / rate
+    chirp = 0.5 * np.sin(2 * np.pi * (150 + 1800 * t / seconds) * t)
+    return np.stack([chirp * (1 - 0.2 * c) for c in range(channels)], axis=1)
+
+
+def encode(signal: np.ndarray, rate: int, bits: int) -> bytes:
+    if bits == 8:
+        data = np.round(signal * 127 + 128).astype(np.uint8).tobytes()
+    elif bits == 24:
+        ints = np.round(signal * (2 ** 23 - 1)).astype(np.int32)
+        data = ints.astype("<i4").view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    else:
+        dtype = {16: "<i2", 32: "<i4"}[bits]
+        data = np.round(signal * (2 ** (bits - 1) - 1)).astype(dtype).tobytes()
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(signal.shape[1])
+        w.setsampwidth(bits // 8)
+        w.setframerate(rate)
+        w.writeframes(data)
+    return buf.getvalue()
+
+
+def encode_float(signal: np.ndarray, rate: int) -> bytes:
+    data = signal.astype("<f4").tobytes()
+    channels = signal.shape[1]
+    header = b"RIFF" + struct.pack("<I", 36 + len(data)) + b"WAVE"
+    header += b"fmt " + struct.pack("<IHHIIHH", 16, 3, channels, rate, rate * channels * 4, channels * 4, 32)
+    return header + b"data" + struct.pack("<I", len(data)) + data
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def snr_db(reference: np.ndarray, other: np.ndarray) -> float:
+    n = min(len(reference), len(other))
+    noise = np.sum((reference[:n] - other[:n]) ** 2)
+    return float("inf") if noise == 0 else 10 * np.log10(np.sum(reference[:n] ** 2) / noise)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'case':18s} {'pydub ms':>9s} {'fast ms':>8s} {'speedup':>8s}  equivalence")
+        for name, rate, channels, bits in CASES:
+            path = os.path.join(tmp, f"{name.replace(' ', '_')}.wav")
+            with open(path, "wb") as f:
+                f.write(encode(synth(args.seconds, rate, channels), rate, bits))
+
+            legacy = load_audio_ffmpeg(path)
+            fast = load_audio(path)
+            if rate == 16000:
+                max_diff = float(np.max(np.abs(legacy - fast))) if len(legacy) == len(fast) else float("inf")
+                ok = max_diff <= 1.0 / 32767 + 1e-6
+                verdict = f"max |diff| {max_diff:.2e}"
+            else:
+                truth = synth(args.seconds, 16000, channels).mean(axis=1)
+                fast_snr, legacy_snr = snr_db(truth, fast), snr_db(truth, legacy)
+                # Same length, and at least as close to the ideal signal as pydub (capped at 60 dB).
+                ok = abs(len(legacy) - len(fast)) <= 2 and fast_snr >= min(legacy_snr, 60.0) - 1.0
+                verdict = (
+                    f"SNR vs pydub {snr_db(legacy, fast):.1f} dB; vs ideal: fast {fast_snr:.1f} dB, "
+                    f"pydub {legacy_snr:.1f} dB"
+                )
+            failures += not ok
+
+            legacy_time = timed(lambda: load_audio_ffmpeg(path), args.repeat)
+            fast_time = timed(lambda: load_audio(path), args.repeat)
+            print(
+                f"{name:18s} {legacy_time * 1000:9.2f} {fast_time * 1000:8.2f} "
+                f"{legacy_time / fast_time:7.1f}x  {verdict} {'ok' if ok else 'MISMATCH'}"
+            )
+
+            if shutil.which("ffmpeg"):
+                with open(path, "rb") as f:
+                    data = f.read()
+                legacy_time = timed(lambda: load_audio_ffmpeg(io.BytesIO(data)), args.repeat)
+                fast_time = timed(lambda: load_audio(io.BytesIO(data)), args.repeat)
+                print(f"{'  in-memory':18s} {legacy_time * 1000:9.2f} {fast_time * 1000:8.2f} {legacy_time / fast_time:7.1f}x")
+
+        # Float WAV and in-memory input (the model server's shared-memory path).
+        signal = synth(args.seconds, 16000, 1)
+        decoded = load_audio(io.BytesIO(encode_float(signal, 16000)))
+        ok = np.allclose(decoded, signal[:, 0].astype(np.float32))
+        failures += not ok
+        print(f"{'16k mono f32 (mem)':18s} {'-':>9s} {timed(lambda: load_audio(io.BytesIO(encode_float(signal, 16000))), args.repeat) * 1000:8.2f} {'':>8s}  exact {'ok' if ok else 'MISMATCH'}")
+
+    if failures:
+        print(f"{failures} case(s) not equivalent")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+CPU inference under each engine profile (api/engine_profile.py): load time,
+real-time factor and memory for Chatterbox synthesis and Whisper
+transcription.
+
+    python testing/bench_engine_profile.py [--profiles default,cpu] [--repeat 3]
+
+Each profile runs in its own process with the GPU hidden, so thread settings
+and memory do not leak between runs. RTF is processing time divided by
+audio duration (lower is better). Resident memory after the engine is loaded
+(and quantized, for profiles that do) is what a profile saves; the peak is a
+high-water mark set while float weights load, so it is reported separately. Whisper transcribes the audio Chatterbox
+just produced, resampled to 16 kHz, so no decoder is needed.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SENTENCES = [
+    "The quick brown fox jumps over the lazy dog near the riverbank.",
+    "Please remember to bring your umbrella, the forecast says it will rain this afternoon.",
+    "Our meeting has been moved to Thursday at three, in the small conference room.",
+]
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb() -> float:
+    import psutil
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+def run_worker(profile: str, repeat: int, voice: str, whisper_size: str):
+    os.chdir(ROOT)
+    sys.path.insert(0, os.path.join(ROOT, "api"))
+    import numpy as np
+    import soxr
+    import torch
+    from chatterbox.tts_turbo import ChatterboxTurboTTS
+    from faster_whisper import WhisperModel
+    from engine_profile import apply_engine_profile, prepare_tts_engine, whisper_threads
+
+    plan = apply_engine_profile(profile)
+    result = {"profile": profile, "plan": plan._asdict() if plan else None}
+
+    start = time.perf_counter()
+    engine = prepare_tts_engine(ChatterboxTurboTTS.from_pretrained(device="cpu", cache_dir="model_cache"), profile)
+    result["tts_load_sec"] = time.perf_counter() - start
+    result["rss_after_tts_load_mb"] = current_rss_mb()
+    result["rss_peak_tts_load_mb"] = peak_rss_mb()
+
+    with torch.inference_mode():
+        engine.prepare_conditionals(voice)
+        engine.generate(text=SENTENCES[0])  # warm-up
+        elapsed = audio_sec = 0.0
+        clips = []
+        for _ in range(repeat):
+            for text in SENTENCES:
+                start = time.perf_counter()
+                wav = engine.generate(text=text, top_p=0.95, temperature=0.8, top_k=1000, repetition_penalty=1.2)
+                elapsed += time.perf_counter() - start
+                samples = wav.cpu().numpy().reshape(-1).astype(np.float32)
+                audio_sec += len(samples) / engine.sr
+                clips.append(soxr.resample(samples, engine.sr, 16000))
+    result["tts_rtf"] = elapsed / audio_sec
+    result["rss_after_tts_mb"] = current_rss_mb()
+
+    start = time.perf_counter()
+    model = WhisperModel(whisper_size, device="cpu", compute_type="int8_float32", download_root="model_cache", **whisper_threads(plan))
+    result["stt_load_sec"] = time.perf_counter() - start
+    list(model.transcribe(clips[0], beam_size=5, language="en", vad_filter=True)[0])  # warm-up; segments decode lazily
+    elapsed = audio_sec = 0.0
+    for samples in clips:
+        start = time.perf_counter()
+        segments, _ = model.transcribe(samples, beam_size=5, language="en", vad_filter=True)
+        "".join(segment.text for segment in segments)
+        elapsed += time.perf_counter() - start
+        audio_sec += len(samples) / 16000
+    result["stt_rtf"] = elapsed / audio_sec
+    result["rss_peak_mb"] = peak_rss_mb()
+    print(json.dumps(result), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", default="default,cpu")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--voice", default="voices_b64/raw_wav/alloy.wav")
+    parser.add_argument("--whisper-size", default="small")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.repeat, args.voice, args.whisper_size)
+        return
+
+    results = []
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES="")
+    for profile in args.profiles.split(","):
+        print(f"Running profile '{profile}'...", flush=True)
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", profile, "--repeat", str(args.repeat),
+             "--voice", args.voice, "--whisper-size", args.whisper_size],
+            env=env, capture_output=True, text=True,
+        )
+        if output.returncode != 0:
+            print(output.stderr[-2000:])
+            sys.exit(output.returncode)
+        results.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    print(
+        f"\n{'profile':8s} {'TTS load s':>10s} {'TTS RTF':>8s} {'STT load s':>10s} {'STT RTF':>8s} "
+        f"{'RSS loaded MB':>14s} {'load peak MB':>13s} {'run peak MB':>12s}"
+    )
+    for r in results:
+        print(
+            f"{r['profile']:8s} {r['tts_load_sec']:10.1f} {r['tts_rtf']:8.2f} {r['stt_load_sec']:10.1f} "
+            f"{r['stt_rtf']:8.3f} {r['rss_after_tts_load_mb']:14.0f} {r['rss_peak_tts_load_mb']:13.0f} {r['rss_peak_mb']:12.0f}"
+        )
+        if r["plan"]:
+            print(f"         threads: {r['plan']}")
+
+
+if __name__ == "__main__":
+    main()
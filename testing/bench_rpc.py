@@ -0,0 +1,128 @@
+"""
+Round-trip benchmark: multiprocessing BaseManager proxy (TCP + pickle) versus
+the Unix-domain-socket RPC layer in api/rpc.py.
+
+    python testing/bench_rpc.py [--calls 2000] [--threads 8]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Process
+from multiprocessing.managers import BaseManager
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "api"))
+from rpc import RPCClient, RPCServer  # noqa: E402
+
+AUDIO_SECONDS = 10
+SAMPLE_RATE = 24000
+
+
+class EchoService:
+    def __init__(self):
+        self._audio = np.random.uniform(-1, 1, (1, AUDIO_SECONDS * SAMPLE_RATE)).astype(np.float32)
+
+    def ping(self):
+        return 1
+
+    def audio(self):
+        return self._audio, SAMPLE_RATE
+
+
+class BenchManager(BaseManager):
+    pass
+
+
+def run_manager_server(port: int):
+    service = EchoService()
+    BenchManager.register("Service", callable=lambda: service)
+    manager = BenchManager(address=("localhost", port), authkey=b"bench")
+    manager.get_server().serve_forever()
+
+
+def run_rpc_server(path: str):
+    RPCServer(EchoService(), path, workers=32).serve_forever()
+
+
+def wait_for(check, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            return check()
+        except (ConnectionError, FileNotFoundError, OSError):
+            time.sleep(0.05)
+    raise RuntimeError("Benchmark server did not come up")
+
+
+def measure(label: str, call, calls: int, threads: int):
+    latencies = []
+    lock = threading.Lock()
+
+    def one(_):
+        start = time.perf_counter()
+        call()
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+
+    for _ in range(min(50, calls)):
+        call()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(calls)))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    print(
+        f"{label:<34} p50 {statistics.median(latencies) * 1e6:9.1f} us  "
+        f"p95 {latencies[int(len(latencies) * 0.95)] * 1e6:9.1f} us  "
+        f"throughput {calls / wall:9.1f} calls/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    port = 6100
+    path = os.path.join(tempfile.mkdtemp(), "bench.sock")
+    servers = [
+        Process(target=run_manager_server, args=(port,), daemon=True),
+        Process(target=run_rpc_server, args=(path,), daemon=True),
+    ]
+    for server in servers:
+        server.start()
+
+    try:
+        BenchManager.register("Service")
+
+        def connect_manager():
+            manager = BenchManager(address=("localhost", port), authkey=b"bench")
+            manager.connect()
+            return manager.Service()
+
+        proxy = wait_for(connect_manager)
+        client = RPCClient(path)
+        wait_for(lambda: client.call("ping"))
+
+        audio_calls = max(1, args.calls // 10)
+        print(f"{args.calls} small calls / {audio_calls} audio calls ({AUDIO_SECONDS}s float32), {args.threads} threads\n")
+        for threads in (1, args.threads):
+            measure(f"BaseManager ping (x{threads})", proxy.ping, args.calls, threads)
+            measure(f"UDS RPC ping (x{threads})", lambda: client.call("ping"), args.calls, threads)
+            measure(f"BaseManager audio (x{threads})", proxy.audio, audio_calls, threads)
+            measure(f"UDS RPC audio (x{threads})", lambda: client.call("audio"), audio_calls, threads)
+    finally:
+        for server in servers:
+            server.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Throughput of batched Whisper transcription (api/stt_batching.py) against the
+serial path, and agreement of the transcripts.
+
+    python testing/bench_stt_batch.py [--model small] [--batch-sizes 1,2,4,8,16] [--max-wer 0.05]
+
+Inputs are the reference clips in voices_b64/raw_wav; a batch of size n holds
+n clips, cycling through them. Exits non-zero when the mean word error rate
+of any batch against the serial transcripts exceeds --max-wer.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, os.path.join(ROOT, "api"))
+from faster_whisper import WhisperModel  # noqa: E402
+from faster_whisper.audio import decode_audio  # noqa: E402
+from stt_batching import BatchedTranscriber  # noqa: E402
+
+OPTIONS = dict(beam_size=5, language="en", task="transcribe")
+
+
+def words(text: str):
+    return "".join(c.lower() if c.isalnum() or c.isspace() else " " for c in text).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    ref, hyp = words(reference), words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1] / len(ref)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="small")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--compute-type", default="int8_float32")
+    parser.add_argument("--batch-sizes", default="1,2,4,8,16")
+    parser.add_argument("--chunk-batch-size", type=int, default=8)
+    parser.add_argument("--max-wer", type=float, default=0.05, help="Tolerated mean WER of batched vs serial transcripts")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(ROOT, "voices_b64", "raw_wav", "*.wav")))
+    clips = [decode_audio(path, sampling_rate=16000) for path in paths]
+    model = WhisperModel(args.model, device=args.device, compute_type=args.compute_type)
+    transcriber = BatchedTranscriber(model, args.chunk_batch_size)
+
+    # Serial reference, one clip at a time exactly as _transcribe_samples does it.
+    serial = {}
+    serial_time = 0.0
+    for path, samples in zip(paths, clips):
+        start = time.perf_counter()
+        segments, _ = model.transcribe(samples, vad_filter=True, **OPTIONS)
+        serial[path] = "".join(segment.text for segment in segments)
+        serial_time += time.perf_counter() - start
+    audio_seconds = sum(len(samples) for samples in clips) / 16000
+    print(f"{len(clips)} clips, {audio_seconds:.1f}s of audio, model={args.model}")
+    print(f"serial       : {audio_seconds / serial_time:6.2f}x realtime ({serial_time:.2f}s)")
+
+    worst = 0.0
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        indices = [i % len(clips) for i in range(batch_size)]
+        batch = [clips[i] for i in indices]
+        transcriber.transcribe(batch[:1], **OPTIONS)  # warm-up
+        start = time.perf_counter()
+        texts = transcriber.transcribe(batch, **OPTIONS)
+        elapsed = time.perf_counter() - start
+        seconds = sum(len(samples) for samples in batch) / 16000
+        wer = np.mean([word_error_rate(serial[paths[i]], text) for i, text in zip(indices, texts)])
+        worst = max(worst, wer)
+        print(
+            f"batch {batch_size:3d}    : {seconds / elapsed:6.2f}x realtime "
+            f"({batch_size / elapsed:5.2f} req/s), WER vs serial {wer:.3f}"
+        )
+    if worst > args.max_wer:
+        print(f"FAIL: WER vs serial {worst:.3f} exceeds the tolerance of {args.max_wer:.3f}")
+        sys.exit(1)
+    print(f"OK: WER vs serial within {args.max_wer:.3f}")
+
+
+if __name__ == "__main__":
+    main()